@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -73,6 +75,104 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "mysite.wsgi.application"
 
+# serve the async views, asgi.py turns this on
+ASYNC_VIEWS = os.environ.get("SHOPPING_ASYNC_VIEWS", "0") == "1"
+
+# per visitor search state, bounded per session and in total
+SHOPPING_SESSION_BUDGET_BYTES = 64 * 1024**2
+SHOPPING_SESSIONS_TOTAL_BYTES = 1024**3
+SHOPPING_SESSION_IDLE_SECONDS = 30 * 60
+# sqlite database the worker processes share session state through, it's opened
+# on first use. unset keeps state in process, which is all a single worker
+# needs, so set it when running more than one, e.g. to BASE_DIR / "state.sqlite3"
+SHOPPING_STATE_DB = os.environ.get("SHOPPING_STATE_DB", "")
+
+# how deep each store's results can be paged
+SHOPPING_MAX_ITEMS = int(os.environ.get("SHOPPING_MAX_ITEMS", 1000))
+# store api urls to use instead of the real ones, e.g. '{"asda": "http://..."}',
+# the load test points these at its stand-in stores
+SHOPPING_STORE_URLS = json.loads(os.environ.get("SHOPPING_STORE_URLS", "{}"))
+# worker processes to parse big pages of results on, 0 parses in the request's
+# thread. pages smaller than SHOPPING_PARSE_MIN_ITEMS are always parsed there.
+# the crawl command gathers its pages into batches of that many for the pool
+SHOPPING_PARSE_WORKERS = int(os.environ.get("SHOPPING_PARSE_WORKERS", 0))
+SHOPPING_PARSE_MIN_ITEMS = 2000
+# upsert every searched item into the local catalog, see shopping/catalog.py
+SHOPPING_CATALOG_INGEST = os.environ.get("SHOPPING_CATALOG_INGEST", "0") == "1"
+# where searches are answered from. "live" asks the stores, "fallback" asks the
+# stores and answers any that fail from the catalog, "catalog" answers from the
+# catalog's full text index. with SHOPPING_CATALOG_REFRESH a "catalog" search
+# also asks the store in the background, to keep the catalog fresh
+SHOPPING_SEARCH_BACKEND = os.environ.get("SHOPPING_SEARCH_BACKEND", "live")
+SHOPPING_CATALOG_REFRESH = os.environ.get("SHOPPING_CATALOG_REFRESH", "0") == "1"
+
+# the crawl command's queries, its requests per store per round, and how long
+# before a query crawled to the end is crawled again
+SHOPPING_CRAWL_QUERIES = [
+    "milk",
+    "bread",
+    "cheese",
+    "butter",
+    "eggs",
+    "pasta",
+    "rice",
+    "chicken",
+    "beef",
+    "fish",
+    "fruit",
+    "vegetables",
+    "juice",
+    "water",
+    "coffee",
+    "tea",
+    "cereal",
+    "yoghurt",
+    "chocolate",
+    "crisps",
+]
+SHOPPING_CRAWL_BUDGET = 200
+SHOPPING_CRAWL_INTERVAL = 24 * 3600
+
+# each store's delivery charge, minimum order and the spend delivery is free
+# from, in gbp, for the basket optimizer. stores not here aren't used
+SHOPPING_STORE_TERMS = {
+    "asda": {"delivery": 4.50, "minimum": 40.0, "free_over": None},
+    "waitrose": {"delivery": 5.00, "minimum": 40.0, "free_over": 100.0},
+}
+
+# the most terms a list comparison takes, and how long a term's matches at a
+# store are reused for, in seconds, before the store is asked again
+SHOPPING_LIST_MAX_TERMS = 100
+SHOPPING_LIST_CACHE_SECONDS = 15 * 60
+SHOPPING_LIST_CACHE_ENTRIES = 4096
+
+# every ingested price goes into the price history here too, see
+# utils.pricehistory. empty to not keep one
+SHOPPING_PRICE_HISTORY_DIR = os.environ.get(
+    "SHOPPING_PRICE_HISTORY_DIR", BASE_DIR / "pricehistory"
+)
+# the load test runs servers with file sessions, which need no database
+SESSION_ENGINE = os.environ.get(
+    "SHOPPING_SESSION_ENGINE", "django.contrib.sessions.backends.db"
+)
+
+# log levels and sample rates (0-1, below WARNING only) by subsystem, e.g.
+# {"plugins.waitrose": "DEBUG"} and {"plugins": 0.01}. see utils/log.py
+SHOPPING_LOG_LEVEL = os.environ.get("SHOPPING_LOG_LEVEL", "WARNING")
+SHOPPING_LOG_LEVELS = {}
+SHOPPING_LOG_SAMPLE_RATES = {}
+
+# chrome trace of a request's stages, recorded when it has the header or for this
+# fraction of requests, written to SHOPPING_TRACE_DIR
+SHOPPING_TRACE_HEADER = "X-Shopping-Trace"
+SHOPPING_TRACE_SAMPLE_RATE = 0.0
+SHOPPING_TRACE_DIR = BASE_DIR / "traces"
+
+# with DEBUG on, ?profile (cProfile) or ?profile=flame (collapsed stacks) or the
+# header profiles that request into SHOPPING_PROFILE_DIR, listed at /profiles/
+SHOPPING_PROFILE_HEADER = "X-Shopping-Profile"
+SHOPPING_PROFILE_DIR = BASE_DIR / "profiles"
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
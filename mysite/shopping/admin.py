@@ -1,3 +1,29 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Product, Watch, WatchAlert
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = [
+        "store",
+        "product_id",
+        "description",
+        "price",
+        "unit_price",
+        "last_seen",
+    ]
+    list_filter = ["store", "unit_type"]
+    search_fields = ["description", "product_id"]
+
+
+@admin.register(Watch)
+class WatchAdmin(admin.ModelAdmin):
+    list_display = ["name", "stores", "active", "updated_at"]
+    list_filter = ["active"]
+
+
+@admin.register(WatchAlert)
+class WatchAlertAdmin(admin.ModelAdmin):
+    list_display = ["watch", "product", "price", "unit_price", "created_at"]
+    list_filter = ["watch"]
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class ShoppingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shopping'
+
+    def ready(self):
+        from django.conf import settings
+
+        import utils.log
+
+        utils.log.configure(
+            levels=settings.SHOPPING_LOG_LEVELS,
+            sample_rates=settings.SHOPPING_LOG_SAMPLE_RATES,
+            default_level=settings.SHOPPING_LOG_LEVEL,
+        )
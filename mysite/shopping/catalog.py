@@ -0,0 +1,347 @@
+"""the local product catalog. searched items are upserted into it in big
+batches, and filters and sorts are done on it in indexed sql rather than in
+python over the scraped lists"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import re
+import threading
+from itertools import islice
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from utils.barcodes import BarcodeIndex, Comparison, gtins
+from utils.main import Currency, Item, ItemListFilter, SearchResult, Store
+from utils.pricehistory import PriceHistory
+from utils.search import Sorter, SorterEnum
+
+from . import watches
+from .models import Barcode, PriceObservation, Product
+
+# rows per executemany
+BATCH_SIZE = 5000
+
+# the Product columns an upsert overwrites
+UPDATE_FIELDS = [
+    "description",
+    "thumbnail",
+    "price",
+    "unit_price",
+    "quantity_amount",
+    "quantity_unit",
+    "si_quantity",
+    "unit_type",
+    "quantity_debug",
+    "content_hash",
+    "last_seen",
+]
+COLUMNS = ["store", "product_id", *UPDATE_FIELDS]
+HASH_COLUMN = COLUMNS.index("content_hash")
+
+# the fts5 index of descriptions, made in the 0002 migration
+FTS_TABLE = "shopping_product_fts"
+_WORDS = re.compile(r"\w+")
+
+# the same orders as Sorter.get_sorted_list, ties are left in the order
+# the products were first seen
+ORDERINGS = {
+    SorterEnum.LOWEST_PRICE: ["price", "id"],
+    SorterEnum.HIGHEST_PRICE: ["-price", "id"],
+    SorterEnum.LOWEST_UNIT_PRICE: ["unit_price", "id"],
+    SorterEnum.HIGHEST_UNIT_PRICE: ["-unit_price", "id"],
+    SorterEnum.LOWEST_QUANTITY: ["si_quantity", "unit_type", "id"],
+    SorterEnum.HIGHEST_QUANTITY: ["-si_quantity", "unit_type", "id"],
+}
+
+
+def _to_gbp(amount: float, currency: Currency) -> float:
+    return amount * Currency.exchange_rate(currency, Currency.GBP)
+
+
+def content_hash(item: Item) -> str:
+    """changes when the price, size or description does, and nothing else"""
+    quantity = item.quantity
+    key = "\x1f".join(
+        map(
+            str,
+            (
+                item.description,
+                item.price.amount,
+                item.price.curr.value,
+                quantity.amount,
+                quantity.unit.name,
+            ),
+        )
+    )
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def _row(item: Item, seen: str) -> tuple:
+    # in the order of COLUMNS
+    quantity = item.quantity
+    return (
+        item.store.value,
+        item.product_id,
+        item.description,
+        item.thumbnail,
+        _to_gbp(item.price.amount, item.price.curr),
+        _to_gbp(Sorter._item_unit_price_amount(item), item.price.curr),
+        quantity.amount,
+        quantity.unit.name,
+        quantity.to_si().amount,
+        quantity.unit.unit_type.value,
+        getattr(quantity, "debug", ""),
+        content_hash(item),
+        seen,
+    )
+
+
+def _upsert_sql() -> str:
+    qn = connection.ops.quote_name
+    columns = [Product._meta.get_field(name).column for name in COLUMNS]
+    updates = [Product._meta.get_field(name).column for name in UPDATE_FIELDS]
+    return (
+        f"INSERT INTO {qn(Product._meta.db_table)} ({', '.join(map(qn, columns))}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({qn('store')}, {qn('product_id')}) DO UPDATE SET "
+        + ", ".join(f"{qn(c)} = excluded.{qn(c)}" for c in updates)
+    )
+
+
+def _observe_sql() -> str:
+    # copies the price just upserted, looked up on the unique index
+    qn = connection.ops.quote_name
+    return (
+        f"INSERT INTO {qn(PriceObservation._meta.db_table)} "
+        f"({qn('product_id')}, {qn('price')}, {qn('unit_price')}, {qn('observed_at')}) "
+        f"SELECT {qn('id')}, {qn('price')}, {qn('unit_price')}, {qn('last_seen')} "
+        f"FROM {qn(Product._meta.db_table)} "
+        f"WHERE {qn('store')} = %s AND {qn('product_id')} = %s"
+    )
+
+
+def _barcode_sql() -> str:
+    # links a gtin to the product just upserted, if it isn't already
+    qn = connection.ops.quote_name
+    return (
+        f"INSERT INTO {qn(Barcode._meta.db_table)} ({qn('gtin')}, {qn('product_id')}) "
+        f"SELECT %s, {qn('id')} FROM {qn(Product._meta.db_table)} "
+        f"WHERE {qn('store')} = %s AND {qn('product_id')} = %s "
+        f"ON CONFLICT DO NOTHING"
+    )
+
+
+def _batches(items: Iterable[Item], size: int):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+_price_histories: dict[str, PriceHistory] = {}
+_price_histories_lock = threading.Lock()
+
+
+def price_history() -> PriceHistory | None:
+    """the PriceHistory in SHOPPING_PRICE_HISTORY_DIR, None if it's not set"""
+    root = settings.SHOPPING_PRICE_HISTORY_DIR
+    if not root:
+        return None
+    with _price_histories_lock:
+        if str(root) not in _price_histories:
+            _price_histories[str(root)] = PriceHistory(root)
+        return _price_histories[str(root)]
+
+
+def _stored_hashes(rows: list[tuple]) -> dict[tuple[str, str], str]:
+    # (store, product_id) -> content_hash of those rows already in the catalog
+    by_store: dict[str, list[str]] = {}
+    for row in rows:
+        by_store.setdefault(row[0], []).append(row[1])
+
+    hashes = {}
+    for store, product_ids in by_store.items():
+        for i in range(0, len(product_ids), 500):
+            found = Product.objects.filter(
+                store=store, product_id__in=product_ids[i : i + 500]
+            ).values_list("product_id", "content_hash")
+            hashes.update(((store, product_id), h) for product_id, h in found)
+    return hashes
+
+
+def ingest(
+    items: Iterable[Item],
+    seen: datetime.datetime = None,
+    batch_size: int = BATCH_SIZE,
+    only_changed: bool = False,
+) -> int:
+    """upserts items into the catalog and records a price observation for each,
+    all in one transaction. items without a product id are skipped, and with
+    only_changed so are the ones whose content_hash hasn't changed. returns how
+    many were written. every item's price goes in the price_history though,
+    and the ones whose content_hash changed are checked against the watches.
+
+    it's plain executemany rather than bulk_create, the orm spent ~300us an item
+    building statements of at most 999 parameters"""
+    seen = seen or timezone.now()
+    history, index = price_history(), watches.active_index()
+    when, stamp = seen.timestamp(), connection.ops.adapt_datetimefield_value(seen)
+    upsert, observe, link = _upsert_sql(), _observe_sql(), _barcode_sql()
+    n = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        usable = (i for i in items if i.product_id and not i.is_null)
+        for batch in _batches(usable, batch_size):
+            if history is not None:
+                history.record(batch, when)
+            # a product twice in one batch is upserted and observed once, as last seen
+            latest = {(i.store.value, i.product_id): i for i in batch}
+            rows = [_row(item, stamp) for item in latest.values()]
+            changed = rows
+            if only_changed or index is not None:
+                stored = _stored_hashes(rows)
+                changed = [r for r in rows if stored.get(r[:2]) != r[HASH_COLUMN]]
+            if only_changed:
+                rows = changed
+            cursor.executemany(upsert, rows)
+            cursor.executemany(observe, [row[:2] for row in rows])
+            # every product's, barcodes aren't in the hash so an unchanged
+            # product can still have new ones
+            cursor.executemany(
+                link,
+                [(gtin, *key) for key, item in latest.items() for gtin in gtins(item)],
+            )
+            n += len(rows)
+            if index is not None:
+                watches.alert(index, [latest[row[:2]] for row in changed], seen)
+    return n
+
+
+def products(
+    item_list_filter: ItemListFilter, stores: Iterable[Store] = None
+) -> QuerySet[Product]:
+    """the products passing item_list_filter's enabled filters, in its sorter's
+    order. the same tests as the Filter classes, except the unit price filter
+    really is on unit price, and the description one ignores case"""
+    query = Product.objects.all()
+    if stores is not None:
+        query = query.filter(store__in=[store.value for store in stores])
+
+    f = item_list_filter.filters
+    if f.price_filter.is_enabled:
+        low, high = f.price_filter.price_low, f.price_filter.price_high
+        query = query.filter(
+            price__gt=_to_gbp(low.amount, low.curr),
+            price__lt=_to_gbp(high.amount, high.curr),
+        )
+    if f.unit_price_filter.is_enabled:
+        low, high = f.unit_price_filter.price_low, f.unit_price_filter.price_high
+        query = query.filter(
+            unit_price__gt=_to_gbp(low.amount, low.curr),
+            unit_price__lt=_to_gbp(high.amount, high.curr),
+        )
+    if f.quantity_filter.is_enabled:
+        q = f.quantity_filter
+        query = query.filter(
+            unit_type=q.base_unit.unit_type.value,
+            si_quantity__gte=q.qty_low.to_si().amount,
+            si_quantity__lte=q.qty_high.to_si().amount,
+        )
+    if f.unit_type_filter.is_enabled:
+        query = query.filter(
+            unit_type__in=[t.value for t in f.unit_type_filter.unit_type_accept_list]
+        )
+    if f.description_filter.is_enabled:
+        query = query.filter(description__contains=f.description_filter.description)
+
+    sorter = item_list_filter.sorter
+    return query.order_by(*ORDERINGS.get(sorter and sorter.sorter_type, ["id"]))
+
+
+def _result(products: QuerySet[Product], item_list_filter: ItemListFilter):
+    # already filtered and sorted, so a later filter_and_sort can only narrow it
+    result = SearchResult([product.to_item() for product in products])
+    sorter = item_list_filter.sorter
+    result._sorted_by = sorter.sorter_type if sorter else None
+    return result
+
+
+def search(
+    item_list_filter: ItemListFilter,
+    stores: Iterable[Store] = None,
+    limit: int = None,
+) -> SearchResult:
+    """products(...) as a SearchResult"""
+    return _result(products(item_list_filter, stores)[:limit], item_list_filter)
+
+
+def match_expression(query: str) -> str:
+    """a visitor's query as an fts5 match, every word has to be in the
+    description and the last one can be the start of a word. the words are
+    quoted so nothing in them is taken as query syntax"""
+    words = _WORDS.findall(query.lower())
+    if not words:
+        return ""
+    return " ".join([*(f'"{w}"' for w in words[:-1]), f'"{words[-1]}"*'])
+
+
+def text_search(
+    query: str,
+    item_list_filter: ItemListFilter,
+    stores: Iterable[Store] = None,
+    limit: int = None,
+) -> SearchResult:
+    """the products whose descriptions match query, with item_list_filter's
+    filters as sql predicates. best match first by bm25, unless there's a
+    sorter. answered from the fts index, no store is asked"""
+    match = match_expression(query)
+    if not match:
+        return SearchResult([])
+
+    query_set = products(item_list_filter, stores)
+    if connection.vendor == "sqlite":
+        table = Product._meta.db_table
+        query_set = query_set.extra(
+            select={"rank": f"bm25({FTS_TABLE})"},
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+        )
+        relevance = ["rank", "id"]
+    else:
+        # no fts index, see the 0002 migration
+        for word in _WORDS.findall(query):
+            query_set = query_set.filter(description__icontains=word)
+        relevance = ["id"]
+
+    if item_list_filter.sorter is None:
+        query_set = query_set.order_by(*relevance)
+    return _result(query_set[:limit], item_list_filter)
+
+
+def barcode_index(gtin_list: Iterable[str]) -> BarcodeIndex:
+    """a BarcodeIndex of the catalog's products with any of the gtins"""
+    gtin_list = list(gtin_list)
+    index = BarcodeIndex()
+    for i in range(0, len(gtin_list), 500):
+        barcodes = Barcode.objects.filter(gtin__in=gtin_list[i : i + 500])
+        for barcode in barcodes.select_related("product"):
+            item = barcode.product.to_item()
+            item.barcodes = (barcode.gtin,)
+            index.add(item)
+    return index
+
+
+def compare(items: list[Item]) -> list[Comparison]:
+    """the items which the catalog has at another store too, by barcode, each
+    side by side with the others. a hash join, the catalog's products with
+    the items' barcodes are looked up in one go and each item probes them"""
+    index = barcode_index({gtin for item in items for gtin in gtins(item)})
+    # the items just searched are fresher than the catalog's copies of them
+    for item in items:
+        index.add(item)
+    return index.join(items)
@@ -0,0 +1,148 @@
+"""keeps the catalog current by walking each store's results for a list of
+queries through the plugins. only products whose price, size or description
+changed are written, and each store gets a budget of requests per round. where
+a query got to is saved after every write, so the next round picks up there.
+with a ParsePool pages are gathered into batches of parse_min_items and each
+batch is parsed across the pool's processes"""
+
+from __future__ import annotations
+
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.db import connections
+from django.utils import timezone
+
+from utils import plugins
+from utils.log import get_logger
+from utils.main import Store
+from utils.parsing import ParsePool
+
+from . import catalog
+from .models import CrawlCursor
+
+logger = get_logger("crawler")
+
+# stores are fetched side by side but written one at a time, sqlite has one
+# writer and ingest's read-then-write transactions would deadlock each other
+_WRITE_LOCK = threading.Lock()
+
+
+@dataclass
+class CrawlStats:
+    store: str
+    requests: int = 0
+    items: int = 0
+    # written to the catalog, the rest were unchanged
+    changed: int = 0
+    finished_queries: int = 0
+    # the budget ran out before every query was crawled
+    out_of_budget: bool = False
+    error: str = None
+
+
+def _due(cursor: CrawlCursor, now: datetime.datetime, interval: float) -> bool:
+    if cursor.finished_at is None:
+        return True
+    return (now - cursor.finished_at).total_seconds() >= interval
+
+
+def crawl_store(
+    store: Store,
+    queries: list[str],
+    budget: int,
+    page_size: int = 128,
+    max_items: int = 10_000,
+    interval: float = 24 * 3600,
+    parse_pool: ParsePool = None,
+    parse_min_items: int = 2000,
+) -> CrawlStats:
+    """crawls store's results for each query that's due, until budget requests
+    have been made"""
+    stats = CrawlStats(store=store.value)
+    plugin = plugins.get(store)
+    # raw items fetched but not yet written, the saved offset stays behind them
+    pending: list = []
+
+    def write(saved: CrawlCursor, cursor):
+        # the pending items, then where the cursor has got to
+        if parse_pool is not None and len(pending) >= parse_min_items:
+            items = parse_pool.parse(store, pending)
+        else:
+            items = [plugin.item_class(raw_item) for raw_item in pending]
+        pending.clear()
+        saved.offset, saved.total_items = cursor.offset, cursor.total_items
+        with _WRITE_LOCK:
+            if items:
+                stats.changed += catalog.ingest(items, only_changed=True)
+            saved.save()
+
+    for query in queries:
+        saved, _ = CrawlCursor.objects.get_or_create(store=store.value, query=query)
+        if not _due(saved, timezone.now(), interval):
+            continue
+        if saved.finished_at is not None:
+            # crawled before, start again from the top
+            saved.offset, saved.total_items, saved.finished_at = 0, None, None
+
+        request = plugin.search_request_class(query, max_items=max_items, lazy=True)
+        cursor = request.cursor(page_size=page_size)
+        cursor.offset, cursor.total_items = saved.offset, saved.total_items
+
+        while cursor.has_more:
+            if stats.requests >= budget:
+                stats.out_of_budget = True
+                write(saved, cursor)
+                return stats
+            try:
+                raw_items = cursor.fetch_next()
+            except Exception as e:
+                # stop this store for now, it's picked up from here next time
+                logger.warning(
+                    "crawl failed",
+                    extra={"store": store.value, "query": query},
+                    exc_info=e,
+                )
+                stats.error = repr(e)
+                write(saved, cursor)
+                return stats
+            stats.requests += 1
+            stats.items += len(raw_items)
+
+            pending += raw_items
+            if parse_pool is None or len(pending) >= parse_min_items:
+                write(saved, cursor)
+
+        saved.finished_at = timezone.now()
+        write(saved, cursor)
+        stats.finished_queries += 1
+    return stats
+
+
+def _crawl_store_in_thread(*args, **kwargs) -> CrawlStats:
+    # each thread has its own database connection, closed when it's done
+    try:
+        return crawl_store(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def crawl(
+    stores: list[Store],
+    queries: list[str],
+    budget: int,
+    parallel: bool = True,
+    **kwargs,
+) -> list[CrawlStats]:
+    """one round of crawl_store for each store. the stores are separate
+    upstreams so with parallel they're crawled side by side"""
+    if not parallel:
+        return [crawl_store(store, queries, budget, **kwargs) for store in stores]
+    with ThreadPoolExecutor(len(stores), thread_name_prefix="crawl") as executor:
+        futures = [
+            executor.submit(_crawl_store_in_thread, store, queries, budget, **kwargs)
+            for store in stores
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,159 @@
+"""shopping lists into baskets, see utils.basket. a line of a list is either a
+search term, answered from the catalog at each store, or an item already in a
+cart, which is matched to the same product at the other stores by barcode or
+match group. the same best matches, as a table of every term at every store,
+are what compare_list answers with"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+
+from utils.basket import Line, StoreTerms
+from utils.main import Currency, Item, ItemListFilter, Store
+from utils.search import Sorter
+
+from . import catalog
+from .models import Product, ProductMatch
+
+# "2 x milk", "2 milk" or just "milk"
+_LINE = re.compile(r"^(?:(\d+)\s*x?\s+)?(.+)$")
+# how many of a term's best matches at a store are compared on unit price
+CANDIDATES = 10
+# what's given of each item in compare_list's table
+FIELDS = ["product_id", "description", "price", "unit_price", "per"]
+
+
+def store_terms() -> dict[Store, StoreTerms]:
+    """the stores' delivery charges and minimum orders, from settings"""
+    stores = {store.value: store for store in Store}
+    return {
+        stores[value]: StoreTerms(**terms)
+        for value, terms in settings.SHOPPING_STORE_TERMS.items()
+        if value in stores
+    }
+
+
+def parse(text: str) -> list[tuple[str, int]]:
+    """(term, pcs) for each non-blank line of text"""
+    parsed = []
+    for line in text.splitlines():
+        match = _LINE.match(line.strip())
+        if match is None:
+            continue
+        pcs, term = match.groups()
+        parsed.append((term, max(int(pcs or 1), 1)))
+    return parsed
+
+
+def best(items: list[Item]) -> Item | None:
+    """the best unit price of items"""
+    return min(items, key=Sorter._item_unit_price_amount, default=None)
+
+
+def cell(item: Item | None) -> list | None:
+    """item as a row of FIELDS, prices in gbp"""
+    if item is None:
+        return None
+    unit_price = item.unit_price.convert_to(Currency.GBP)
+    return [
+        item.product_id,
+        item.description,
+        round(item.price.convert_to(Currency.GBP).amount, 2),
+        round(unit_price.amount, 2),
+        str(unit_price.per_unit),
+    ]
+
+
+class ResultCache:
+    """(store, term) -> the term's best matches at the store, kept for
+    max_age seconds. past max_entries the least recently used go first"""
+
+    def __init__(self, max_age: float, max_entries: int):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[float, list[Item]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(store: Store, term: str) -> tuple:
+        # "Milk " and "milk" are one search
+        return (store, " ".join(term.lower().split()))
+
+    def get(self, store: Store, term: str) -> list[Item] | None:
+        key = self._key(store, term)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            added, items = entry
+            if time.monotonic() - added > self.max_age:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return items
+
+    def put(self, store: Store, term: str, items: list[Item]):
+        key = self._key(store, term)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), items)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+RESULTS = ResultCache(
+    settings.SHOPPING_LIST_CACHE_SECONDS, settings.SHOPPING_LIST_CACHE_ENTRIES
+)
+
+
+def term_line(term: str, pcs: int, stores: list[Store]) -> Line:
+    """term at each of stores, the best unit price of its best matches"""
+    items = {}
+    for store in stores:
+        result = catalog.text_search(
+            term, ItemListFilter(), stores=[store], limit=CANDIDATES
+        )
+        if result.initial_list:
+            items[store] = best(result.initial_list)
+    return Line(term, pcs, items)
+
+
+def item_line(item: Item, pcs: int) -> Line:
+    """item, and the cheapest of the same product at each other store"""
+    items = {item.store: item}
+    product = Product.objects.filter(
+        store=item.store.value, product_id=item.product_id
+    ).first()
+    if product is None:
+        return Line(item.description, pcs, items)
+
+    same = Q(barcodes__gtin__in=product.barcodes.values("gtin"))
+    group = (
+        ProductMatch.objects.filter(product=product)
+        .values_list("group", flat=True)
+        .first()
+    )
+    if group is not None:
+        same |= Q(match__group=group)
+    others = (
+        Product.objects.filter(same)
+        .exclude(store=item.store.value)
+        .order_by("price")
+        .distinct()
+    )
+    for other in others:
+        items.setdefault(Store(other.store), other.to_item())
+    return Line(item.description, pcs, items)
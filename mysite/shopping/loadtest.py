@@ -0,0 +1,375 @@
+"""load test harness, drives the site with a mix of searches, sort and filter
+clicks and cart changes from a number of simulated users, against stand-in
+store apis. see the loadtest management command"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import re
+import resource
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from utils.benchmarks.catalog import catalog
+
+SEARCH_TERMS = ["milk", "bread", "cheese", "pasta", "rice", "juice", "chicken", "eggs"]
+SORTS = [
+    "lowest_price",
+    "highest_price",
+    "lowest_unit_price",
+    "highest_unit_price",
+    "lowest_quantity",
+    "highest_quantity",
+]
+UNIT_TYPES = ["weight", "volume", "other"]
+
+# action -> relative frequency
+DEFAULT_MIX = {
+    "search": 30,
+    "sort": 20,
+    "filter": 15,
+    "add": 15,
+    "remove": 10,
+    "load_more": 10,
+}
+
+_ADD_RE = re.compile(r'name="add_to_cart"\s+value="([^"]+)"')
+_REMOVE_RE = re.compile(r'name="remove_from_cart"\s+value="([^"]+)"')
+
+
+class StubStores:
+    """stand-in waitrose and asda apis on a local port, answering every search
+    with pages of the same synthetic catalog after latency seconds or so"""
+
+    def __init__(self, n_items: int = 2000, latency: float = 0.05, port: int = 0):
+        self.latency = latency
+        self.catalogs = {
+            "waitrose": catalog("waitrose", n_items),
+            "asda": catalog("asda", n_items),
+        }
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def urls(self) -> dict[str, str]:
+        host, port = self.server.server_address[:2]
+        return {store: f"http://{host}:{port}/{store}" for store in self.catalogs}
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def page(self, store: str, payload: dict) -> dict:
+        items = self.catalogs[store]
+        if store == "waitrose":
+            params = payload["customerSearchRequest"]["queryParams"]
+            start = params["start"] - 1
+            page = items[start : start + params["size"]]
+            return {"componentsAndProducts": page, "totalMatches": len(items)}
+
+        variables = payload["variables"]
+        size = variables["page_size"] or len(items)
+        start = (variables["page"] - 1) * size
+        configs = {
+            "products": {"items": items[start : start + size]},
+            "total_records": len(items),
+        }
+        return {"data": {"tempo_cms_content": {"zones": [{}, {"configs": configs}]}}}
+
+    def _handler(self):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                store = self.path.strip("/").split("?")[0]
+                payload = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                time.sleep(stubs.latency * random.uniform(0.5, 1.5))
+                body = json.dumps(stubs.page(store, payload)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class ClientDriver:
+    # the django test client, the app runs in this process
+    def __init__(self):
+        from django.test import Client
+
+        self.client = Client()
+
+    def get(self, params: dict) -> tuple[int, str]:
+        response = self.client.get("/", params)
+        return response.status_code, response.content.decode()
+
+    def post(self, data: dict) -> tuple[int, str]:
+        response = self.client.post("/", data)
+        return response.status_code, response.content.decode()
+
+
+class HttpDriver:
+    # a real server, over http
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.http = requests.Session()
+
+    def get(self, params: dict) -> tuple[int, str]:
+        response = self.http.get(self.base_url, params=params)
+        return response.status_code, response.text
+
+    def post(self, data: dict) -> tuple[int, str]:
+        token = self.http.cookies.get("csrftoken", "")
+        response = self.http.post(
+            self.base_url,
+            data={**data, "csrfmiddlewaretoken": token},
+            headers={"Referer": self.base_url},
+        )
+        return response.status_code, response.text
+
+
+class VirtualUser:
+    """clicks around like a visitor would, choosing each action from mix"""
+
+    def __init__(self, driver, mix: dict[str, int], seed: int):
+        self.driver = driver
+        self.mix = mix
+        self.random = random.Random(seed)
+        self.add_values: list[str] = []
+        self.remove_values: list[str] = []
+
+    def _seen(self, html: str):
+        self.add_values = _ADD_RE.findall(html) or self.add_values
+        self.remove_values = _REMOVE_RE.findall(html)
+
+    def step(self) -> tuple[str, int]:
+        """does one action, returns (action, status)"""
+        r = self.random
+        action = r.choices(list(self.mix), list(self.mix.values()))[0]
+        # nothing to click on yet
+        if not self.add_values or (action == "remove" and not self.remove_values):
+            action = "search"
+
+        if action == "search":
+            status, html = self.driver.get({"q": r.choice(SEARCH_TERMS)})
+        elif action == "sort":
+            status, html = self.driver.post({"sort_by": r.choice(SORTS)})
+        elif action == "filter":
+            status, html = self.driver.post({"filter_by": r.choice(UNIT_TYPES)})
+        elif action == "add":
+            status, html = self.driver.post({"add_to_cart": r.choice(self.add_values)})
+        elif action == "remove":
+            status, html = self.driver.post(
+                {"remove_from_cart": r.choice(self.remove_values)}
+            )
+        else:
+            store = r.choice(self.add_values).split("_")[0]
+            status, html = self.driver.post({"load_more": store})
+
+        self._seen(html)
+        return action, status
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    # nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _rss_of_tree(pid: int) -> int:
+    """resident bytes of pid and all its descendants, linux only"""
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # the command name may contain spaces, it's in brackets
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(entry))
+
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        stack += children[p]
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+class RssSampler:
+    # peak resident memory of a server's process tree, sampled
+    def __init__(self, pid: int, interval: float = 0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_of_tree(self.pid))
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> int:
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+@dataclass
+class Report:
+    users: int
+    duration: float
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    peak_rss: int = None
+
+    @property
+    def n_requests(self) -> int:
+        return sum(len(l) for l in self.latencies.values())
+
+    @property
+    def throughput(self) -> float:
+        return self.n_requests / self.duration
+
+    def summary(self) -> dict:
+        actions = {}
+        for action, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            actions[action] = {
+                "n": len(latencies),
+                "errors": self.errors.get(action, 0),
+                "p50_ms": _percentile(latencies, 50) * 1000,
+                "p95_ms": _percentile(latencies, 95) * 1000,
+                "p99_ms": _percentile(latencies, 99) * 1000,
+                "max_ms": latencies[-1] * 1000,
+            }
+        return {
+            "users": self.users,
+            "duration_s": self.duration,
+            "requests": self.n_requests,
+            "throughput_rps": self.throughput,
+            "peak_rss_bytes": self.peak_rss,
+            "actions": actions,
+        }
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"{summary['requests']} requests from {self.users} users in "
+            f"{self.duration:.1f}s, {self.throughput:.1f} req/s",
+            "",
+            f"{'action':<10} {'n':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'max ms':>8}",
+        ]
+        for action, a in summary["actions"].items():
+            lines.append(
+                f"{action:<10} {a['n']:>6} {a['errors']:>6} {a['p50_ms']:>8.1f} "
+                f"{a['p95_ms']:>8.1f} {a['p99_ms']:>8.1f} {a['max_ms']:>8.1f}"
+            )
+        if self.peak_rss is not None:
+            lines += ["", f"peak rss {self.peak_rss / 1024**2:,.1f} MiB"]
+        return "\n".join(lines)
+
+
+def run(
+    make_driver,
+    users: int = 10,
+    duration: float = 30.0,
+    mix: dict[str, int] = DEFAULT_MIX,
+    seed: int = 0,
+) -> Report:
+    """runs users simulated visitors, each with a driver from make_driver(),
+    as fast as they'll go for duration seconds"""
+    report = Report(users=users, duration=duration)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def visit(i: int):
+        user = VirtualUser(make_driver(), mix, seed=seed * 1000 + i)
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                action, status = user.step()
+                failed = status >= 400
+            except Exception:
+                action, failed = "error", True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[action].append(elapsed)
+                if failed:
+                    errors[action] += 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=visit, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report.duration = time.monotonic() - started
+    report.latencies = dict(latencies)
+    report.errors = dict(errors)
+    return report
+
+
+def peak_rss_of_this_process() -> int:
+    # ru_maxrss is in KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def spawn_server(command: str, port: int, env: dict[str, str]) -> subprocess.Popen:
+    """starts e.g. "uvicorn mysite.asgi:application --port {port}" and waits for
+    it to answer"""
+    process = subprocess.Popen(
+        command.format(port=port).split(),
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{command!r} exited with {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{command!r} didn't start answering on port {port}")
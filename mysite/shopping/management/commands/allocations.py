@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from utils import allocations
+
+from shopping.sessions import estimate_size
+from shopping.views import GlobalSession
+
+
+class Command(BaseCommand):
+    help = (
+        "searches every store with allocation profiling on, then reports what "
+        "each stage left allocated, per store and by allocating line"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("query")
+        parser.add_argument(
+            "--pages", type=int, default=1, help="result pages to load per store"
+        )
+        parser.add_argument(
+            "--top", type=int, default=10, help="allocation sites to show per stage"
+        )
+
+    def handle(self, query, pages, top, **options):
+        g = GlobalSession()
+
+        allocations.start()
+        try:
+            for s in g.s_list:
+                s.search(query)
+                for _ in range(pages - 1):
+                    s.load_more()
+                s.item_list_displayed
+        finally:
+            profiler = allocations.stop()
+            g.close()
+
+        self.stdout.write(allocations.format_report(profiler.report(top)))
+        self.stdout.write("")
+        for s in g.s_list:
+            self.stdout.write(
+                f"{s.store.value}: {len(s.search_result.initial_list)} items, "
+                f"~{estimate_size(s.search_result) / 1024:,.1f} KiB held"
+            )
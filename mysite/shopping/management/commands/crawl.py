@@ -0,0 +1,95 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from utils.main import Store
+from utils.parsing import ParsePool
+
+from shopping import catalog, crawler
+
+
+class Command(BaseCommand):
+    help = (
+        "crawls the stores' results for SHOPPING_CRAWL_QUERIES into the catalog, "
+        "writing only what changed. stops at the request budget and carries on "
+        "from there next time, --every runs a round every so many seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--store",
+            action="append",
+            choices=[store.value for store in Store],
+            help="only this store, can be given more than once",
+        )
+        parser.add_argument(
+            "--query",
+            action="append",
+            help="instead of SHOPPING_CRAWL_QUERIES, can be given more than once",
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=settings.SHOPPING_CRAWL_BUDGET,
+            help="requests per store per round",
+        )
+        parser.add_argument("--page-size", type=int, default=128)
+        parser.add_argument(
+            "--max-items", type=int, default=10_000, help="deepest per query"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.SHOPPING_CRAWL_INTERVAL,
+            help="seconds before a finished query is crawled again",
+        )
+        parser.add_argument(
+            "--every", type=float, help="keep going, a round every this many seconds"
+        )
+        parser.add_argument(
+            "--parse-workers",
+            type=int,
+            default=settings.SHOPPING_PARSE_WORKERS,
+            help="processes to parse pages on, 0 parses them in the crawl's threads",
+        )
+
+    def handle(self, *args, **options):
+        stores = [Store(value) for value in options["store"] or []] or list(Store)
+        queries = options["query"] or settings.SHOPPING_CRAWL_QUERIES
+        parse_pool = (
+            ParsePool(options["parse_workers"]) if options["parse_workers"] else None
+        )
+        try:
+            self.run_rounds(stores, queries, parse_pool, options)
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown()
+
+    def run_rounds(self, stores, queries, parse_pool, options):
+        while True:
+            started = time.monotonic()
+            for stats in crawler.crawl(
+                stores,
+                queries,
+                options["budget"],
+                page_size=options["page_size"],
+                max_items=options["max_items"],
+                interval=options["interval"],
+                parse_pool=parse_pool,
+                parse_min_items=settings.SHOPPING_PARSE_MIN_ITEMS,
+            ):
+                self.stdout.write(
+                    f"{stats.store}: {stats.requests} requests, {stats.items} items, "
+                    f"{stats.changed} changed, {stats.finished_queries} queries "
+                    f"finished"
+                    + (", out of budget" if stats.out_of_budget else "")
+                    + (f", stopped by {stats.error}" if stats.error else "")
+                )
+            # the round's prices are folded into the price history's segments
+            history = catalog.price_history()
+            if history is not None:
+                history.compact()
+            if options["every"] is None:
+                return
+            time.sleep(max(options["every"] - (time.monotonic() - started), 0))
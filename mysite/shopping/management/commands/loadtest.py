@@ -0,0 +1,117 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from shopping import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "load tests the site with simulated users against stand-in store apis, "
+        "in this process through the test client, or against a server with "
+        "--url or --spawn"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+        parser.add_argument(
+            "--max-items", type=int, default=settings.SHOPPING_MAX_ITEMS
+        )
+        parser.add_argument(
+            "--mix",
+            default=json.dumps(loadtest.DEFAULT_MIX),
+            help="json of action to relative frequency",
+        )
+        parser.add_argument(
+            "--catalog-size", type=int, default=2000, help="items per stand-in store"
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.05, help="stand-in store latency"
+        )
+        parser.add_argument(
+            "--stub-port",
+            type=int,
+            default=0,
+            help="port for the stand-in stores, fix it when using --url",
+        )
+        parser.add_argument(
+            "--url",
+            help="load test a server already running here, started with "
+            "SHOPPING_STORE_URLS pointing at the stand-in stores",
+        )
+        parser.add_argument(
+            "--spawn",
+            help='start this server and load test it, e.g. "uvicorn '
+            'mysite.asgi:application --port {port} --workers 4"',
+        )
+        parser.add_argument("--port", type=int, default=8765, help="for --spawn")
+        parser.add_argument("--json", help="also write the report here")
+
+    def handle(self, *args, **options):
+        stubs = loadtest.StubStores(
+            options["catalog_size"], options["latency"], options["stub_port"]
+        )
+        stubs.start()
+        try:
+            report = self._run(stubs, options)
+        finally:
+            stubs.stop()
+
+        self.stdout.write(report.format())
+        if options["json"]:
+            with open(options["json"], "w") as f:
+                json.dump(report.summary(), f, indent=2)
+
+    def _run(self, stubs, options):
+        run_options = dict(
+            users=options["users"],
+            duration=options["duration"],
+            mix=json.loads(options["mix"]),
+        )
+
+        if options["url"]:
+            self.stdout.write(f"stand-in stores: {json.dumps(stubs.urls)}")
+            return loadtest.run(
+                lambda: loadtest.HttpDriver(options["url"]), **run_options
+            )
+
+        if options["spawn"]:
+            port = options["port"]
+            server = loadtest.spawn_server(
+                options["spawn"],
+                port,
+                env={
+                    "SHOPPING_STORE_URLS": json.dumps(stubs.urls),
+                    "SHOPPING_MAX_ITEMS": str(options["max_items"]),
+                    "SHOPPING_SESSION_ENGINE": "django.contrib.sessions.backends.file",
+                },
+            )
+            sampler = loadtest.RssSampler(server.pid)
+            sampler.start()
+            try:
+                report = loadtest.run(
+                    lambda: loadtest.HttpDriver(f"http://127.0.0.1:{port}/"),
+                    **run_options,
+                )
+            finally:
+                peak_rss = sampler.stop()
+                server.terminate()
+                server.wait()
+            report.peak_rss = peak_rss
+            return report
+
+        # in process, the views module is already imported so repoint its plugins
+        from shopping import views
+
+        views.use_store_urls(stubs.urls)
+        with override_settings(
+            SHOPPING_MAX_ITEMS=options["max_items"],
+            SESSION_ENGINE="django.contrib.sessions.backends.cache",
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        ):
+            report = loadtest.run(loadtest.ClientDriver, **run_options)
+        report.peak_rss = loadtest.peak_rss_of_this_process()
+        return report
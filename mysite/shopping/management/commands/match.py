@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shopping import matching
+
+
+class Command(BaseCommand):
+    help = (
+        "matches the catalog's products across stores, by barcode and by "
+        "description, size and brand. only new or changed products are signed "
+        "again, the groups are rebuilt from all of them"
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        signed = matching.refresh_signatures()
+        signed_at = time.perf_counter()
+        grouped = matching.rebuild_groups()
+        self.stdout.write(
+            f"signed {signed} products in {signed_at - started:.1f}s, "
+            f"{grouped} are in groups after {time.perf_counter() - signed_at:.1f}s"
+        )
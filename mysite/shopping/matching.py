@@ -0,0 +1,124 @@
+"""keeps each catalog product's minhash signature and match group, see
+utils.matching. signatures are only worked out again for products whose
+content_hash changed, the groups are rebuilt from all of them, which is
+about linear in the size of the catalog"""
+
+from __future__ import annotations
+
+import struct
+from itertools import groupby
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from utils import matching
+from utils.main import Currency, Item
+
+from .models import Barcode, Product, ProductMatch
+
+_SIGNATURE = struct.Struct(f"<{matching.N_HASHES}Q")
+# rows loaded or written at a time
+BATCH_SIZE = 2000
+
+
+def refresh_signatures() -> int:
+    """signs the products which are new or changed since, returns how many"""
+    stale = Product.objects.filter(
+        Q(match__isnull=True) | ~Q(match__content_hash=F("content_hash"))
+    ).order_by("id")
+    n = 0
+    while batch := list(stale[:BATCH_SIZE]):
+        rows = []
+        for product in batch:
+            features = matching.Features.of(product.to_item(), product.id)
+            rows.append(
+                ProductMatch(
+                    product=product,
+                    content_hash=product.content_hash,
+                    signature=_SIGNATURE.pack(*matching.signature(features.words)),
+                )
+            )
+        ProductMatch.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=["content_hash", "signature"],
+        )
+        n += len(rows)
+    return n
+
+
+def _barcode_pairs() -> list[tuple[int, int, float]]:
+    # products of different stores with a barcode in common are certain matches
+    pairs = []
+    rows = Barcode.objects.order_by("gtin").values_list(
+        "gtin", "product_id", "product__store"
+    )
+    for _, same in groupby(rows.iterator(), key=lambda row: row[0]):
+        same = list(same)
+        for i, (_, a, store_a) in enumerate(same):
+            pairs += [
+                (a, b, 1.0) for _, b, store_b in same[i + 1 :] if store_a != store_b
+            ]
+    return pairs
+
+
+def rebuild_groups() -> int:
+    """matches every signed product again, returns how many are in a group"""
+    features, signatures = [], []
+    rows = ProductMatch.objects.select_related("product").order_by("product_id")
+    for match in rows.iterator(chunk_size=BATCH_SIZE):
+        features.append(matching.Features.of(match.product.to_item(), match.product_id))
+        signatures.append(_SIGNATURE.unpack(bytes(match.signature)))
+
+    pairs = matching.match(features, signatures) + _barcode_pairs()
+    stores = {f.key: f.store for f in features}
+    groups = matching.group(
+        (p for p in pairs if p[0] in stores and p[1] in stores), stores
+    )
+
+    qn = connection.ops.quote_name
+    table = qn(ProductMatch._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {table} SET {qn('group')} = NULL")
+        cursor.executemany(
+            f"UPDATE {table} SET {qn('group')} = %s WHERE {qn('product_id')} = %s",
+            [(root, key) for key, root in groups.items()],
+        )
+    return len(groups)
+
+
+def groups_of(items: list[Item]) -> dict[tuple[str, str], int]:
+    """(store, product_id) -> match group, for those of items in a group"""
+    found = {}
+    keys = sorted({(item.store.value, item.product_id) for item in items})
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start : start + BATCH_SIZE]
+        rows = ProductMatch.objects.filter(
+            group__isnull=False,
+            product__store__in={store for store, _ in batch},
+            product__product_id__in={pid for _, pid in batch},
+        ).values_list("product__store", "product__product_id", "group")
+        found.update(((store, pid), group) for store, pid, group in rows)
+    return found
+
+
+def cheapest(limit: int = None) -> list[list[Item]]:
+    """each group's products, cheapest first, the groups with the biggest
+    difference between their cheapest and dearest first"""
+    rows = (
+        ProductMatch.objects.filter(group__isnull=False)
+        .select_related("product")
+        .order_by("group", "product__price")
+    )
+    groups = [
+        [match.product.to_item() for match in members]
+        for _, members in groupby(rows.iterator(), key=lambda m: m.group)
+    ]
+
+    def saving(items: list[Item]) -> float:
+        prices = [i.price.convert_to(Currency.GBP).amount for i in items]
+        return max(prices) - min(prices)
+
+    groups.sort(key=saving, reverse=True)
+    return groups[:limit]
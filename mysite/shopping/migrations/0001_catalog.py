@@ -0,0 +1,67 @@
+# Generated by Django 4.1.4 on 2026-10-19 13:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.FloatField()),
+                ('unit_price', models.FloatField()),
+                ('observed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store', models.CharField(choices=[('waitrose', 'Waitrose'), ('asda', 'Asda')], max_length=32)),
+                ('product_id', models.CharField(max_length=64)),
+                ('description', models.TextField()),
+                ('thumbnail', models.TextField(blank=True)),
+                ('price', models.FloatField()),
+                ('unit_price', models.FloatField()),
+                ('quantity_amount', models.FloatField()),
+                ('quantity_unit', models.CharField(choices=[('EA', 'EA'), ('NULL', 'NULL'), ('PCS', 'PCS'), ('KG', 'KG'), ('KG_TYP', 'KG_TYP'), ('G', 'G'), ('L', 'L'), ('ML', 'ML'), ('CL', 'CL')], max_length=16)),
+                ('si_quantity', models.FloatField()),
+                ('unit_type', models.CharField(choices=[('weight', 'weight'), ('volume', 'volume'), ('other', 'other')], max_length=16)),
+                ('quantity_debug', models.TextField(blank=True)),
+                ('last_seen', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['unit_type', 'si_quantity'], name='shopping_pr_unit_ty_c8b6f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['unit_price'], name='shopping_pr_unit_pr_b7302b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='shopping_pr_price_86731a_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('store', 'product_id'), name='product_store_product_id'),
+        ),
+        migrations.AddField(
+            model_name='priceobservation',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='observations', to='shopping.product'),
+        ),
+        migrations.AddIndex(
+            model_name='priceobservation',
+            index=models.Index(fields=['product', 'observed_at'], name='shopping_pr_product_3bce30_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# an external content fts5 index of product descriptions, kept up to date by
+# triggers so the upserts in catalog.ingest don't have to know about it
+FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE shopping_product_fts USING fts5(
+        description,
+        content='shopping_product',
+        content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER shopping_product_fts_insert AFTER INSERT ON shopping_product
+    BEGIN
+        INSERT INTO shopping_product_fts (rowid, description)
+        VALUES (new.id, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER shopping_product_fts_delete AFTER DELETE ON shopping_product
+    BEGIN
+        INSERT INTO shopping_product_fts (shopping_product_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER shopping_product_fts_update
+    AFTER UPDATE OF description ON shopping_product
+    BEGIN
+        INSERT INTO shopping_product_fts (shopping_product_fts, rowid, description)
+        VALUES ('delete', old.id, old.description);
+        INSERT INTO shopping_product_fts (rowid, description)
+        VALUES (new.id, new.description);
+    END
+    """,
+    "INSERT INTO shopping_product_fts (shopping_product_fts) VALUES ('rebuild')",
+]
+
+BACKWARDS = [
+    "DROP TRIGGER IF EXISTS shopping_product_fts_update",
+    "DROP TRIGGER IF EXISTS shopping_product_fts_delete",
+    "DROP TRIGGER IF EXISTS shopping_product_fts_insert",
+    "DROP TABLE IF EXISTS shopping_product_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # fts5 is sqlite's, elsewhere catalog.text_search falls back to LIKE
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopping", "0001_catalog"),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARDS), _run(BACKWARDS)),
+    ]
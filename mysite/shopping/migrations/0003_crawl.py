@@ -0,0 +1,49 @@
+# Generated by Django 4.1.4 on 2026-10-19 13:25
+
+import importlib
+
+from django.db import migrations, models
+
+product_fts = importlib.import_module("shopping.migrations.0002_product_fts")
+
+
+def recreate_fts_triggers(apps, schema_editor):
+    # adding content_hash remakes shopping_product on sqlite, which can drop the
+    # triggers keeping the fts index up to date
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in [*product_fts.BACKWARDS[:-1], *product_fts.FORWARDS[1:]]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0002_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store', models.CharField(choices=[('waitrose', 'Waitrose'), ('asda', 'Asda')], max_length=32)),
+                ('query', models.CharField(max_length=200)),
+                ('offset', models.PositiveIntegerField(default=0)),
+                ('total_items', models.PositiveIntegerField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        # and removing it does the same going backwards
+        migrations.RunPython(migrations.RunPython.noop, recreate_fts_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.RunPython(recreate_fts_triggers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='crawlcursor',
+            constraint=models.UniqueConstraint(fields=('store', 'query'), name='crawlcursor_store_query'),
+        ),
+    ]
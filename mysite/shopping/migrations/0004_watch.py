@@ -0,0 +1,40 @@
+# Generated by Django 4.1.4 on 2026-10-19 13:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0003_crawl'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Watch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('filter_state', models.JSONField()),
+                ('stores', models.JSONField(blank=True, default=list)),
+                ('active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WatchAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.FloatField()),
+                ('unit_price', models.FloatField()),
+                ('created_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='shopping.product')),
+                ('watch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='shopping.watch')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='watchalert',
+            index=models.Index(fields=['watch', 'created_at'], name='shopping_wa_watch_i_f92656_idx'),
+        ),
+    ]
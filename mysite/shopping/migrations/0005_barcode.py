@@ -0,0 +1,26 @@
+# Generated by Django 4.1.4 on 2026-10-19 13:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0004_watch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Barcode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gtin', models.CharField(max_length=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='barcodes', to='shopping.product')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='barcode',
+            constraint=models.UniqueConstraint(fields=('gtin', 'product'), name='barcode_gtin_product'),
+        ),
+    ]
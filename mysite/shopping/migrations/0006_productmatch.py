@@ -0,0 +1,23 @@
+# Generated by Django 4.1.4 on 2026-10-19 13:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping', '0005_barcode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductMatch',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='match', serialize=False, to='shopping.product')),
+                ('content_hash', models.CharField(blank=True, max_length=16)),
+                ('signature', models.BinaryField()),
+                ('group', models.IntegerField(db_index=True, null=True)),
+            ],
+        ),
+    ]
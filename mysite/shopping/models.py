@@ -1,3 +1,178 @@
 from django.db import models
 
-# Create your models here.
+from utils.main import (
+    Currency,
+    Item,
+    ItemListFilter,
+    Price,
+    Quantity,
+    Store,
+    Unit,
+    UnitType,
+)
+from utils.watch import WatchRule
+
+
+class Product(models.Model):
+    """a store's product as last seen, with the prices and quantities the
+    filters and sorters work on normalised so they can be done in sql"""
+
+    store = models.CharField(
+        max_length=32, choices=[(s.value, s.name.title()) for s in Store]
+    )
+    # the store's own id for it, e.g. asda's barcode
+    product_id = models.CharField(max_length=64)
+    description = models.TextField()
+    thumbnail = models.TextField(blank=True)
+
+    # in gbp, which the price filters compare in
+    price = models.FloatField()
+    # gbp per kg, l or pcs, the price when there's no quantity
+    unit_price = models.FloatField()
+    # as the store gave it, for display
+    quantity_amount = models.FloatField()
+    quantity_unit = models.CharField(
+        max_length=16, choices=[(u.name, u.name) for u in Unit]
+    )
+    # in kg or l, or quantity_amount for other units
+    si_quantity = models.FloatField()
+    unit_type = models.CharField(
+        max_length=16, choices=[(t.value, t.value) for t in UnitType]
+    )
+    quantity_debug = models.TextField(blank=True)
+    # see catalog.content_hash, the crawler only writes products when it changes
+    content_hash = models.CharField(max_length=16, blank=True)
+
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "product_id"], name="product_store_product_id"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["unit_type", "si_quantity"]),
+            models.Index(fields=["unit_price"]),
+            models.Index(fields=["price"]),
+        ]
+
+    def __str__(self):
+        return f"{self.store} {self.product_id} {self.description}"
+
+    def to_item(self) -> Item:
+        """as a plain Item, like the searches return"""
+        quantity = Quantity(self.quantity_amount, Unit[self.quantity_unit])
+        quantity.debug = self.quantity_debug
+        item = Item(
+            description=self.description,
+            price=Price(self.price, Currency.GBP),
+            quantity=quantity,
+            thumbnail=self.thumbnail,
+        )
+        item.store = Store(self.store)
+        item.product_id = self.product_id
+        return item
+
+
+class Barcode(models.Model):
+    # one of a product's barcodes as a gtin-14, see utils.barcodes
+    gtin = models.CharField(max_length=14)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="barcodes"
+    )
+
+    class Meta:
+        constraints = [
+            # its index is the one looked up by gtin
+            models.UniqueConstraint(
+                fields=["gtin", "product"], name="barcode_gtin_product"
+            )
+        ]
+
+
+class ProductMatch(models.Model):
+    """a product's minhash signature and its group of the same product at
+    other stores, see shopping.matching"""
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="match"
+    )
+    # the product's content_hash when the signature was worked out
+    content_hash = models.CharField(max_length=16, blank=True)
+    signature = models.BinaryField()
+    # the id of one of the group's products, null if it matched nothing
+    group = models.IntegerField(null=True, db_index=True)
+
+
+class PriceObservation(models.Model):
+    # one per product each time it's ingested, the price history
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="observations"
+    )
+    price = models.FloatField()
+    unit_price = models.FloatField()
+    observed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "observed_at"])]
+
+
+class CrawlCursor(models.Model):
+    """how far the crawler has got through one store's results for one query,
+    so a crawl can stop at its request budget and pick up there next time"""
+
+    store = models.CharField(
+        max_length=32, choices=[(s.value, s.name.title()) for s in Store]
+    )
+    query = models.CharField(max_length=200)
+    offset = models.PositiveIntegerField(default=0)
+    # unknown until the first page has been fetched
+    total_items = models.PositiveIntegerField(null=True)
+    # set once the query's been crawled to the end, it's crawled again later
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "query"], name="crawlcursor_store_query"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.store} {self.query!r} at {self.offset}/{self.total_items}"
+
+
+class Watch(models.Model):
+    """a price watch, alerting when a product passing its filters changes,
+    e.g. oats under 1.50/kg"""
+
+    name = models.CharField(max_length=200)
+    # ItemListFilter.to_state(), only the enabled filters count
+    filter_state = models.JSONField()
+    # store values, empty for any store
+    stores = models.JSONField(default=list, blank=True)
+    active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    def to_rule(self) -> WatchRule:
+        return WatchRule.from_item_list_filter(
+            self.id,
+            ItemListFilter.from_state(self.filter_state),
+            [Store(store) for store in self.stores] or None,
+        )
+
+
+class WatchAlert(models.Model):
+    # a product which changed and passed a watch's filters, at its new price
+    watch = models.ForeignKey(Watch, on_delete=models.CASCADE, related_name="alerts")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    price = models.FloatField()
+    unit_price = models.FloatField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=["watch", "created_at"])]
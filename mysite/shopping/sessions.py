@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable
+
+from .sharedstate import SharedStateStore, dumps, loads
+
+
+def estimate_size(obj, _seen: set = None) -> int:
+    """rough deep size of obj in bytes, follows containers and instance dicts"""
+    if _seen is None:
+        _seen = set()
+    # enum members are shared singletons, don't charge them to anyone
+    if id(obj) in _seen or isinstance(obj, Enum):
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(i, _seen) for i in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(obj.__dict__, _seen)
+    return size
+
+
+class _Entry:
+    __slots__ = ("session", "size", "last_used", "version")
+
+    def __init__(self, session, version: int = None):
+        self.session = session
+        self.size: int = 0
+        self.last_used: float = time.monotonic()
+        # the shared store version this session was loaded from or saved as
+        self.version = version
+
+
+class SessionRegistry:
+    """holds a GlobalSession per user, keyed by the django session key.
+
+    each session is held to session_budget bytes, sessions idle for longer than
+    idle_timeout seconds are dropped, and once all sessions together go over
+    total_budget bytes the least recently used ones are evicted.
+
+    sessions need estimated_bytes() and trim_to(n_bytes) for the accounting.
+
+    with a shared_store every update is written through to it, and a session
+    another worker process has written since is reloaded on get(). the sessions
+    held here are then just this process's cache of the shared state, and evicting
+    one costs a reload rather than the visitor's state. this needs to_state() on
+    the sessions and factory.from_state(state).
+    """
+
+    def __init__(
+        self,
+        factory: Callable,
+        session_budget: int,
+        total_budget: int,
+        idle_timeout: float,
+        shared_store: SharedStateStore = None,
+    ):
+        self.factory = factory
+        self.session_budget = session_budget
+        self.total_budget = total_budget
+        self.idle_timeout = idle_timeout
+        self.shared_store = shared_store
+
+        # least recently used first
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._total_size: int = 0
+        self._lock = threading.Lock()
+        self._last_prune: float = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str):
+        return key in self._entries
+
+    @property
+    def total_size(self) -> int:
+        return self._total_size
+
+    def get(self, key: str):
+        """returns the session for key, creating it if needed"""
+        version = None
+        if self.shared_store is not None:
+            version = self.shared_store.version(key)
+
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+
+            entry = self._entries.get(key)
+            if entry is not None and (version is None or version == entry.version):
+                self._entries.move_to_end(key)
+                entry.last_used = now
+                return entry.session
+
+        # new to this process, or another worker has written a newer state
+        session = None
+        if version is not None:
+            row = self.shared_store.load(key)
+            if row is not None:
+                version, data = row
+                session = self.factory.from_state(loads(data))
+        if session is None:
+            session, version = self.factory(), None
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            entry = self._entries[key] = _Entry(session, version)
+            return session
+
+    def update(self, key: str):
+        """re-measures key's session after a request, trims it to the per session
+        budget, then evicts other sessions until under the total budget"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+
+            size = entry.session.estimated_bytes()
+            if size > self.session_budget:
+                entry.session.trim_to(self.session_budget)
+                size = entry.session.estimated_bytes()
+
+            self._total_size += size - entry.size
+            entry.size = size
+
+            # never evict the session we've just served
+            while self._total_size > self.total_budget and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                if oldest == key:
+                    break
+                self._drop(oldest)
+
+            if self.shared_store is None:
+                return
+            # the state as it is now, not halfway through another request's
+            # changes to it
+            data = dumps(entry.session.to_state())
+
+        version = self.shared_store.save(key, data)
+        with self._lock:
+            # a later update may have saved a newer version already
+            if entry.version is None or version > entry.version:
+                entry.version = version
+        self._prune_shared_store()
+
+    def remove(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+        if self.shared_store is not None:
+            self.shared_store.delete(key)
+
+    def _prune_shared_store(self):
+        # idle state is expired from the shared store at most once a minute
+        now = time.monotonic()
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            self.shared_store.prune(self.idle_timeout)
+
+    def _evict_idle(self, now: float):
+        while self._entries:
+            oldest, entry = next(iter(self._entries.items()))
+            if now - entry.last_used <= self.idle_timeout:
+                break
+            self._drop(oldest)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        self._total_size -= entry.size
+        close = getattr(entry.session, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+
+def dumps(state) -> bytes:
+    # states are plain tuples/lists/strings, pickled then lightly compressed
+    return zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def loads(data: bytes):
+    return pickle.loads(zlib.decompress(data))
+
+
+class SharedStateStore:
+    """versioned blobs keyed by session, in a sqlite database in WAL mode so
+    every worker process on the box reads and writes the same state. nothing
+    is opened until the first read or write"""
+
+    def __init__(self, path: str | Path, busy_timeout: float = 5.0):
+        self.path = str(path)
+        self.busy_timeout = busy_timeout
+        # sqlite connections can't be shared between threads
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps commits atomic without an fsync per write
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " key TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " updated REAL NOT NULL,"
+                " data BLOB NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS session_state_updated"
+                " ON session_state (updated)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        return self._conn().execute(sql, params)
+
+    def version(self, key: str) -> int | None:
+        row = self._execute(
+            "SELECT version FROM session_state WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def load(self, key: str) -> tuple[int, bytes] | None:
+        """returns (version, data) for key, or None"""
+        return self._execute(
+            "SELECT version, data FROM session_state WHERE key = ?", (key,)
+        ).fetchone()
+
+    def save(self, key: str, data: bytes) -> int:
+        """stores data for key, returns its new version"""
+        row = self._execute(
+            "INSERT INTO session_state (key, version, updated, data)"
+            " VALUES (?, 1, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET version = version + 1,"
+            " updated = excluded.updated, data = excluded.data"
+            " RETURNING version",
+            (key, time.time(), data),
+        ).fetchone()
+        return row[0]
+
+    def delete(self, key: str):
+        self._execute("DELETE FROM session_state WHERE key = ?", (key,))
+
+    def prune(self, max_age: float) -> int:
+        """deletes state not written to for max_age seconds, returns how many"""
+        cutoff = time.time() - max_age
+        return self._execute(
+            "DELETE FROM session_state WHERE updated < ?", (cutoff,)
+        ).rowcount
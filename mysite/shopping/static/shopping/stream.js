@@ -0,0 +1,46 @@
+// streams each store's results into the page as soon as that store has answered,
+// without javascript, or a stream to use, the search form falls back to a normal
+// page load
+
+document.addEventListener("DOMContentLoaded", function () {
+    const form = document.querySelector("#search-form form");
+    if (!form || !form.dataset.streamUrl || !window.EventSource) {
+        return;
+    }
+
+    let source = null;
+
+    form.addEventListener("submit", function (event) {
+        event.preventDefault();
+
+        const params = new URLSearchParams(new FormData(form));
+        history.replaceState(null, "", "?" + params);
+
+        document.querySelectorAll(".store-results").forEach(function (container) {
+            container.innerHTML =
+                '<div class="generic-container-medium"><div class="generic-container-dark">' +
+                "Searching " + container.dataset.siteName + "...</div></div>";
+        });
+
+        if (source) {
+            source.close();
+        }
+        source = new EventSource(form.dataset.streamUrl + "?" + params);
+
+        source.addEventListener("store", function (e) {
+            const msg = JSON.parse(e.data);
+            const container = document.getElementById("results-" + msg.store);
+            if (container) {
+                container.innerHTML = msg.html;
+            }
+        });
+
+        source.addEventListener("done", function () {
+            source.close();
+        });
+
+        source.onerror = function () {
+            source.close();
+        };
+    });
+});
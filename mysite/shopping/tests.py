@@ -1,3 +1,1037 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import importlib
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import NoReverseMatch, reverse
+
+from utils.main import (
+    Currency,
+    Item,
+    ItemListFilter,
+    Price,
+    Quantity,
+    Unit,
+    UnitPrice,
+)
+from utils import plugins
+from utils.httpclient import close_async_client
+from utils.benchmarks.catalog import catalog as raw_catalog
+from utils.parsing import ParsePool
+from utils.pricehistory import pence
+from utils.search import Filter, SearchResult, Sorter, SorterEnum
+
+from . import catalog, crawler, lists, matching
+from .models import (
+    Barcode,
+    CrawlCursor,
+    PriceObservation,
+    Product,
+    ProductMatch,
+    Watch,
+    WatchAlert,
+)
+
+from .sessions import SessionRegistry, estimate_size
+from .sharedstate import SharedStateStore, dumps, loads
+from .views import Cart, GlobalSession, ShopSession, Store
+
+
+def setUpModule():
+    # the views' sessions share state through a store of the test's own, not
+    # the developer's SHOPPING_STATE_DB
+    from . import views
+
+    global _state_dir, _state_patch
+    _state_dir = tempfile.TemporaryDirectory()
+    _state_patch = mock.patch.object(
+        views.SESSIONS,
+        "shared_store",
+        SharedStateStore(Path(_state_dir.name) / "state.sqlite3"),
+    )
+    _state_patch.start()
+
+
+def tearDownModule():
+    _state_patch.stop()
+    _state_dir.cleanup()
+
+
+class FakeSession:
+    # stands in for GlobalSession, sized by hand
+    def __init__(self):
+        self.size = 0
+        self.closed = False
+
+    def to_state(self):
+        return self.size
+
+    @classmethod
+    def from_state(cls, state):
+        session = cls()
+        session.size = state
+        return session
+
+    def estimated_bytes(self):
+        return self.size
+
+    def trim_to(self, n_bytes):
+        self.size = min(self.size, n_bytes)
+
+    def close(self):
+        self.closed = True
+
+
+def make_registry(**kwargs):
+    options = dict(session_budget=100, total_budget=250, idle_timeout=60)
+    options.update(kwargs)
+    return SessionRegistry(factory=FakeSession, **options)
+
+
+class SessionRegistryTests(SimpleTestCase):
+    def test_sessions_are_per_key(self):
+        sessions = make_registry()
+        a = sessions.get("a")
+        self.assertIs(sessions.get("a"), a)
+        self.assertIsNot(sessions.get("b"), a)
+
+    def test_session_trimmed_to_budget(self):
+        sessions = make_registry()
+        sessions.get("a").size = 500
+        sessions.update("a")
+        self.assertEqual(sessions.get("a").size, 100)
+        self.assertEqual(sessions.total_size, 100)
+
+    def test_least_recently_used_evicted_over_total(self):
+        sessions = make_registry()
+        for key in "abc":
+            sessions.get(key).size = 100
+            sessions.update(key)
+
+        self.assertNotIn("a", sessions)
+        self.assertIn("b", sessions)
+        self.assertIn("c", sessions)
+        self.assertEqual(sessions.total_size, 200)
+
+    def test_recently_used_survives(self):
+        sessions = make_registry()
+        a = sessions.get("a")
+        a.size = 100
+        sessions.update("a")
+        sessions.get("b").size = 100
+        sessions.update("b")
+
+        # touching a makes b the oldest
+        sessions.get("a")
+        sessions.get("c").size = 100
+        sessions.update("c")
+
+        self.assertIn("a", sessions)
+        self.assertNotIn("b", sessions)
+
+    def test_idle_sessions_dropped(self):
+        sessions = make_registry(idle_timeout=0)
+        a = sessions.get("a")
+        sessions.get("b")
+        self.assertNotIn("a", sessions)
+        self.assertTrue(a.closed)
+
+    def test_estimate_size_counts_nested(self):
+        self.assertGreater(estimate_size({"a": ["x" * 1000]}), 1000)
+
+
+class SharedStateTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "state.sqlite3"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_store_versions(self):
+        store = SharedStateStore(self.path)
+        # nothing's created until it's used
+        self.assertFalse(self.path.exists())
+        self.assertIsNone(store.version("a"))
+        self.assertEqual(store.save("a", b"1"), 1)
+        self.assertEqual(store.save("a", b"2"), 2)
+        self.assertEqual(store.load("a"), (2, b"2"))
+        self.assertEqual(store.prune(max_age=-1), 1)
+        self.assertIsNone(store.load("a"))
+
+    def test_sessions_shared_between_registries(self):
+        # two registries on one database stand in for two worker processes
+        worker1 = make_registry(shared_store=SharedStateStore(self.path))
+        worker2 = make_registry(shared_store=SharedStateStore(self.path))
+
+        worker1.get("a").size = 42
+        worker1.update("a")
+        self.assertEqual(worker2.get("a").size, 42)
+
+        worker2.get("a").size = 7
+        worker2.update("a")
+        self.assertEqual(worker1.get("a").size, 7)
+
+    def test_slower_save_keeps_newer_version(self):
+        store = SharedStateStore(self.path)
+        registry = make_registry(shared_store=store)
+        session = registry.get("a")
+        save = store.save
+
+        def save_before_another(key, data):
+            # another request's update saves after this one, but returns first
+            version = save(key, data)
+            store.save = save
+            session.size = 9
+            registry.update(key)
+            return version
+
+        session.size = 5
+        store.save = save_before_another
+        registry.update("a")
+
+        # what this process holds is the newest, so it isn't reloaded
+        self.assertEqual(registry._entries["a"].version, store.version("a"))
+        self.assertIs(registry.get("a"), session)
+
+    def test_global_session_round_trip(self):
+        g = GlobalSession()
+        s = g.get_shop_session_by_store(Store.WAITROSE)
+        s.query = "oats"
+        items = [
+            Item(
+                description=f"oats {i}",
+                price=Price(float(i % 3 + 1), Currency.GBP),
+                quantity=Quantity(100 * (i + 1), Unit.G),
+            )
+            for i in range(5)
+        ]
+        s._set_result(items)
+        s.filter.sorter = Sorter(SorterEnum.LOWEST_PRICE)
+        s.filter.filters.description_filter.enable()
+        s.add_item_to_cart_by_id(str(items[2].identifier))
+
+        restored = GlobalSession.from_state(loads(dumps(g.to_state())))
+        r = restored.get_shop_session_by_store(Store.WAITROSE)
+
+        self.assertEqual(r.query, "oats")
+        self.assertEqual(
+            [i.description for i in r.item_list_displayed],
+            [i.description for i in s.item_list_displayed],
+        )
+        self.assertEqual(r.search_result._sorted_by, SorterEnum.LOWEST_PRICE)
+        self.assertTrue(r.filter.filters.description_filter.is_enabled)
+        self.assertEqual(str(r.cart.total_value), str(s.cart.total_value))
+        self.assertEqual(
+            r.cart_items[0].item_obj.identifier, s.cart_items[0].item_obj.identifier
+        )
+
+
+def make_items(n):
+    return [
+        Item(
+            description=f"item {i}",
+            price=Price(1.5, Currency.GBP),
+            quantity=Quantity(1, Unit.KG),
+        )
+        for i in range(n)
+    ]
+
+
+class CartTests(SimpleTestCase):
+    def test_running_total(self):
+        cart = Cart()
+        a, b = make_items(2)
+        cart.add(a)
+        cart.add(a)
+        cart.add(b)
+        self.assertEqual(cart.n_items, 2)
+        self.assertAlmostEqual(cart.total_value.amount, 4.5)
+
+        cart.remove(str(a.identifier))
+        self.assertEqual(cart.get(str(a.identifier)).pcs, 1)
+        self.assertAlmostEqual(cart.total_value.amount, 3.0)
+
+        cart.remove(str(a.identifier))
+        cart.remove(str(b.identifier))
+        self.assertEqual(cart.n_items, 0)
+        self.assertEqual(cart.total_value, 0)
+
+    def test_mixed_currencies(self):
+        cart = Cart()
+        a, b = make_items(2)
+        b.price = Price(1.9, Currency.NZD)
+        cart.add(a)
+        cart.add(b)
+        self.assertEqual(cart.total_value.curr, Currency.GBP)
+        self.assertAlmostEqual(cart.total_value.amount, 2.5)
+
+    def test_add_by_id_from_results(self):
+        s = ShopSession(Store.WAITROSE)
+        items = make_items(5000)
+        s._set_result(items)
+
+        s.add_item_to_cart_by_id(str(items[4321].identifier))
+        s.add_item_to_cart_by_id(str(items[4321].identifier))
+        s.add_item_to_cart_by_id("not-an-id")
+        self.assertEqual(s.cart.n_items, 1)
+        self.assertEqual(s.cart_items[0].pcs, 2)
+
+        s.remove_item_from_cart_by_id(str(items[4321].identifier))
+        self.assertEqual(s.cart_items[0].pcs, 1)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_stages_on_metrics_endpoint(self):
+        s = ShopSession(Store.WAITROSE)
+        s._set_result(make_items(50))
+        s.item_list_displayed
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("# TYPE shopping_stage_seconds histogram", body)
+        self.assertIn(
+            'shopping_stage_seconds_count{stage="filter",store="waitrose"}', body
+        )
+
+    def test_stream_is_timed_until_sent(self):
+        g = GlobalSession()
+        with tempfile.TemporaryDirectory() as root, self.settings(
+            SHOPPING_TRACE_DIR=root,
+            SESSION_ENGINE="django.contrib.sessions.backends.cache",
+        ), mock.patch("shopping.views.SESSIONS.get", return_value=g), mock.patch(
+            "shopping.views.SESSIONS.update"
+        ), mock.patch(
+            "shopping.views.search_store"
+        ):
+            response = self.client.get(
+                reverse("shopping:stream"), {"q": "milk"}, HTTP_X_SHOPPING_TRACE="1"
+            )
+            # nothing's written until the stream has been sent
+            self.assertEqual(list(Path(root).iterdir()), [])
+            b"".join(response.streaming_content)
+            response.close()
+
+            (path,) = Path(root).iterdir()
+            events = json.loads(path.read_text())["traceEvents"]
+
+        spans = {}
+        for event in events:
+            if event["ph"] == "X":
+                spans.setdefault(event["name"], []).append(event)
+        (request,) = spans["request"]
+        self.assertEqual(len(spans["render"]), len(g.s_list))
+        for render in spans["render"]:
+            self.assertLessEqual(
+                render["ts"] + render["dur"], request["ts"] + request["dur"]
+            )
+
+
+class StreamTests(SimpleTestCase):
+    def reload_urls(self):
+        from django.urls import clear_url_caches
+
+        from mysite import urls as root_urls
+
+        from . import urls
+
+        importlib.reload(urls)
+        importlib.reload(root_urls)
+        clear_url_caches()
+
+    def test_not_routed_under_asgi(self):
+        # the stream would block an ASGI server's loop, searches load the page
+        with self.settings(
+            ASYNC_VIEWS=True, SESSION_ENGINE="django.contrib.sessions.backends.cache"
+        ):
+            self.reload_urls()
+            self.addCleanup(self.reload_urls)
+            with self.assertRaises(NoReverseMatch):
+                reverse("shopping:stream")
+            response = self.client.get(reverse("shopping:home"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "data-stream-url")
+        self.reload_urls()
+        self.assertEqual(reverse("shopping:stream"), "/stream/")
+
+
+class LoadTestTests(SimpleTestCase):
+    def test_in_process_run_against_stubs(self):
+        from . import loadtest, views
+
+        stubs = loadtest.StubStores(n_items=200, latency=0.001)
+        stubs.start()
+        original_urls = {
+            store.value: plugins.get(store).search_request_class.URL
+            for store in (Store.WAITROSE, Store.ASDA)
+        }
+        try:
+            views.use_store_urls(stubs.urls)
+            with self.settings(SESSION_ENGINE="django.contrib.sessions.backends.cache"):
+                report = loadtest.run(loadtest.ClientDriver, users=2, duration=1.0)
+        finally:
+            views.use_store_urls(original_urls)
+            stubs.stop()
+
+        summary = report.summary()
+        self.assertEqual(report.errors, {})
+        self.assertGreater(summary["actions"]["search"]["n"], 0)
+        self.assertGreater(len(summary["actions"]), 2)
+        self.assertLessEqual(
+            summary["actions"]["search"]["p50_ms"],
+            summary["actions"]["search"]["p99_ms"],
+        )
+
+
+class AsyncTests(SimpleTestCase):
+    def setUp(self):
+        from . import loadtest, views
+
+        self.stubs = loadtest.StubStores(n_items=100, latency=0.001)
+        self.stubs.start()
+        original_urls = {
+            store.value: plugins.get(store).search_request_class.URL for store in Store
+        }
+        views.use_store_urls(self.stubs.urls)
+        self.addCleanup(views.use_store_urls, original_urls)
+        self.addCleanup(self.stubs.stop)
+
+    def run_async(self, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await close_async_client()
+
+        return asyncio.run(run())
+
+    def test_async_fetches_match_sync(self):
+        for store in Store:
+            request = plugins.get(store).search_request_class(
+                "milk", max_items=48, lazy=True
+            )
+            for start in (0, 24):
+                self.assertEqual(
+                    self.run_async(request.afetch_page(start=start, size=24)),
+                    request.fetch_page(start=start, size=24),
+                )
+
+        asda = plugins.get(Store.ASDA).search_request_class("milk", max_items=24)
+        asda_async = plugins.get(Store.ASDA).search_request_class(
+            "milk", max_items=24, lazy=True
+        )
+        self.run_async(asda_async.aquery("milk"))
+        self.assertEqual(asda_async.get_items_as_list(), asda.get_items_as_list())
+
+        waitrose = plugins.get(Store.WAITROSE).search_request_class("milk", lazy=True)
+        response = self.run_async(waitrose.aquery("milk", start=1, size=24))
+        self.assertEqual(
+            waitrose._decode(response)["componentsAndProducts"],
+            self.stubs.catalogs["waitrose"][:24],
+        )
+
+    def test_ahome_pages_without_threads(self):
+        from django.contrib.sessions.backends.cache import SessionStore
+        from django.test import RequestFactory
+
+        from . import views
+
+        factory = RequestFactory()
+
+        def request(method, data):
+            r = getattr(factory, method)("/", data)
+            r.session = session
+            return r
+
+        async def search_and_page():
+            await views.ahome(request("get", {"q": "milk"}))
+            g = views.SESSIONS.get(session.session_key)
+            s = g.get_shop_session_by_store(Store.WAITROSE)
+            self.assertIsInstance(s._prefetch, asyncio.Task)
+            n_items = len(s.search_result.initial_list)
+
+            await views.ahome(request("post", {"load_more": Store.WAITROSE.value}))
+            g.close()
+            return n_items, len(s.search_result.initial_list)
+
+        session = SessionStore()
+        with self.settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.cache"
+        ), mock.patch.object(
+            views.PREFETCH_EXECUTOR, "submit", side_effect=AssertionError("a thread")
+        ):
+            first, more = self.run_async(search_and_page())
+
+        self.assertEqual(first, 24)
+        self.assertEqual(more, 48)
+
+    def test_sync_view_after_ahome(self):
+        # under ASGI the sync views run in a thread with no loop, while the
+        # pages ahome started are tasks on the server's
+        from asgiref.sync import sync_to_async
+        from django.contrib.sessions.backends.cache import SessionStore
+        from django.test import RequestFactory
+
+        from . import views
+
+        factory = RequestFactory()
+
+        def request(method, data):
+            r = getattr(factory, method)("/", data)
+            r.session = session
+            return r
+
+        async def search_then_merged():
+            await views.ahome(request("get", {"q": "milk"}))
+            g = views.SESSIONS.get(session.session_key)
+            s = g.get_shop_session_by_store(Store.WAITROSE)
+            await s._prefetch
+
+            response = await sync_to_async(views.merged)(request("get", {}))
+            # the next page is fetched on the loop all the same
+            self.assertIsInstance(s._prefetch, asyncio.Task)
+            await s._prefetch
+            s.merge_prefetched()
+            g.close()
+            return response, len(s.search_result.initial_list)
+
+        session = SessionStore()
+        with self.settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.cache"
+        ), mock.patch.object(
+            views.PREFETCH_EXECUTOR, "submit", side_effect=AssertionError("a thread")
+        ), mock.patch(
+            "shopping.views.matching.groups_of", return_value={}
+        ):
+            response, n_items = self.run_async(search_then_merged())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(n_items, 72)
+
+
+@override_settings(SHOPPING_PRICE_HISTORY_DIR=None)
+class CatalogTests(TestCase):
+    def setUp(self):
+        items = [
+            plugins.get(Store.WAITROSE).item_class(r)
+            for r in raw_catalog("waitrose", 300)
+        ]
+        items += [
+            plugins.get(Store.ASDA).item_class(r) for r in raw_catalog("asda", 300)
+        ]
+        self.items = [item for item in items if not item.is_null]
+
+    def test_ingest_upserts(self):
+        n = catalog.ingest(self.items, batch_size=128)
+        self.assertEqual(n, len(self.items))
+        catalog.ingest(self.items[:100])
+
+        self.assertEqual(Product.objects.count(), len(self.items))
+        self.assertEqual(PriceObservation.objects.count(), len(self.items) + 100)
+
+    def test_ingest_records_price_history(self):
+        with tempfile.TemporaryDirectory() as root:
+            with self.settings(SHOPPING_PRICE_HISTORY_DIR=root):
+                seen = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+                catalog.ingest(self.items, seen=seen)
+                catalog.ingest(self.items[:1], seen=seen + datetime.timedelta(days=1))
+                history = catalog.price_history()
+                item = self.items[0]
+                self.assertEqual(
+                    history.history(item.store.value, item.product_id),
+                    [
+                        (seen.timestamp() + days * 24 * 3600, pence(item))
+                        for days in (0, 1)
+                    ],
+                )
+                history.close()
+
+    def test_pushdown_matches_filter_and_sort(self):
+        catalog.ingest(self.items)
+
+        item_filter = ItemListFilter()
+        item_filter.sorter = Sorter(SorterEnum.LOWEST_QUANTITY)
+        f = item_filter.filters
+        f.price_filter = Filter.PriceFilter(
+            Price(1, Currency.GBP), Price(4, Currency.GBP)
+        )
+        f.price_filter.enable()
+        f.quantity_filter.enable()
+
+        expected = SearchResult(self.items).filter_and_sort(item_filter)
+        result = catalog.search(item_filter)
+
+        self.assertEqual(
+            [item.product_id for item in result.sorted_list],
+            [item.product_id for item in expected],
+        )
+        self.assertEqual(
+            [item.product_id for item in result.filter_and_sort(item_filter)],
+            [item.product_id for item in expected],
+        )
+
+    def test_text_search(self):
+        catalog.ingest(self.items)
+
+        def words(item):
+            return item.description.lower().split()
+
+        result = catalog.text_search("Smoked BACON", ItemListFilter())
+        self.assertEqual(
+            {item.product_id for item in result.initial_list},
+            {i.product_id for i in self.items if {"smoked", "bacon"} <= set(words(i))},
+        )
+        # the last word can be the start of one
+        self.assertEqual(
+            len(catalog.text_search("smoked bac", ItemListFilter()).initial_list),
+            len(result.initial_list),
+        )
+        self.assertEqual(catalog.text_search("  ", ItemListFilter()).initial_list, [])
+
+        item_filter = ItemListFilter()
+        item_filter.sorter = Sorter(SorterEnum.HIGHEST_PRICE)
+        item_filter.filters.price_filter = Filter.PriceFilter(
+            Price(2, Currency.GBP), Price(5, Currency.GBP)
+        )
+        item_filter.filters.price_filter.enable()
+        prices = [
+            item.price.amount
+            for item in catalog.text_search("milk", item_filter).sorted_list
+        ]
+        self.assertTrue(prices)
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        self.assertTrue(all(2 < price < 5 for price in prices))
+
+    def test_fallback_to_catalog(self):
+        from . import views
+
+        catalog.ingest(self.items)
+        s = ShopSession(Store.ASDA)
+        with mock.patch.object(
+            ShopSession, "search", side_effect=ConnectionError("asda is down")
+        ):
+            with self.settings(SHOPPING_SEARCH_BACKEND="live"):
+                with self.assertRaises(ConnectionError):
+                    views.search_store(s, "milk")
+            with self.settings(SHOPPING_SEARCH_BACKEND="fallback"):
+                with self.assertLogs("shopping.views", "WARNING"):
+                    views.search_store(s, "milk")
+
+        self.assertTrue(s.offline)
+        stores = {item.store for item in s.item_list_displayed}
+        self.assertEqual(stores, {Store.ASDA})
+
+
+@override_settings(SHOPPING_PRICE_HISTORY_DIR=None)
+class CrawlTests(TestCase):
+    def setUp(self):
+        from . import loadtest, views
+
+        self.views = views
+        self.stubs = loadtest.StubStores(n_items=300, latency=0)
+        self.stubs.start()
+        self.original_urls = {
+            store.value: plugins.get(store).search_request_class.URL
+            for store in (Store.WAITROSE, Store.ASDA)
+        }
+        views.use_store_urls(self.stubs.urls)
+
+    def tearDown(self):
+        self.views.use_store_urls(self.original_urls)
+        self.stubs.stop()
+
+    def crawl(self, budget, **kwargs):
+        (stats,) = crawler.crawl(
+            [Store.WAITROSE], ["milk"], budget, parallel=False, page_size=64, **kwargs
+        )
+        return stats
+
+    def test_budget_and_resume(self):
+        stats = self.crawl(2)
+        self.assertTrue(stats.out_of_budget)
+        self.assertEqual(stats.requests, 2)
+        saved = CrawlCursor.objects.get(store="waitrose", query="milk")
+        self.assertEqual((saved.offset, saved.total_items), (128, 300))
+        self.assertIsNone(saved.finished_at)
+
+        # carries on from 128 rather than starting again
+        stats = self.crawl(10)
+        self.assertFalse(stats.out_of_budget)
+        self.assertEqual((stats.requests, stats.finished_queries), (3, 1))
+        saved.refresh_from_db()
+        self.assertEqual(saved.offset, 300)
+        self.assertIsNotNone(saved.finished_at)
+
+        # finished, so not due again until the interval's passed
+        self.assertEqual(self.crawl(10).requests, 0)
+
+    def test_only_changes_written(self):
+        stats = self.crawl(10)
+        self.assertEqual(stats.changed, Product.objects.count())
+        observations = PriceObservation.objects.count()
+
+        stats = self.crawl(10, interval=0)
+        self.assertEqual(stats.requests, 5)
+        self.assertEqual(stats.changed, 0)
+        self.assertEqual(PriceObservation.objects.count(), observations)
+
+        # a price change is written, and only that product
+        product = Product.objects.order_by("id").first()
+        Product.objects.filter(id=product.id).update(content_hash="stale")
+        stats = self.crawl(10, interval=0)
+        self.assertEqual(stats.changed, 1)
+        self.assertEqual(PriceObservation.objects.count(), observations + 1)
+
+    def test_batches_parsed_on_the_pool(self):
+        pool = ParsePool(2)
+        self.addCleanup(pool.shutdown)
+        batches = []
+        parse = pool.parse
+
+        def parse_batch(store, raw_items):
+            batches.append(len(raw_items))
+            return parse(store, raw_items)
+
+        with mock.patch.object(pool, "parse", side_effect=parse_batch):
+            stats = self.crawl(10, parse_pool=pool, parse_min_items=128)
+        # 64 item pages, written in batches of 128 and the 44 left at the end
+        self.assertEqual(batches, [128, 128])
+        self.assertEqual((stats.requests, stats.finished_queries), (5, 1))
+        self.assertEqual(stats.changed, Product.objects.count())
+        saved = CrawlCursor.objects.get(store="waitrose", query="milk")
+        self.assertEqual(saved.offset, 300)
+
+        # the pool's items hash like the plugin's, so nothing's changed
+        self.assertEqual(self.crawl(10, interval=0).changed, 0)
+
+    def test_content_hash(self):
+        item = plugins.get(Store.WAITROSE).item_class(raw_catalog("waitrose", 1)[0])
+        before = catalog.content_hash(item)
+        item.thumbnail = "elsewhere.jpg"
+        self.assertEqual(catalog.content_hash(item), before)
+        item.price = Price(item.price.amount + 1, item.price.curr)
+        self.assertNotEqual(catalog.content_hash(item), before)
+
+
+@override_settings(SHOPPING_PRICE_HISTORY_DIR=None)
+class WatchTests(TestCase):
+    def setUp(self):
+        items = [
+            plugins.get(Store.WAITROSE).item_class(r)
+            for r in raw_catalog("waitrose", 300)
+        ]
+        self.items = [item for item in items if not item.is_null]
+
+        item_list_filter = ItemListFilter()
+        f = item_list_filter.filters
+        f.description_filter = Filter.DescriptionFilter("milk")
+        f.description_filter.enable()
+        f.unit_price_filter = Filter.UnitPriceFilter(
+            UnitPrice(0, Currency.GBP, Unit.L), UnitPrice(2, Currency.GBP, Unit.L)
+        )
+        f.unit_price_filter.enable()
+        self.watch = Watch.objects.create(
+            name="cheap milk", filter_state=item_list_filter.to_state()
+        )
+        self.rule = self.watch.to_rule()
+
+    def expected(self, items):
+        from utils.watch import _Facts
+
+        return {item.product_id for item in items if self.rule.matches(_Facts.of(item))}
+
+    def alerted(self):
+        return set(WatchAlert.objects.values_list("product__product_id", flat=True))
+
+    def test_changed_products_alert(self):
+        catalog.ingest(self.items)
+        expected = self.expected(self.items)
+        self.assertTrue(expected)
+        self.assertEqual(self.alerted(), expected)
+
+        # nothing changed, nothing new
+        catalog.ingest(self.items)
+        self.assertEqual(WatchAlert.objects.count(), len(expected))
+
+        # a price cut on one of them alerts again
+        item = next(i for i in self.items if i.product_id in expected)
+        item.price = Price(item.price.amount - 0.01, item.price.curr)
+        catalog.ingest(self.items)
+        self.assertEqual(WatchAlert.objects.count(), len(expected) + 1)
+        self.assertEqual(
+            WatchAlert.objects.latest("id").product.product_id, item.product_id
+        )
+
+    def test_inactive_watches_ignored(self):
+        self.watch.active = False
+        self.watch.save()
+        catalog.ingest(self.items)
+        self.assertEqual(WatchAlert.objects.count(), 0)
+
+
+@override_settings(SHOPPING_PRICE_HISTORY_DIR=None)
+class BarcodeTests(TestCase):
+    def setUp(self):
+        self.asda = [
+            plugins.get(Store.ASDA).item_class(r) for r in raw_catalog("asda", 50)
+        ]
+        # waitrose's results have no barcodes, so give ten items asda's
+        raw_items = raw_catalog("waitrose", 30)
+        raw_items = [raw for raw in raw_items if "searchProduct" in raw][:10]
+        self.waitrose = [plugins.get(Store.WAITROSE).item_class(r) for r in raw_items]
+        for item, asda in zip(self.waitrose, self.asda):
+            item.barcodes = asda.barcodes
+
+    def test_compare_against_catalog(self):
+        catalog.ingest(self.asda)
+        self.assertEqual(Barcode.objects.count(), 50)
+        catalog.ingest(self.asda)
+        self.assertEqual(Barcode.objects.count(), 50)
+
+        comparisons = catalog.compare(self.waitrose)
+        self.assertEqual(len(comparisons), 10)
+        for comparison, item, asda in zip(comparisons, self.waitrose, self.asda):
+            self.assertIs(comparison.items[Store.WAITROSE], item)
+            self.assertEqual(comparison.items[Store.ASDA].product_id, asda.product_id)
+
+    def test_unchanged_products_get_new_barcodes(self):
+        barcodes = {item.product_id: item.barcodes for item in self.asda}
+        for item in self.asda:
+            item.barcodes = ()
+        catalog.ingest(self.asda)
+        self.assertEqual(Barcode.objects.count(), 0)
+
+        for item in self.asda:
+            item.barcodes = barcodes[item.product_id]
+        self.assertEqual(catalog.ingest(self.asda, only_changed=True), 0)
+        self.assertEqual(Barcode.objects.count(), 50)
+
+    def test_compare_view(self):
+        catalog.ingest(self.asda + self.waitrose)
+        response = self.client.get(
+            reverse("shopping:compare"), {"gtin": self.asda[0].barcodes[0]}
+        )
+        self.assertContains(response, self.waitrose[0].description)
+        self.assertContains(response, self.asda[0].description)
+
+
+@override_settings(SHOPPING_PRICE_HISTORY_DIR=None)
+class MatchTests(TestCase):
+    def item(self, store, product_id, description, price, quantity):
+        item = Item(description, Price(price, Currency.GBP), quantity)
+        item.store, item.product_id = store, product_id
+        return item
+
+    def setUp(self):
+        self.items = [
+            self.item(
+                Store.WAITROSE, "w1", "Quaker Oat So Simple", 2.5, Quantity(270, Unit.G)
+            ),
+            self.item(
+                Store.ASDA,
+                "a1",
+                "Quaker Oat So Simple Original",
+                2.0,
+                Quantity(270, Unit.G),
+            ),
+            # another size isn't the same product
+            self.item(
+                Store.ASDA,
+                "a2",
+                "Quaker Oat So Simple Original",
+                3.5,
+                Quantity(540, Unit.G),
+            ),
+            self.item(
+                Store.WAITROSE, "w2", "Heinz Baked Beans", 1.4, Quantity(415, Unit.G)
+            ),
+            self.item(
+                Store.ASDA,
+                "a3",
+                "Heinz Baked Beans In Tomato Sauce",
+                1.3,
+                Quantity(415, Unit.G),
+            ),
+        ]
+        catalog.ingest(self.items)
+
+    def test_groups_persist_and_signatures_are_reused(self):
+        self.assertEqual(matching.refresh_signatures(), 5)
+        self.assertEqual(matching.rebuild_groups(), 4)
+
+        groups = matching.cheapest()
+        self.assertEqual(
+            [[item.product_id for item in items] for items in groups],
+            [["a1", "w1"], ["a3", "w2"]],
+        )
+
+        # nothing changed, nothing signed again
+        self.assertEqual(matching.refresh_signatures(), 0)
+        self.items[0].price = Price(1.5, Currency.GBP)
+        catalog.ingest(self.items)
+        self.assertEqual(matching.refresh_signatures(), 1)
+        self.assertEqual(ProductMatch.objects.count(), 5)
+
+    def test_cheapest_view(self):
+        matching.refresh_signatures()
+        matching.rebuild_groups()
+        response = self.client.get(reverse("shopping:cheapest"))
+        self.assertContains(response, "Heinz Baked Beans In Tomato Sauce")
+
+    def test_merged_view_shows_each_product_once(self):
+        matching.refresh_signatures()
+        matching.rebuild_groups()
+        g = GlobalSession()
+        for s in g.s_list:
+            s._set_result([item for item in self.items if item.store == s.store])
+
+        with mock.patch("shopping.views.SESSIONS.get", return_value=g):
+            response = self.client.get(
+                reverse("shopping:merged"), {"sort_by": "lowest_price"}
+            )
+        # w1 and w2 are dearer than what they matched at asda
+        self.assertEqual(
+            [item.product_id for item in response.context["items"]],
+            ["a3", "a1", "a2"],
+        )
+        self.assertEqual(g.s_list[0].filter.sorter.sorter_type, SorterEnum.LOWEST_PRICE)
+
+    def test_merged_view_leaves_sort_alone(self):
+        g = GlobalSession()
+        for s in g.s_list:
+            s._set_result([item for item in self.items if item.store == s.store])
+        g.s_list[0].filter.sorter = Sorter(SorterEnum.HIGHEST_PRICE)
+
+        with mock.patch("shopping.views.SESSIONS.get", return_value=g):
+            response = self.client.get(reverse("shopping:merged"))
+        # merged by unit price, the stores sorted as they were
+        self.assertEqual(
+            [item.product_id for item in response.context["items"]],
+            ["a3", "w2", "a2", "a1", "w1"],
+        )
+        self.assertEqual(
+            [s.filter.sorter and s.filter.sorter.sorter_type for s in g.s_list],
+            [SorterEnum.HIGHEST_PRICE, None],
+        )
+
+
+@override_settings(
+    SHOPPING_PRICE_HISTORY_DIR=None,
+    SHOPPING_STORE_TERMS={
+        "asda": {"delivery": 3.0, "minimum": 0.0, "free_over": None},
+        "waitrose": {"delivery": 3.0, "minimum": 0.0, "free_over": 2.0},
+    },
+)
+class BasketTests(TestCase):
+    def item(self, store, product_id, description, price):
+        item = Item(description, Price(price, Currency.GBP), Quantity(500, Unit.G))
+        item.store, item.product_id = store, product_id
+        return item
+
+    def setUp(self):
+        self.oats = self.item(Store.ASDA, "a1", "Porridge Oats", 1.0)
+        self.oats_w = self.item(Store.WAITROSE, "w1", "Porridge Oats", 1.1)
+        self.oats_w.barcodes = self.oats.barcodes = ("5000168001142",)
+        catalog.ingest(
+            [
+                self.oats,
+                self.oats_w,
+                self.item(Store.ASDA, "a2", "Baked Beans", 0.9),
+                self.item(Store.WAITROSE, "w2", "Baked Beans", 0.7),
+            ]
+        )
+        self.g = GlobalSession()
+
+    def get(self, *args, **kwargs):
+        with mock.patch("shopping.views.SESSIONS.get", return_value=self.g):
+            return self.client.get(reverse("shopping:basket"), *args, **kwargs)
+
+    def test_list_is_split_across_stores(self):
+        self.assertEqual(
+            lists.parse("2 x oats\n\n beans \n7up"),
+            [
+                ("oats", 2),
+                ("beans", 1),
+                ("7up", 1),
+            ],
+        )
+
+        # waitrose's delivery is free over 2.00, so everything goes there
+        response = self.get({"list": "2 x oats\nbeans"})
+        basket = response.context["basket"]
+        self.assertEqual(list(basket.lines), [Store.WAITROSE])
+        self.assertAlmostEqual(basket.total.amount, 2.9)
+
+        with mock.patch("shopping.views.SESSIONS.get", return_value=self.g):
+            self.client.post(
+                reverse("shopping:basket"), {"list": "2 x oats", "use_basket": "1"}
+            )
+        cart = self.g.get_shop_session_by_store(Store.WAITROSE).cart
+        self.assertEqual(
+            [(i.description, i.pcs) for i in cart.items], [("Porridge Oats", 2)]
+        )
+
+    def test_carts_are_matched_to_other_stores(self):
+        line = lists.item_line(self.oats, 3)
+        self.assertEqual(set(line.items), {Store.ASDA, Store.WAITROSE})
+
+        self.g.get_shop_session_by_store(Store.ASDA).cart.add(self.oats, 1)
+        response = self.get()
+        self.assertEqual(list(response.context["basket"].lines), [Store.ASDA])
+
+
+class CompareListTests(SimpleTestCase):
+    def setUp(self):
+        from . import loadtest, views
+
+        self.stubs = loadtest.StubStores(n_items=50, latency=0.01)
+        self.stubs.start()
+        original_urls = {
+            store.value: plugins.get(store).search_request_class.URL for store in Store
+        }
+        views.use_store_urls(self.stubs.urls)
+        self.addCleanup(views.use_store_urls, original_urls)
+        self.addCleanup(self.stubs.stop)
+        self.addCleanup(lists.RESULTS.clear)
+        lists.RESULTS.clear()
+
+    def test_every_term_at_every_store(self):
+        terms = [f"term {i}" for i in range(40)]
+        with mock.patch.object(
+            self.stubs, "page", wraps=self.stubs.page
+        ) as page, mock.patch(
+            "shopping.views.close_async_client", wraps=close_async_client
+        ) as close:
+            response = self.client.get(
+                reverse("shopping:compare_list"), {"list": "\n".join(terms)}
+            )
+            table = response.json()
+            self.assertEqual(page.call_count, 40 * len(Store))
+            # the test client is wsgi, the request's loop took its client with it
+            close.assert_awaited_once()
+
+            # the same terms again are answered from the cache, posted or not
+            client = Client(enforce_csrf_checks=True)
+            response = client.post(
+                reverse("shopping:compare_list"), {"list": "2 x TERM 0\nterm 1 "}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(page.call_count, 40 * len(Store))
+
+        self.assertEqual(table["fields"], lists.FIELDS)
+        self.assertEqual(table["failed"], [])
+        self.assertEqual([row[0] for row in table["rows"]], terms)
+        for i, store in enumerate(table["stores"]):
+            plugin = plugins.get(Store(store))
+            items = [
+                plugin.item_class(raw)
+                for raw in self.stubs.catalogs[store][: lists.CANDIDATES]
+            ]
+            best = lists.best([item for item in items if not item.is_null])
+            self.assertEqual(table["rows"][0][i + 1][0], best.product_id)
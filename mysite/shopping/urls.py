@@ -1,10 +1,20 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 
 app_name = "shopping"
 urlpatterns = [
-    path("", views.home, name="home"),
+    path("", views.ahome if settings.ASYNC_VIEWS else views.home, name="home"),
+    path("compare/", views.compare, name="compare"),
+    path("compare/list/", views.compare_list, name="compare_list"),
+    path("cheapest/", views.cheapest, name="cheapest"),
+    path("merged/", views.merged, name="merged"),
+    path("basket/", views.basket_view, name="basket"),
+    path("metrics", views.metrics_view, name="metrics"),
+    path("profiles/", views.profiles, name="profiles"),
+    path("allocations/", views.allocations_view, name="allocations"),
+    path("profiles/<str:name>", views.profile_file, name="profile_file"),
     # path("add_to_cart/<slug:item_identifier>", views.add_to_cart, name="add_to_cart"),
     # path(
     #     "remove_from_cart/<slug:item_identifier>",
@@ -12,3 +22,9 @@ urlpatterns = [
     #     name="remove_from_cart",
     # ),
 ]
+
+# the stream's body is a sync generator that waits on the stores, which an ASGI
+# server would run on its event loop and so hold up every other request. async
+# streaming needs django 4.2, until then ASGI searches load the page as usual
+if not settings.ASYNC_VIEWS:
+    urlpatterns.append(path("stream/", views.stream, name="stream"))
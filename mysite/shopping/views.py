@@ -1,14 +1,32 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.urls import reverse
-from django.http import HttpResponse, HttpResponseRedirect
-
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.template.loader import render_to_string
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+
+import asyncio
+import functools
+import json
+import random
+from contextlib import ExitStack, nullcontext
+from array import array
 from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from itertools import islice
 
 import utils.main
 
 from utils.main import (
     Item,
-    WaitroseItem,
     Price,
     Currency,
     Unit,
@@ -19,20 +37,56 @@ from utils.main import (
 
 from utils.main import Store
 
-from utils.main import WaitroseRequest, WaitroseItem
-from utils.main import AsdaRequest, AsdaItem
-
 from utils.main import ItemListFilter, SearchResult
 
-from utils.search import Sorter, SorterEnum, Filter, SearchEnum
+from utils.search import Sorter, SorterEnum, Filter, merge_results
+from utils.searchrequest import SearchCursor
+
+from utils import plugins
+
+from . import catalog, lists, matching
+from .sessions import SessionRegistry, estimate_size
+from .sharedstate import SharedStateStore
+
+from utils.httpclient import close_async_client
+from utils.log import get_logger
+from utils import allocations, barcodes, basket, metrics, parsing, profiling, tracing
+
+logger = get_logger("views")
+
+
+def use_store_urls(urls: dict[str, str]):
+    # points each store's plugin at another api url, keyed by store value
+    for store_value, url in urls.items():
+        plugins.get(Store(store_value)).search_request_class.URL = url
+
+
+use_store_urls(settings.SHOPPING_STORE_URLS)
+
 
-import utils.plugins.waitrose
-import utils.plugins.asda
+# background fetching of the deeper result pages
+PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
 
+# stores are searched side by side so a slow store doesn't hold up the others
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
 
-utils.plugins.asda.register()
+# searched items go into the catalog one batch at a time, sqlite has one writer
+CATALOG_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog")
 
-utils.plugins.waitrose.register()
+# big pages are parsed on every core, see utils/parsing.py
+PARSE_POOL = (
+    parsing.ParsePool(settings.SHOPPING_PARSE_WORKERS)
+    if settings.SHOPPING_PARSE_WORKERS
+    else None
+)
+
+
+def ingest_quietly(items: list[Item]):
+    # in the background, a failure only costs the catalog its freshness
+    try:
+        catalog.ingest(items)
+    except Exception as e:
+        logger.warning("catalog ingest failed", exc_info=e)
 
 
 # should perhaps store this in the store enum...
@@ -50,10 +104,6 @@ class CartItem:
     def __init__(self, item_obj: Item, pcs: int = 0) -> None:
         self.item_obj = item_obj
         self.pcs = pcs
-        self.__post_init__()
-
-    def __post_init__(self):
-        print(f"self.identifier={self.identfier}")
 
     @property
     def total_value(self):
@@ -90,24 +140,81 @@ class CartItem:
     @property
     def identfier(self):
         # be aware that this doesn't actuall work in DTL
-        print(f"getting item object id={self.item_obj.identifier}")
         return self.item_obj.identifier
 
 
-@dataclass
 class Cart:
-    items: list[CartItem] = field(default_factory=list)
+    """cart items indexed by item identifier, with a running total per currency
+    so adds, removes and the total don't depend on the size of the cart"""
+
+    def __init__(self, items: list[CartItem] = None):
+        self._by_id: dict[str, CartItem] = {}
+        self._totals: dict[Currency, float] = {}
+        # cart items per currency, a currency's total is dropped with its last item
+        self._n_by_currency: dict[Currency, int] = {}
+
+        for cart_item in items or []:
+            self.add(cart_item.item_obj, cart_item.pcs)
+
+    @property
+    def items(self) -> list[CartItem]:
+        return list(self._by_id.values())
 
     @property
     def total_value(self) -> Price:
-        return sum(i.total_value for i in self.items)
+        if not self._totals:
+            return 0
+        return sum(Price(amount, curr) for curr, amount in self._totals.items())
 
     @property
     def n_items(self):
-        return len(self.items)
+        return len(self._by_id)
+
+    def get(self, item_identifier: str) -> CartItem:
+        return self._by_id.get(item_identifier)
+
+    def add(self, item: Item, pcs: int = 1):
+        key = str(item.identifier)
+        cart_item = self._by_id.get(key)
+        if cart_item is None:
+            cart_item = self._by_id[key] = CartItem(item, pcs=0)
+            curr = item.price.curr
+            self._n_by_currency[curr] = self._n_by_currency.get(curr, 0) + 1
+
+        cart_item.pcs += pcs
+        self._add_to_total(item.price, pcs)
+
+    def remove(self, item_identifier: str, pcs: int = 1):
+        cart_item = self._by_id.get(item_identifier)
+        if cart_item is None:
+            return
+
+        pcs = min(pcs, cart_item.pcs)
+        cart_item.pcs -= pcs
+        self._add_to_total(cart_item.price, -pcs)
+
+        if cart_item.pcs <= 0:
+            del self._by_id[item_identifier]
+            curr = cart_item.price.curr
+            self._n_by_currency[curr] -= 1
+            if self._n_by_currency[curr] == 0:
+                del self._n_by_currency[curr]
+                del self._totals[curr]
+
+    def _add_to_total(self, price: Price, pcs: int):
+        self._totals[price.curr] = self._totals.get(price.curr, 0) + price.amount * pcs
 
     def clear_items(self):
-        self.items = []
+        self._by_id = {}
+        self._totals = {}
+        self._n_by_currency = {}
+
+    def to_state(self) -> list:
+        return [(i.item_obj.to_record(), i.pcs) for i in self.items]
+
+    @classmethod
+    def from_state(cls, state: list) -> "Cart":
+        return cls([CartItem(Item.from_record(record), pcs) for record, pcs in state])
 
 
 # @dataclass
@@ -115,10 +222,20 @@ class ShopSession:
     def __init__(self, store: Store):
         self.store: Store = store
         self.query: str = ""
-        self.max_items: int = 5
+        # total depth fetched per search, only the first page is waited on
+        self.max_items: int = settings.SHOPPING_MAX_ITEMS
+        self.page_size: int = 24
         self.items: list[Item] = []
 
         self.search_result: SearchResult = SearchResult([])
+        self.cursor: SearchCursor = None
+        # the result came from the local catalog rather than the store
+        self.offline: bool = False
+        self._prefetch: Future = None
+        # estimated bytes of each item in search_result.initial_list
+        self._item_bytes: list[int] = []
+        # raw items consumed into search_result, may trail cursor.offset while prefetching
+        self._merged_offset: int = 0
         self.cart: Cart = Cart()
 
         # self.unit_type_filter = Filter.UnitTypeFilter(
@@ -144,57 +261,268 @@ class ShopSession:
         return self.cart.items
 
     @property
-    def item_list_displayed(self):
-        self.search_result.filter_and_sort(self.filter)
-        # slightly dodgey
-        return self.search_result._sorted_and_filtered_list
+    def has_more(self):
+        return self.cursor is not None and self.cursor.has_more
 
-    def add_item_to_cart_by_id(self, item_identifier: str):
-        filter_result = list(
-            filter(
-                lambda x: str(x.identifier) == item_identifier,
-                self.search_result.initial_list,
-            )
+    @property
+    def total_items(self):
+        if self.cursor is None:
+            return len(self.search_result.initial_list)
+        return self.cursor.depth
+
+    def _to_items(self, raw_items: list) -> list[Item]:
+        with metrics.stage("parse", self.store.value, n_items=len(raw_items)):
+            if PARSE_POOL and len(raw_items) >= settings.SHOPPING_PARSE_MIN_ITEMS:
+                items = PARSE_POOL.parse(self.store, raw_items)
+            else:
+                item_class = plugins.get(self.store).item_class
+                items = [item_class(raw_item) for raw_item in raw_items]
+        items = [item for item in items if not item.is_null]
+        if settings.SHOPPING_CATALOG_INGEST:
+            CATALOG_EXECUTOR.submit(ingest_quietly, items)
+        return items
+
+    def _set_result(self, items: list[Item]):
+        self.search_result = SearchResult(items)
+        self._item_bytes = [estimate_size(item) for item in items]
+
+    def _extend_result(self, items: list[Item]):
+        self.search_result.extend(items)
+        self._item_bytes += [estimate_size(item) for item in items]
+
+    def estimated_bytes(self) -> int:
+        # items, plus a pointer per item for each of the result's lists
+        n_items = len(self._item_bytes)
+        result_bytes = sum(self._item_bytes) + 3 * 8 * n_items
+        if n_items == 0:
+            return result_bytes
+        return result_bytes + self.cart.n_items * (result_bytes // n_items)
+
+    def trim_to(self, n_bytes: int):
+        """stops deepening the search, then drops the deepest items until the
+        search result fits in n_bytes"""
+        self.close()
+        self.cursor = None
+
+        total = 0
+        for n_kept, item_bytes in enumerate(self._item_bytes):
+            total += item_bytes + 3 * 8
+            if total > n_bytes:
+                self.search_result.truncate(n_kept)
+                self._item_bytes = self._item_bytes[:n_kept]
+                return
+
+    def close(self):
+        # drops any page still being fetched
+        if isinstance(self._prefetch, asyncio.Future):
+            # a task is only safe to cancel from its loop's thread
+            self._prefetch.get_loop().call_soon_threadsafe(self._prefetch.cancel)
+        elif self._prefetch is not None:
+            self._prefetch.cancel()
+        self._prefetch = None
+
+    def to_state(self) -> tuple:
+        """compact, picklable state for the shared store. a page still being
+        prefetched isn't included, whoever loads the state fetches it again"""
+        cursor_state = None
+        if self.cursor is not None:
+            cursor_state = (self._merged_offset, self.cursor.total_items)
+        return (
+            self.store.value,
+            self.query,
+            self.max_items,
+            self.page_size,
+            self.search_result.to_state(),
+            array("I", self._item_bytes).tobytes(),
+            cursor_state,
+            self.cart.to_state(),
+            self.filter.to_state(),
+            self.offline,
         )
-        if len(filter_result) == 1:
 
-            item = filter_result[0]
+    @classmethod
+    def from_state(cls, state: tuple) -> "ShopSession":
+        (
+            store,
+            query,
+            max_items,
+            page_size,
+            search_result,
+            item_bytes,
+            cursor_state,
+            cart,
+            item_list_filter,
+            offline,
+        ) = state
+
+        s = cls(Store(store))
+        s.query = query
+        s.max_items = max_items
+        s.page_size = page_size
+        s.search_result = SearchResult.from_state(search_result)
+        s._item_bytes = array("I", item_bytes).tolist()
+        s.cart = Cart.from_state(cart)
+        s.filter = ItemListFilter.from_state(item_list_filter)
+        s.offline = offline
+
+        # pick the search back up where the state was saved
+        if cursor_state is not None:
+            request = plugins.get(s.store).search_request_class(
+                query, max_items=max_items, lazy=True
+            )
+            s.cursor = request.cursor(page_size=page_size)
+            s.cursor.offset, s.cursor.total_items = cursor_state
+            s._merged_offset = s.cursor.offset
+        return s
 
-            # crudely ignore doubling adds to cart
-            if item not in [cart_item.item_obj for cart_item in self.cart_items]:
-                print(f"adding id={item_identifier} to cart")
-                self.cart_items.append(CartItem(item, pcs=1))
+    def _start_search(self, query: str):
+        self.query = query
 
-            else:
-                filter_result = list(
-                    filter(
-                        lambda cart_item: str(cart_item.item_obj.identifier)
-                        == item_identifier,
-                        self.cart_items,
-                    )
-                )
-                if len(filter_result) > 0:
-                    cart_item = filter_result[0]
-                    cart_item.pcs += 1
+        # drop any page still being fetched for the previous query
+        self.close()
 
-    def remove_item_from_cart_by_id(self, item_identifier: str):
-        # make sure to get the uuid as a string
-        filter_result = list(
-            filter(
-                lambda x: str(x.item_obj.identifier) == item_identifier, self.cart_items
-            )
+        request = plugins.get(self.store).search_request_class(
+            query, max_items=self.max_items, lazy=True
         )
+        self.cursor = request.cursor(page_size=self.page_size)
+        self.offline = False
+
+    def search_catalog(self, query: str):
+        """answers query from the local catalog, the store isn't asked"""
+        self.query = query
+        self.close()
+        self.cursor = None
+        self.offline = True
+        self.query_catalog()
+
+    def query_catalog(self):
+        # the filters and sort are done in the query, so it's rerun when they change
+        with metrics.stage("catalog", self.store.value):
+            self.search_result = catalog.text_search(
+                self.query, self.filter, stores=[self.store], limit=self.max_items
+            )
+        self._item_bytes = [
+            estimate_size(item) for item in self.search_result.initial_list
+        ]
+
+    def search(self, query: str):
+        """fetches the first page of results for query, deeper pages follow in the background"""
+        self._start_search(query)
+        self._set_result(self._to_items(self.cursor.fetch_next()))
+        self._merged_offset = self.cursor.offset
+        self.prefetch_next_page()
+
+    async def asearch(self, query: str):
+        """async search, the first page is awaited on the running loop"""
+        self._start_search(query)
+        raw_items = await self.cursor.afetch_next()
+        self._set_result(self._to_items(raw_items))
+        self._merged_offset = self.cursor.offset
+        self.aprefetch_next_page()
+
+    def prefetch_next_page(self):
+        if self.has_more and self._prefetch is None:
+            self._prefetch = PREFETCH_EXECUTOR.submit(
+                tracing.propagate(self.cursor.fetch_next)
+            )
 
-        if len(filter_result) > 0:
+    def aprefetch_next_page(self):
+        # the async views' prefetch, a task on the running loop rather than a thread
+        if self.has_more and self._prefetch is None:
+            self._prefetch = asyncio.create_task(self.cursor.afetch_next())
+
+    def merge_prefetched(self, wait: bool = False):
+        """merges a page fetched in the background into the search result,
+        then starts fetching the next one"""
+        if self._prefetch is None:
+            return
+        if not self._prefetch.done():
+            if not wait:
+                return
+            metrics.CACHE_MISSES.inc(self.store.value)
+        else:
+            metrics.CACHE_HITS.inc(self.store.value)
+
+        future, self._prefetch = self._prefetch, None
+        if future.cancelled():
+            # its loop closed before it was done, the cursor hasn't moved so
+            # it's just fetched again
+            self._prefetch_after(future)
+            return
+        try:
+            raw_items = future.result()
+        except Exception as e:
+            # keep what we have and stop deepening this search
+            logger.warning(
+                "prefetch failed", extra={"store": self.store.value}, exc_info=e
+            )
+            self.cursor = None
+            return
+
+        self._extend_result(self._to_items(raw_items))
+        self._merged_offset = self.cursor.offset
+        self._prefetch_after(future)
+
+    def _prefetch_after(self, future):
+        # the next page the same way, a task if this was one. a sync view
+        # has no loop to make one on, so it goes on the loop this one was on,
+        # or to a thread if that's stopped
+        if not isinstance(future, asyncio.Future):
+            self.prefetch_next_page()
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            loop = future.get_loop()
+        else:
+            self.aprefetch_next_page()
+            return
+        if not loop.is_running():
+            self.prefetch_next_page()
+            return
+
+        async def aprefetch():
+            self.aprefetch_next_page()
+
+        # only a moment's wait, for the loop to make the task
+        asyncio.run_coroutine_threadsafe(aprefetch(), loop).result()
+
+    def load_more(self):
+        # paging, wait for the next page if it hasn't arrived yet
+        self.prefetch_next_page()
+        self.merge_prefetched(wait=True)
+
+    async def aload_more(self):
+        # async load_more, waits for the background page without blocking the loop
+        self.aprefetch_next_page()
+        future = self._prefetch
+        if future is None:
+            return
+        await asyncio.wait([asyncio.wrap_future(future)])
+        if self._prefetch is future:
+            self.merge_prefetched()
 
-            item = filter_result[0]
+    @property
+    def item_list_displayed(self):
+        self.search_result.filter_and_sort(self.filter, store=self.store.value)
+        # slightly dodgey
+        return self.search_result._sorted_and_filtered_list
 
-            # crudely ignore doubling adds to cart
-            if item in self.cart_items:
-                if item.pcs > 1:
-                    item.pcs -= 1
-                else:
-                    self.cart_items.remove(item)
+    def add_item_to_cart_by_id(self, item_identifier: str):
+        # items already in the cart can be added to even once they've left the results
+        cart_item = self.cart.get(item_identifier)
+        if cart_item is not None:
+            self.cart.add(cart_item.item_obj)
+            return
+
+        item = self.search_result.get_by_id(item_identifier)
+        if item is not None:
+            logger.debug("adding item to cart", extra={"item_id": item_identifier})
+            self.cart.add(item)
+
+    def remove_item_from_cart_by_id(self, item_identifier: str):
+        # make sure to get the uuid as a string
+        self.cart.remove(item_identifier)
 
 
 class GlobalSession:
@@ -212,6 +540,27 @@ class GlobalSession:
     def get_shop_session_by_store(self, store: Store) -> ShopSession:
         return list(filter(lambda x: x.store == store, self.shop_sessions))[0]
 
+    def estimated_bytes(self) -> int:
+        return sum(s.estimated_bytes() for s in self.shop_sessions)
+
+    def trim_to(self, n_bytes: int):
+        # each store gets an equal share of the budget
+        for s in self.shop_sessions:
+            s.trim_to(n_bytes // len(self.shop_sessions))
+
+    def close(self):
+        for s in self.shop_sessions:
+            s.close()
+
+    def to_state(self) -> tuple:
+        return tuple(s.to_state() for s in self.shop_sessions)
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "GlobalSession":
+        g = cls()
+        g.shop_sessions = [ShopSession.from_state(x) for x in state]
+        return g
+
 
 # hacky price converter to display in templates
 def to_nzd(obj: Price):
@@ -221,96 +570,668 @@ def to_nzd(obj: Price):
 setattr(Price, "to_nzd", to_nzd)
 
 
-g = GlobalSession()
+# one GlobalSession per visitor, keyed by their django session and shared
+# between worker processes through the state database
+SESSIONS = SessionRegistry(
+    factory=GlobalSession,
+    session_budget=settings.SHOPPING_SESSION_BUDGET_BYTES,
+    total_budget=settings.SHOPPING_SESSIONS_TOTAL_BYTES,
+    idle_timeout=settings.SHOPPING_SESSION_IDLE_SECONDS,
+    shared_store=(
+        SharedStateStore(settings.SHOPPING_STATE_DB)
+        if settings.SHOPPING_STATE_DB
+        else None
+    ),
+)
+
+
+def get_session_key(request) -> str:
+    # makes sure the visitor has a django session to key their state on
+    if request.session.session_key is None:
+        request.session.save()
+    return request.session.session_key
+
+
+# items asked of a store to refresh the catalog with, after a catalog search
+REFRESH_ITEMS = 128
+
+
+def refresh_catalog(store: Store, query: str):
+    # a live page of query's results, only to keep the catalog fresh
+    try:
+        request = plugins.get(store).search_request_class(
+            query, max_items=REFRESH_ITEMS, lazy=True
+        )
+        raw_items, _ = request.fetch_page(start=0, size=REFRESH_ITEMS)
+        items = [plugins.get(store).item_class(raw_item) for raw_item in raw_items]
+    except Exception as e:
+        logger.warning(
+            "catalog refresh failed", extra={"store": store.value}, exc_info=e
+        )
+        return
+    CATALOG_EXECUTOR.submit(ingest_quietly, [i for i in items if not i.is_null])
+
+
+def _search_failed(s: ShopSession, e: Exception) -> bool:
+    # whether to answer from the catalog instead
+    if settings.SHOPPING_SEARCH_BACKEND != "fallback":
+        return False
+    logger.warning(
+        "search failed, answering from the catalog",
+        extra={"store": s.store.value},
+        exc_info=e,
+    )
+    return True
+
+
+def search_store(s: ShopSession, query: str):
+    """searches one store, or the catalog, as SHOPPING_SEARCH_BACKEND says"""
+    if settings.SHOPPING_SEARCH_BACKEND == "catalog":
+        s.search_catalog(query)
+        if settings.SHOPPING_CATALOG_REFRESH:
+            PREFETCH_EXECUTOR.submit(refresh_catalog, s.store, query)
+        return
+    try:
+        s.search(query)
+    except Exception as e:
+        if not _search_failed(s, e):
+            raise
+        s.search_catalog(query)
+
+
+async def asearch_store(s: ShopSession, query: str):
+    """async search_store, the catalog is sync so it's queried in a thread"""
+    if settings.SHOPPING_SEARCH_BACKEND == "catalog":
+        await sync_to_async(search_store)(s, query)
+        return
+    try:
+        await s.asearch(query)
+    except Exception as e:
+        if not _search_failed(s, e):
+            raise
+        await sync_to_async(s.search_catalog)(query)
+
+
+def search_all_stores(g: GlobalSession, query: str) -> dict[Future, ShopSession]:
+    # starts a search on every store, returns the futures mapped to their sessions
+    return {
+        SEARCH_EXECUTOR.submit(
+            profiling.propagate(tracing.propagate(search_store)), s, query
+        ): s
+        for s in g.s_list
+    }
+
+
+def handle_post(request, g: GlobalSession):
+    # applies the cart, sort and filter buttons to the shop sessions
+
+    if "add_to_cart" in request.POST:
+        val: str = request.POST.get("add_to_cart")
+        store_value, item_id = val.split("_")
+
+        s = g.get_shop_session_by_store(Store(store_value))
+
+        s.add_item_to_cart_by_id(item_id)
+
+        # s.add_item_to_cart_by_id(request.POST.get("add_to_cart"))
+
+    if "remove_from_cart" in request.POST:
+        val: str = request.POST.get("remove_from_cart")
+        store_value, item_id = val.split("_")
+
+        s = g.get_shop_session_by_store(Store(store_value))
+        s.remove_item_from_cart_by_id(item_id)
+
+    if "sort_by" in request.POST:
+        for s in g.s_list:
+            s.filter.sorter = Sorter(SorterEnum(request.POST.get("sort_by")))
+
+    if "filter_by" in request.POST:
+        filter_by_val = request.POST.get("filter_by")
+
+        for s in g.s_list:
+            # print(f"UnitType(filter_by_val)={UnitType(filter_by_val)}")
+            # s.unit_type_filter.toggle_unit_type_accept_list(UnitType(filter_by_val))
+
+            s.filter.filters.unit_type_filter.toggle_unit_type_accept_list(
+                UnitType(filter_by_val)
+            )
+            logger.debug(
+                "unit type filter toggled",
+                extra={
+                    "store": s.store.value,
+                    "unit_type": filter_by_val,
+                    "accepted": s.filter.filters.unit_type_filter.unit_type_accept_list,
+                },
+            )
+
+    if "clear_filters" in request.POST:
+        for s in g.s_list:
+            s.filter.clear_filters()
+        # s.filter.clear_filters()
+        pass
+
+    if "clear_cart" in request.POST:
+        val = request.POST.get("clear_cart")
+        g.get_shop_session_by_store(Store(val)).cart.clear_items()
+
+
+def requery_catalog(request, g: GlobalSession):
+    # results from the catalog were filtered and sorted in sql, so ask again
+    # when a post changes the filters or sort
+    if {"sort_by", "filter_by", "clear_filters"} & set(request.POST):
+        for s in g.s_list:
+            if s.offline:
+                s.query_catalog()
+
+
+def render_home(request, g: GlobalSession):
+    # pick up any pages which have arrived in the background since the last request
+    for s in g.s_list:
+        s.merge_prefetched()
+
+    context = {
+        "g": g,
+    }
+
+    with metrics.stage("render"):
+        return render(
+            request=request,
+            template_name="shopping/home.html",
+            context=context,
+        )
+
+
+def trace_request(request):
+    """records a trace of the request when it has the trace header, or when it's
+    sampled, otherwise does nothing"""
+    if request.headers.get(settings.SHOPPING_TRACE_HEADER) or (
+        random.random() < settings.SHOPPING_TRACE_SAMPLE_RATE
+    ):
+        return tracing.trace(request.method.lower(), settings.SHOPPING_TRACE_DIR)
+    return nullcontext()
 
 
+class _TimedStream:
+    # a streamed response's content, timing ends when it's all sent or the
+    # response is closed, django closes it even if it was never sent
+    def __init__(self, content, timing: ExitStack):
+        self.content = iter(content)
+        self.timing = timing
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.content)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        self.timing.close()
+
+
+def timed(view):
+    # times the whole view into the "request" stage, sync or async
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def timed_view(request, *args, **kwargs):
+            with trace_request(request), metrics.stage("request"):
+                return await view(request, *args, **kwargs)
+
+    else:
+
+        @functools.wraps(view)
+        def timed_view(request, *args, **kwargs):
+            with ExitStack() as timing:
+                timing.enter_context(trace_request(request))
+                timing.enter_context(metrics.stage("request"))
+                response = view(request, *args, **kwargs)
+                if response.streaming:
+                    # the work goes on while it's sent, so time until it's all sent
+                    response.streaming_content = _TimedStream(
+                        response.streaming_content, timing.pop_all()
+                    )
+                return response
+
+    return timed_view
+
+
+def profile_request(request):
+    """profiles the request when asked to with ?profile or the profile header.
+    ?profile=flame samples every thread's stack into a collapsed stack file,
+    anything else runs the request under cProfile, the store searches it hands
+    to threads included"""
+    kind = request.GET.get(
+        "profile", request.headers.get(settings.SHOPPING_PROFILE_HEADER)
+    )
+    if kind is None:
+        return nullcontext()
+    if kind == "flame":
+        return profiling.sampled(settings.SHOPPING_PROFILE_DIR, request.method.lower())
+    return profiling.cprofile(settings.SHOPPING_PROFILE_DIR, request.method.lower())
+
+
+def profiled(view):
+    # debug only, otherwise the view is left as it is and costs nothing
+    if not settings.DEBUG:
+        return view
+
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def profiled_view(request, *args, **kwargs):
+            with profile_request(request):
+                return await view(request, *args, **kwargs)
+
+    else:
+
+        @functools.wraps(view)
+        def profiled_view(request, *args, **kwargs):
+            with profile_request(request):
+                return view(request, *args, **kwargs)
+
+    return profiled_view
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@timed
+def stream(request):
+    """server-sent events endpoint, pushes each store's rendered result
+    container as soon as that store's search is done. only routed under WSGI,
+    see urls.py"""
+    key = get_session_key(request)
+    g = SESSIONS.get(key)
+    futures = search_all_stores(g, request.GET.get("q", ""))
+
+    def events():
+        for future in as_completed(futures):
+            s = futures[future]
+            error = future.exception() is not None
+            if error:
+                logger.warning(
+                    "search failed",
+                    extra={"store": s.store.value},
+                    exc_info=future.exception(),
+                )
+
+            with metrics.stage("render", s.store.value):
+                html = render_to_string(
+                    "shopping/result_container.html",
+                    context={"s": s, "error": error},
+                    request=request,
+                )
+            yield _sse_event("store", {"store": s.store.value, "html": html})
+
+        SESSIONS.update(key)
+        yield _sse_event("done", {})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # stop proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@profiled
+@timed
 def home(request):
 
-    # for s in g.s_list:
+    key = get_session_key(request)
+    g = SESSIONS.get(key)
 
     if request.method == "GET":
 
-        print(request.GET)
+        logger.debug("GET %s", request.GET)
 
         # handle a search query
         if "q" in request.GET:
 
-            for s in g.s_list:
+            for future in search_all_stores(g, request.GET.get("q")):
+                future.result()
+
+    if request.method == "POST":
+        # just the keys, the values hold the csrf token
+        logger.debug("POST %s", request.POST.keys())
+
+        handle_post(request, g)
+        requery_catalog(request, g)
+
+        if "load_more" in request.POST:
+            val = request.POST.get("load_more")
+            g.get_shop_session_by_store(Store(val)).load_more()
+
+    # sessions loaded from the shared store start prefetching again here
+    for s in g.s_list:
+        s.prefetch_next_page()
+
+    response = render_home(request, g)
+    SESSIONS.update(key)
+    return response
+
+
+@profiled
+@timed
+async def ahome(request):
+    """async home for ASGI, the upstream waits don't hold a worker thread"""
 
-                # save the search query
-                s.query = request.GET.get("q")
+    # the session backend and the shared state store are sync
+    key = await sync_to_async(get_session_key)(request)
+    g = await sync_to_async(SESSIONS.get)(key)
 
-                items = [
-                    SearchEnum(s.store).item_class(item)
-                    for item in SearchEnum(s.store)
-                    .search_request_class(s.query, max_items=s.max_items)
-                    .get_items_as_list()
-                ]
+    if request.method == "GET":
 
-                items = [item for item in items if not item.is_null]
+        logger.debug("GET %s", request.GET)
 
-                s.search_result = SearchResult(items)
+        # handle a search query
+        if "q" in request.GET:
+            query = request.GET.get("q")
+            await asyncio.gather(*(asearch_store(s, query) for s in g.s_list))
 
     if request.method == "POST":
-        print(request.POST)
+        # just the keys, the values hold the csrf token
+        logger.debug("POST %s", request.POST.keys())
 
-        if "add_to_cart" in request.POST:
-            val: str = request.POST.get("add_to_cart")
-            store_value, item_id = val.split("_")
+        handle_post(request, g)
+        if any(s.offline for s in g.s_list):
+            await sync_to_async(requery_catalog)(request, g)
 
-            s = g.get_shop_session_by_store(Store(store_value))
+        if "load_more" in request.POST:
+            val = request.POST.get("load_more")
+            await g.get_shop_session_by_store(Store(val)).aload_more()
 
-            s.add_item_to_cart_by_id(item_id)
+    # sessions loaded from the shared store start prefetching again here
+    for s in g.s_list:
+        s.aprefetch_next_page()
 
-            # s.add_item_to_cart_by_id(request.POST.get("add_to_cart"))
+    response = render_home(request, g)
+    await sync_to_async(SESSIONS.update)(key)
+    return response
 
-        if "remove_from_cart" in request.POST:
-            val: str = request.POST.get("remove_from_cart")
-            store_value, item_id = val.split("_")
 
-            s = g.get_shop_session_by_store(Store(store_value))
-            s.remove_item_from_cart_by_id(request.POST.get("remove_from_cart"))
+def compare(request):
+    """the visitor's results which are at more than one store, side by side,
+    matched by barcode. ?gtin= shows that one product at every store"""
+    if "gtin" in request.GET:
+        gtin = barcodes.normalize(request.GET["gtin"])
+        index = catalog.barcode_index([gtin] if gtin else [])
+        comparisons = [barcodes.Comparison(gtin, index.get(gtin))] if len(index) else []
+    else:
+        g = SESSIONS.get(get_session_key(request))
+        items = [item for s in g.s_list for item in s.item_list_displayed]
+        comparisons = catalog.compare(items)
 
-        if "sort_by" in request.POST:
-            for s in g.s_list:
-                s.filter.sorter = Sorter(SorterEnum(request.POST.get("sort_by")))
+    return render(
+        request=request,
+        template_name="shopping/compare.html",
+        context={"comparisons": comparisons, "stores": list(Store)},
+    )
 
-        if "filter_by" in request.POST:
-            filter_by_val = request.POST.get("filter_by")
 
-            for s in g.s_list:
-                # print(f"UnitType(filter_by_val)={UnitType(filter_by_val)}")
-                # s.unit_type_filter.toggle_unit_type_accept_list(UnitType(filter_by_val))
+def cheapest(request):
+    """the same product at several stores, across the whole catalog, with the
+    biggest differences in price first. the groups are made by the match
+    command"""
+    return render(
+        request=request,
+        template_name="shopping/cheapest.html",
+        context={"groups": matching.cheapest(limit=200)},
+    )
 
-                print(f"filter-object-before-click={s.filter.filters.unit_type_filter}")
-                print(f"clicked={UnitType(filter_by_val)}")
 
-                s.filter.filters.unit_type_filter.toggle_unit_type_accept_list(
-                    UnitType(filter_by_val)
-                )
-                print(
-                    f"store={s.store} unittypes_accepted={s.filter.filters.unit_type_filter.unit_type_accept_list}"
-                )
+MERGED_ITEMS = 100
 
-        if "clear_filters" in request.POST:
-            for s in g.s_list:
-                s.filter.clear_filters()
-            # s.filter.clear_filters()
-            pass
 
-        if "clear_cart" in request.POST:
-            val = request.POST.get("clear_cart")
-            g.get_shop_session_by_store(Store(val)).cart.clear_items()
+def merged(request):
+    """every store's results as one list, e.g. cheapest per kg anywhere. each
+    store's already sorted results are merged rather than sorted together, and
+    the same product at another store, by barcode or match group, is only
+    shown the first time. ?sort_by= sorts every store, as the buttons on home
+    do, otherwise stores sorted differently are merged by unit price without
+    changing their sort. ?n= is how many to show"""
+    key = get_session_key(request)
+    g = SESSIONS.get(key)
 
-    else:
-        pass
+    sort_by = request.GET.get("sort_by")
+    if sort_by in {e.value for e in SorterEnum}:
+        for s in g.s_list:
+            s.filter.sorter = Sorter(SorterEnum(sort_by))
+            if s.offline:
+                s.query_catalog()
 
-    context = {
-        "g": g,
+    # the stores have to be sorted the same way to be merged. when they
+    # aren't, copies are sorted here and the visitor's sort is left alone
+    current = {
+        s.filter.sorter.sorter_type if s.filter.sorter else None for s in g.s_list
     }
+    if len(current) == 1 and None not in current:
+        sorter, resort = g.s_list[0].filter.sorter, False
+    else:
+        sorter, resort = Sorter(SorterEnum.LOWEST_UNIT_PRICE), True
+
+    n = request.GET.get("n", "")
+    n = min(int(n), settings.SHOPPING_MAX_ITEMS) if n.isdigit() else MERGED_ITEMS
+    # each item shown skips at most one copy per other store, so only the
+    # first n * stores of each store's results can ever be reached
+    depth = n * len(g.s_list)
+    sorted_lists = []
+    for s in g.s_list:
+        s.merge_prefetched()
+        displayed = s.item_list_displayed
+        if resort:
+            displayed = sorted(displayed, key=sorter.sort_key)
+        sorted_lists.append(displayed[:depth])
+
+    groups = matching.groups_of([item for items in sorted_lists for item in items])
+
+    def keys(item: Item) -> list:
+        group = groups.get((item.store.value, item.product_id))
+        return barcodes.gtins(item) + ([group] if group is not None else [])
+
+    items = list(islice(merge_results(sorted_lists, sorter, keys), n))
+    SESSIONS.update(key)
+
+    return render(
+        request=request,
+        template_name="shopping/merged.html",
+        context={
+            "items": items,
+            "sort_by": sorter.sorter_type.value,
+            "sorters": list(SorterEnum),
+        },
+    )
 
+
+def basket_view(request):
+    """the cheapest way to buy a shopping list across the stores, delivery
+    and minimum orders included. the list is one term a line, "2 x milk" for
+    more than one, and without one the carts are the list. posting use_basket
+    puts the basket in the carts"""
+    key = get_session_key(request)
+    g = SESSIONS.get(key)
+    sessions = {s.store: s for s in g.s_list}
+    terms = {store: t for store, t in lists.store_terms().items() if store in sessions}
+
+    text = request.POST.get("list", request.GET.get("list", ""))
+    if text.strip():
+        lines = [
+            lists.term_line(term, pcs, list(terms)) for term, pcs in lists.parse(text)
+        ]
+    else:
+        lines = [
+            lists.item_line(cart_item.item_obj, cart_item.pcs)
+            for s in g.s_list
+            for cart_item in s.cart_items
+        ]
+    with metrics.stage("basket"):
+        best = basket.optimize(lines, terms)
+
+    if request.method == "POST" and "use_basket" in request.POST and best:
+        for store, s in sessions.items():
+            s.cart.clear_items()
+            for line in best.lines.get(store, []):
+                s.cart.add(line.items[store], line.pcs)
+        SESSIONS.update(key)
+        return HttpResponseRedirect(reverse("shopping:home"))
+
+    rows = [
+        (store, store_lines, best.subtotals[store], best.delivery[store])
+        for store, store_lines in (best.lines.items() if best else ())
+    ]
     return render(
         request=request,
-        template_name="shopping/home.html",
-        context=context,
+        template_name="shopping/basket.html",
+        context={"basket": best, "rows": rows, "lines": lines, "list": text},
     )
+
+
+# searches compare_list has in flight at once at each store, all on the loop's
+# pooled connections, see utils/httpclient.py
+LIST_CONCURRENCY = 16
+
+
+async def amatches(store: Store, term: str) -> list[Item]:
+    """term's best matches at store, the first page of a live search or the
+    catalog's, as SHOPPING_SEARCH_BACKEND says"""
+    if settings.SHOPPING_SEARCH_BACKEND != "catalog":
+        plugin = plugins.get(store)
+        request = plugin.search_request_class(
+            term, max_items=lists.CANDIDATES, lazy=True
+        )
+        try:
+            raw_items, _ = await request.afetch_page(start=0, size=lists.CANDIDATES)
+        except Exception as e:
+            if settings.SHOPPING_SEARCH_BACKEND != "fallback":
+                raise
+            logger.warning(
+                "search failed, answering from the catalog",
+                extra={"store": store.value},
+                exc_info=e,
+            )
+        else:
+            items = [plugin.item_class(raw_item) for raw_item in raw_items]
+            items = [item for item in items if not item.is_null]
+            if settings.SHOPPING_CATALOG_INGEST:
+                CATALOG_EXECUTOR.submit(ingest_quietly, items)
+            return items
+
+    result = await sync_to_async(catalog.text_search)(
+        term, ItemListFilter(), stores=[store], limit=lists.CANDIDATES
+    )
+    return result.initial_list
+
+
+@profiled
+@timed
+async def compare_list(request):
+    """the best unit price match for each term of a list at each store, as a
+    json table. the list is one term a line, like the basket's. every term is
+    searched at every store at once, and a term searched in the last
+    SHOPPING_LIST_CACHE_SECONDS isn't searched again"""
+    text = request.POST.get("list", request.GET.get("list", ""))
+    terms = list(dict.fromkeys(term for term, _ in lists.parse(text)))
+    terms = terms[: settings.SHOPPING_LIST_MAX_TERMS]
+    stores = list(Store)
+    limits = {store: asyncio.Semaphore(LIST_CONCURRENCY) for store in stores}
+
+    async def best(term: str, store: Store):
+        items = lists.RESULTS.get(store, term)
+        if items is None:
+            async with limits[store]:
+                items = await amatches(store, term)
+            lists.RESULTS.put(store, term, items)
+        return lists.best(items)
+
+    try:
+        with metrics.stage("list", n_items=len(terms) * len(stores)):
+            found = await asyncio.gather(
+                *(best(term, store) for term in terms for store in stores),
+                return_exceptions=True,
+            )
+    finally:
+        # under wsgi django runs the view on a loop of its own, which the
+        # loop's pooled client can't outlive
+        if not isinstance(request, ASGIRequest):
+            await close_async_client()
+
+    rows, failed = [], []
+    for i, term in enumerate(terms):
+        row = [term]
+        for store, item in zip(stores, found[i * len(stores) : (i + 1) * len(stores)]):
+            if isinstance(item, Exception):
+                logger.warning(
+                    "search failed", extra={"store": store.value}, exc_info=item
+                )
+                failed.append([term, store.value])
+                item = None
+            row.append(lists.cell(item))
+        rows.append(row)
+
+    return JsonResponse(
+        {
+            "stores": [store.value for store in stores],
+            "fields": lists.FIELDS,
+            "rows": rows,
+            "failed": failed,
+        }
+    )
+
+
+# it's an api, lists are posted by scripts without a token. csrf_exempt() would
+# wrap the view in a sync function, so it's marked directly
+compare_list.csrf_exempt = True
+
+
+def metrics_view(request):
+    """per stage timings and upstream counters in the prometheus text format"""
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def profiles(request):
+    """lists the saved profiles, debug only"""
+    if not settings.DEBUG:
+        raise Http404()
+    return render(
+        request=request,
+        template_name="shopping/profiles.html",
+        context={"profiles": profiling.list_profiles(settings.SHOPPING_PROFILE_DIR)},
+    )
+
+
+def profile_file(request, name: str):
+    if not settings.DEBUG:
+        raise Http404()
+    # only ever serve a listed profile, never an arbitrary path
+    for path in profiling.list_profiles(settings.SHOPPING_PROFILE_DIR):
+        if path.name == name:
+            return FileResponse(open(path, "rb"), as_attachment=True)
+    raise Http404()
+
+
+def allocations_view(request):
+    """debug only. ?start switches allocation profiling on, ?stop switches it off,
+    either way the report so far is shown"""
+    if not settings.DEBUG:
+        raise Http404()
+
+    if "start" in request.GET:
+        allocations.start()
+        profiler = allocations.current()
+    elif "stop" in request.GET:
+        profiler = allocations.stop()
+    else:
+        profiler = allocations.current()
+
+    if profiler is None:
+        text = "allocation profiling is off, ?start to switch it on"
+    else:
+        text = allocations.format_report(profiler.report()) or "nothing recorded yet"
+    return HttpResponse(text, content_type="text/plain; charset=utf-8")
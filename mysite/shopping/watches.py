@@ -0,0 +1,79 @@
+"""checks the products each catalog ingestion changed against the active
+Watches, through a utils.watch.WatchIndex kept in step with the table"""
+
+from __future__ import annotations
+
+import datetime
+import threading
+
+from django.db.models import Count, Max
+
+from utils.log import get_logger
+from utils.main import Item
+from utils.watch import WatchIndex
+
+from .models import Product, Watch, WatchAlert
+
+logger = get_logger("watches")
+
+_index = None
+_version = None
+_lock = threading.Lock()
+
+
+def active_index() -> WatchIndex | None:
+    """the WatchIndex of the active watches, None if there aren't any. it's
+    rebuilt when the watches have changed, in this process or another"""
+    global _index, _version
+    version = Watch.objects.aggregate(n=Count("id"), updated=Max("updated_at"))
+    with _lock:
+        if version != _version:
+            watches = Watch.objects.filter(active=True)
+            _index = WatchIndex(watch.to_rule() for watch in watches)
+            _version = version
+        return _index if len(_index) else None
+
+
+def alert(
+    index: WatchIndex, changed: list[Item], when: datetime.datetime
+) -> list[WatchAlert]:
+    """a WatchAlert for each watch in index each of the changed items passes.
+    the items have to be in the catalog already"""
+    matched = index.match(changed)
+    if not matched:
+        return []
+
+    by_store: dict[str, set[str]] = {}
+    for _, item in matched:
+        by_store.setdefault(item.store.value, set()).add(item.product_id)
+    products = {}
+    for store, product_ids in by_store.items():
+        product_ids = list(product_ids)
+        for i in range(0, len(product_ids), 500):
+            found = Product.objects.filter(
+                store=store, product_id__in=product_ids[i : i + 500]
+            )
+            products.update(((store, p.product_id), p) for p in found)
+
+    alerts = []
+    for rule, item in matched:
+        product = products[(item.store.value, item.product_id)]
+        alerts.append(
+            WatchAlert(
+                watch_id=rule.rule_id,
+                product=product,
+                price=product.price,
+                unit_price=product.unit_price,
+                created_at=when,
+            )
+        )
+        logger.info(
+            "watch matched",
+            extra={
+                "watch": rule.rule_id,
+                "store": product.store,
+                "product_id": product.product_id,
+                "price": product.price,
+            },
+        )
+    return WatchAlert.objects.bulk_create(alerts)
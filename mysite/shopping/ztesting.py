@@ -28,17 +28,12 @@ from utils.main import AsdaRequest, AsdaItem
 
 from utils.main import ItemListFilter, SearchResult
 
-from utils.search import Sorter, SorterEnum, Filter, SearchEnum
+from utils.search import Sorter, SorterEnum, Filter
 
 import utils.plugins.waitrose
 import utils.plugins.asda
 
 
-utils.plugins.asda.register()
-
-utils.plugins.waitrose.register()
-
-
 # should perhaps store this in the store enum...
 STORE_DISPLAY_INFO = {
     Store.ASDA: {
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import threading
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+# allocations are put down to the innermost frame in here, so json decoding is
+# charged to the plugin line that decoded, not to the json module
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+# the snapshots' own allocations, anything allocated on the way down from here
+_IGNORED = (tracemalloc.Filter(False, __file__, all_frames=True),)
+
+_profiler: AllocationProfiler = None
+
+
+class StageAllocations:
+    # what one (stage, store) has left allocated, over every run of it
+    __slots__ = ("runs", "retained_bytes", "sites")
+
+    def __init__(self):
+        self.runs = 0
+        self.retained_bytes = 0
+        # "file:line" -> bytes still allocated from there
+        self.sites: Counter[str] = Counter()
+
+
+class AllocationProfiler:
+    """snapshots tracemalloc before and after each metrics.stage() and puts the
+    difference down to the stage, the store and the allocating line.
+
+    snapshots are of the whole process, so with concurrent requests a stage is
+    also charged what other threads allocated while it ran. it's for finding
+    out what dominates, not for exact accounting"""
+
+    def __init__(self, nframes: int = 10):
+        self.nframes = nframes
+        self.stages: dict[tuple[str, str], StageAllocations] = {}
+        self._lock = threading.Lock()
+
+    def before(self) -> tracemalloc.Snapshot | None:
+        # None when tracing was stopped in the meantime, from another thread
+        try:
+            return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        except RuntimeError:
+            return None
+
+    def after(self, stage: str, store: str, before: tracemalloc.Snapshot | None):
+        if before is None:
+            return
+        try:
+            after = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        except RuntimeError:
+            return
+        diffs = after.compare_to(before, "traceback")
+
+        with self._lock:
+            allocations = self.stages.get((stage, store))
+            if allocations is None:
+                allocations = self.stages[(stage, store)] = StageAllocations()
+            allocations.runs += 1
+            for diff in diffs:
+                if diff.size_diff == 0:
+                    continue
+                allocations.retained_bytes += diff.size_diff
+                allocations.sites[_site(diff.traceback)] += diff.size_diff
+
+    def report(self, top: int = 10) -> list[dict]:
+        """per (stage, store), most retained first"""
+        with self._lock:
+            rows = [
+                {
+                    "stage": stage,
+                    "store": store,
+                    "runs": allocations.runs,
+                    "retained_bytes": allocations.retained_bytes,
+                    "top_sites": allocations.sites.most_common(top),
+                }
+                for (stage, store), allocations in self.stages.items()
+            ]
+        return sorted(rows, key=lambda row: row["retained_bytes"], reverse=True)
+
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+    # tracebacks are oldest call first
+    for frame in reversed(traceback):
+        if frame.filename.startswith(PROJECT_ROOT):
+            return f"{Path(frame.filename).relative_to(PROJECT_ROOT)}:{frame.lineno}"
+    frame = traceback[-1]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def current() -> AllocationProfiler | None:
+    return _profiler
+
+
+def start(nframes: int = 10) -> AllocationProfiler:
+    """starts tracing allocations, every stage from now on is snapshotted"""
+    global _profiler
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(nframes)
+    _profiler = AllocationProfiler(nframes)
+    return _profiler
+
+
+def stop() -> AllocationProfiler | None:
+    """stops tracing, returns the profiler with what it recorded"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return profiler
+
+
+def format_report(report: list[dict]) -> str:
+    lines = []
+    for row in report:
+        lines.append(
+            f"{row['stage']:<10} {row['store']:<10} runs={row['runs']:<5} "
+            f"retained={row['retained_bytes'] / 1024:,.1f} KiB"
+        )
+        for site, size in row["top_sites"]:
+            lines.append(f"    {size / 1024:>10,.1f} KiB  {site}")
+    return "\n".join(lines)
@@ -0,0 +1,101 @@
+"""exact cross-store matching by barcode.
+
+stores give their barcodes as upc-a, ean-13 or ean-8, with or without leading
+zeros, so they're compared as gtin-14: the digits left padded with zeros. a
+BarcodeIndex maps each gtin to the item at each store, so "this product at
+every store" is a dict lookup, and join() compares a whole result set with
+one probe per barcode.
+
+only asda's search results have barcodes, waitrose's have its own line number
+and nothing else, so its products are matched by description, see matching"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from .datatypes import Currency, Item
+from .store import Store
+
+
+def normalize(code) -> str | None:
+    """code as a gtin-14, None if it can't be one"""
+    digits = "".join(c for c in str(code) if c.isdigit())
+    if not 8 <= len(digits) <= 14 or not digits.strip("0"):
+        return None
+    return digits.zfill(14)
+
+
+def gtins(item: Item) -> list[str]:
+    """item's barcodes as gtin-14s, without duplicates"""
+    found = []
+    for code in getattr(item, "barcodes", ()):
+        gtin = normalize(code)
+        if gtin is not None and gtin not in found:
+            found.append(gtin)
+    return found
+
+
+@dataclass
+class Comparison:
+    """one product at each store that has it"""
+
+    gtin: str
+    items: dict[Store, Item] = field(default_factory=dict)
+
+    @property
+    def cheapest(self) -> Item:
+        return min(
+            self.items.values(), key=lambda i: i.price.convert_to(Currency.GBP).amount
+        )
+
+    @property
+    def description(self) -> str:
+        return next(iter(self.items.values())).description
+
+
+class BarcodeIndex:
+    """gtin -> {store: item}, the last item added for a store wins"""
+
+    def __init__(self, items: Iterable[Item] = ()):
+        self._by_gtin: dict[str, dict[Store, Item]] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self._by_gtin)
+
+    def add(self, item: Item):
+        for gtin in gtins(item):
+            self._by_gtin.setdefault(gtin, {})[item.store] = item
+
+    def get(self, code) -> dict[Store, Item]:
+        """the items with barcode code, by store"""
+        gtin = normalize(code)
+        return dict(self._by_gtin.get(gtin, {})) if gtin else {}
+
+    def at_every_store(self, item: Item) -> dict[Store, Item]:
+        """item and the same product at the other stores, through any of
+        item's barcodes"""
+        found = {}
+        for gtin in gtins(item):
+            for store, other in self._by_gtin.get(gtin, {}).items():
+                found.setdefault(store, other)
+        found[item.store] = item
+        return found
+
+    def join(self, items: Iterable[Item], min_stores: int = 2) -> list[Comparison]:
+        """a Comparison for each of items found at min_stores stores or more,
+        in the order of items. items are the probe side, each barcode is
+        looked up once however many items share it"""
+        comparisons: list[Comparison] = []
+        seen: set[str] = set()
+        for item in items:
+            item_gtins = gtins(item)
+            if not item_gtins or seen.intersection(item_gtins):
+                continue
+            seen.update(item_gtins)
+            found = self.at_every_store(item)
+            if len(found) >= min_stores:
+                comparisons.append(Comparison(item_gtins[0], found))
+        return comparisons
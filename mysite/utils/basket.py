@@ -0,0 +1,505 @@
+"""the cheapest way to buy a shopping list across stores.
+
+each line of the list can be bought at some of the stores. each store charges
+for delivery, maybe not over some spend, and won't deliver an order under its
+minimum, so which stores to use and what to buy at each are decided together.
+
+it's a branch and bound, split into cases: which stores are used, and which of
+them get enough to deliver free. a case's delivery is then fixed and each of
+its stores just has a subtotal to reach, so a lagrangian relaxation of those
+targets gives a close lower bound, and knapsacks of each store's subtotals
+catch what it misses when the targets all but add up to the best found. cases
+that can't beat the best found aren't searched, and a search that runs out of
+nodes settles for the best found, which the result says"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from itertools import combinations, product
+
+from .datatypes import Currency, Item, Price
+from .store import Store
+
+# nodes the search may visit before settling for the best found so far
+MAX_NODES = 100_000
+
+
+def _pence(amount: float) -> int:
+    # costs are added up in whole pence, so they're exact
+    return round(amount * 100)
+
+
+@dataclass(frozen=True)
+class StoreTerms:
+    """a store's delivery charge and minimum order, in gbp"""
+
+    delivery: float = 0.0
+    minimum: float = 0.0
+    # no delivery charge for orders of this or more, None if always charged
+    free_over: float = None
+
+    def delivery_for(self, subtotal: Price) -> Price:
+        # in pence, as the search has it
+        amount = _pence(subtotal.convert_to(Currency.GBP).amount)
+        if amount <= 0 or (
+            self.free_over is not None and amount >= _pence(self.free_over)
+        ):
+            return Price(0.0, Currency.GBP)
+        return Price(self.delivery, Currency.GBP)
+
+
+@dataclass
+class Line:
+    """a line of the shopping list, pcs of the item for it at each store"""
+
+    name: str
+    pcs: int
+    items: dict[Store, Item] = field(default_factory=dict)
+
+    def cost(self, store: Store) -> Price:
+        return (self.items[store].price * self.pcs).convert_to(Currency.GBP)
+
+
+@dataclass
+class Basket:
+    """where to buy each line, and what it costs at each store"""
+
+    lines: dict[Store, list[Line]] = field(default_factory=dict)
+    subtotals: dict[Store, Price] = field(default_factory=dict)
+    delivery: dict[Store, Price] = field(default_factory=dict)
+    # lines none of the stores have
+    unavailable: list[Line] = field(default_factory=list)
+    # False if the search ran out of nodes first, it's then the best found
+    optimal: bool = True
+
+    @property
+    def total(self) -> Price:
+        return sum(self.subtotals.values()) + sum(self.delivery.values())
+
+
+def optimize(
+    lines: list[Line], terms: dict[Store, StoreTerms], max_nodes: int = MAX_NODES
+) -> Basket | None:
+    """the cheapest basket for lines at the stores in terms, None if no
+    split of them meets the stores' minimums"""
+    stores = list(terms)
+    basket = Basket()
+    available = []
+    for line in lines:
+        if set(line.items) & set(stores):
+            available.append(line)
+        else:
+            basket.unavailable.append(line)
+    lines = available
+
+    costs = [
+        [_pence(line.cost(s).amount) if s in line.items else math.inf for s in stores]
+        for line in lines
+    ]
+    problem = [
+        (
+            _pence(t.delivery),
+            _pence(t.minimum),
+            _pence(t.free_over) if t.free_over is not None else None,
+        )
+        for t in terms.values()
+    ]
+
+    budget = _Budget(max_nodes)
+    best = _solve(costs, problem, budget)
+    if best is None:
+        return None
+    basket.optimal = budget.nodes >= 0
+    for line, s in zip(lines, best):
+        store = stores[s]
+        basket.lines.setdefault(store, []).append(line)
+        basket.subtotals[store] = basket.subtotals.get(store, 0) + line.cost(store)
+    for store, subtotal in basket.subtotals.items():
+        basket.delivery[store] = terms[store].delivery_for(subtotal)
+    return basket
+
+
+class _Budget:
+    def __init__(self, nodes: int):
+        self.nodes = nodes
+
+
+class _OutOfNodes(Exception):
+    pass
+
+
+def _solve(
+    costs: list[list[float]], terms: list[tuple[int, int, int | None]], budget: _Budget
+) -> list[int] | None:
+    # costs[line][store] and (delivery, minimum, free over) per store, in pence.
+    # the store index for each line in the cheapest assignment meeting the
+    # minimums.
+    #
+    # every subset of the stores is a case, and so is each way its stores could
+    # pay delivery or get enough to not have to. a case has no delivery to work
+    # out, just a target subtotal for each of its stores. cases are tried
+    # cheapest bound first, and a case whose lagrangian bound can't beat the
+    # best found isn't searched, which is most of them
+    k = len(terms)
+    cases = []
+    for size in range(1, k + 1):
+        for subset in combinations(range(k), size):
+            rows = [[row[s] for s in subset] for row in costs]
+            if any(min(row) == math.inf for row in rows):
+                continue
+            tiers = []
+            for s in subset:
+                delivery, minimum, free_over = terms[s]
+                # every store in the subset is given something
+                tier = [(delivery, max(minimum, 1))]
+                if free_over is not None:
+                    tier.append((0, max(minimum, free_over, 1)))
+                tiers.append(tier)
+            least = sum(min(row) for row in rows)
+            for tier in product(*tiers):
+                fixed = sum(delivery for delivery, _ in tier)
+                targets = [target for _, target in tier]
+                cases.append(
+                    (fixed + max(least, sum(targets)), subset, rows, targets, fixed)
+                )
+    cases.sort(key=lambda case: case[0])
+
+    best_total, best = _greedy(costs, terms)
+
+    def improve(found: tuple[int, list[int]] | None, subset, fixed: int):
+        nonlocal best_total, best
+        if found is not None and found[0] + fixed < best_total:
+            best_total = found[0] + fixed
+            best = [subset[s] for s in found[1]]
+
+    # first every case's bound and a quick assignment, so the searches start
+    # with a best found that's close
+    bounded = []
+    for least, subset, rows, targets, fixed in cases:
+        # totals are whole pence, a case has to be able to beat by one
+        if least > best_total - 1 + _EPSILON:
+            break
+        lam, least = _lagrangian(rows, targets, best_total - fixed)
+        if least <= best_total - fixed - 1 + _EPSILON:
+            improve(_repair(rows, targets, lam), subset, fixed)
+            bounded.append((least + fixed, subset, rows, targets, lam, fixed))
+
+    bounded.sort(key=lambda case: case[0])
+    for least, subset, rows, targets, lam, fixed in bounded:
+        if least > best_total - 1 + _EPSILON or budget.nodes < 0:
+            break
+        improve(_search(rows, targets, lam, best_total - fixed, budget), subset, fixed)
+    return best
+
+
+def _greedy(
+    costs: list[list[float]], terms: list[tuple[int, int, int | None]]
+) -> tuple[float, list[int] | None]:
+    # every line at its cheapest store of each subset of the stores, the best
+    # of those that meet the minimums, for the search to start from
+    best_total, best = math.inf, None
+    for size in range(1, len(terms) + 1):
+        for subset in combinations(range(len(terms)), size):
+            assignment = [min(subset, key=row.__getitem__) for row in costs]
+            subtotals = dict.fromkeys(assignment, 0)
+            for row, s in zip(costs, assignment):
+                subtotals[s] += row[s]
+            total = 0
+            for s, subtotal in subtotals.items():
+                delivery, minimum, free_over = terms[s]
+                if subtotal < minimum or subtotal == math.inf:
+                    total = math.inf
+                elif free_over is None or subtotal < free_over:
+                    total += delivery
+                total += subtotal
+            if total < best_total:
+                best_total, best = total, assignment
+    return best_total, best
+
+
+# slack for the rounding of the float bounds against whole pence
+_EPSILON = 1e-6
+
+
+def _reduced(cost: float, lam: float) -> float:
+    return cost * (1 - lam) if cost < math.inf else math.inf
+
+
+def _lagrangian(
+    rows: list[list[float]], targets: list[int], limit: float, iterations: int = 50
+) -> tuple[list[float], float]:
+    # multipliers for the "at least target at each store" constraints, and the
+    # lower bound they give: with them, each line just goes to its store of
+    # least reduced cost. found by subgradient ascent, any multipliers >= 0
+    # give a valid bound so stopping early only makes it looser. targets adding
+    # up to more than the lines cost start at 1, which gives that sum
+    k = len(targets)
+    lam = [1.0] * k if sum(targets) > sum(map(min, rows)) else [0.0] * k
+    best_lam, best_value = lam, -math.inf
+    for t in range(iterations):
+        value = sum(l * target for l, target in zip(lam, targets))
+        got = [0] * k
+        for row in rows:
+            reduced = [_reduced(c, l) for c, l in zip(row, lam)]
+            s = reduced.index(min(reduced))
+            value += reduced[s]
+            got[s] += row[s]
+        if value > best_value:
+            best_lam, best_value = lam, value
+            if value > limit - 1 + _EPSILON:
+                # the case can't beat the best found, that's all there is to know
+                break
+        gradient = [target - g for target, g in zip(targets, got)]
+        if all(g <= 0 and (g == 0 or l == 0) for g, l in zip(gradient, lam)):
+            # the relaxed assignment is feasible, so it's optimal
+            break
+        norm = math.sqrt(sum(g * g for g in gradient))
+        lam = [
+            min(1.0, max(0.0, l + 0.5 / (t + 1) * g / norm))
+            for l, g in zip(lam, gradient)
+        ]
+    return best_lam, best_value
+
+
+def _repair(
+    rows: list[list[float]], targets: list[int], lam: list[float]
+) -> tuple[int, list[int]] | None:
+    # a good assignment to start the search from: each line at its store of
+    # least reduced cost, then lines moved into stores short of their target,
+    # least extra per pence moved first, then moved back to cheaper stores
+    # wherever the targets allow
+    k = len(targets)
+    assignment = [min(range(k), key=lambda s: _reduced(row[s], lam[s])) for row in rows]
+    subtotals = [0] * k
+    for row, s in zip(rows, assignment):
+        subtotals[s] += row[s]
+
+    def move(j: int, s: int):
+        subtotals[assignment[j]] -= rows[j][assignment[j]]
+        subtotals[s] += rows[j][s]
+        assignment[j] = s
+
+    def can_leave(j: int) -> bool:
+        a = assignment[j]
+        return subtotals[a] - rows[j][a] >= targets[a]
+
+    for s in range(k):
+        while subtotals[s] < targets[s]:
+            moves = [
+                ((row[s] - row[a]) / row[s], j)
+                for j, (row, a) in enumerate(zip(rows, assignment))
+                if a != s and 0 < row[s] < math.inf and can_leave(j)
+            ]
+            if not moves:
+                return None
+            move(min(moves)[1], s)
+
+    improved = True
+    while improved:
+        improved = False
+        for j, row in enumerate(rows):
+            cheaper = min(range(k), key=row.__getitem__)
+            if row[cheaper] < row[assignment[j]] and can_leave(j):
+                move(j, cheaper)
+                improved = True
+    return sum(row[s] for row, s in zip(rows, assignment)), assignment
+
+
+# steps the knapsacks count extra cost in, up to the best found
+_STEPS = 128
+
+
+def _knapsacks(
+    rows: list[list[float]],
+    targets: list[int],
+    limit: int,
+    unit: int,
+    steps: int,
+    own: bool,
+) -> list[list[list[int]]]:
+    # per store, the subtotals it could get from the lines from i on as bits
+    # of an int, at step x those costing at most x units over the cheapest.
+    # own counts only the store's own lines, so the stores' add up
+    k, n = len(targets), len(rows)
+    # more than this and the case costs limit
+    caps = [(1 << max(0, target + limit - sum(targets))) - 1 for target in targets]
+    tables = [None] * n + [[[1] * steps for _ in range(k)]]
+    for i in range(n - 1, -1, -1):
+        row = rows[i]
+        least = min(row)
+        tables[i] = []
+        for s in range(k):
+            after = tables[i + 1][s]
+            here = [0] * steps
+            others = [c for t, c in enumerate(row) if t != s and c < math.inf]
+            if others:
+                skip = 0 if own else (min(others) - least) // unit
+                here[skip:] = after[: max(0, steps - skip)]
+            if row[s] < math.inf:
+                take = (row[s] - least) // unit
+                for x in range(take, steps):
+                    here[x] = (here[x] | after[x - take] << row[s]) & caps[s]
+            tables[i].append(here)
+    return tables
+
+
+def _fewest(steps: list[int], window: int) -> int:
+    # the first step with a subtotal in window, len(steps) if none
+    if not steps[-1] & window:
+        return len(steps)
+    lo, hi = 0, len(steps) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if steps[mid] & window:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _search(
+    rows: list[list[float]],
+    targets: list[int],
+    lam: list[float],
+    limit: float,
+    budget: _Budget,
+) -> tuple[int, list[int]] | None:
+    # the cheapest assignment with each store at least its target, if under
+    # limit, or the best found when the nodes run out
+    k, n = len(targets), len(rows)
+
+    # drop stores a line can't go to without the bound reaching limit, most
+    # lines are left with one
+    for lam_here in (lam, [0.0] * k):
+        reduced = [[_reduced(c, l) for c, l in zip(row, lam_here)] for row in rows]
+        least = sum(map(min, reduced)) + sum(l * t for l, t in zip(lam_here, targets))
+        rows = [
+            [
+                c if least + rc - min(row_reduced) <= limit - 1 + _EPSILON else math.inf
+                for c, rc in zip(row, row_reduced)
+            ]
+            for row, row_reduced in zip(rows, reduced)
+        ]
+    if any(min(row) == math.inf for row in rows):
+        return None
+
+    # biggest gap to the next cheapest store first, then dearest
+    def regret(row: list[float]) -> float:
+        cheapest, second = sorted(row + [math.inf])[:2]
+        return second - cheapest
+
+    order = sorted(range(n), key=lambda j: (-regret(rows[j]), -min(rows[j])))
+    rows = [rows[j] for j in order]
+
+    # subtotals each store could get from the lines from i on, as bits
+    caps = [
+        (1 << target + max((c for c in column if c < math.inf), default=0) + 1) - 1
+        for target, column in zip(targets, zip(*rows))
+    ]
+    reach = [None] * n + [[1] * k]
+    for i in range(n - 1, -1, -1):
+        reach[i] = [
+            (sums | sums << c) & cap if c < math.inf else sums
+            for sums, c, cap in zip(reach[i + 1], rows[i], caps)
+        ]
+
+    # the least the lines from i on could cost
+    cheapest = [0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        cheapest[i] = cheapest[i + 1] + min(rows[i])
+
+    # lagrangian bound of the lines from i on, stores that have reached their
+    # target dropped, the rest at the case's multipliers or at 1
+    suffixes: dict[tuple[int, bool], list[float]] = {}
+
+    def suffix(reached: int, ones: bool) -> list[float]:
+        if (reached, ones) not in suffixes:
+            lam_here = [
+                0.0 if reached >> s & 1 else 1.0 if ones else l
+                for s, l in enumerate(lam)
+            ]
+            rest = [0.0] * (n + 1)
+            for i in range(n - 1, -1, -1):
+                rest[i] = rest[i + 1] + min(map(_reduced, rows[i], lam_here))
+            suffixes[reached, ones] = rest
+        return suffixes[reached, ones]
+
+    # the knapsacks count cost up to limit, so need one
+    knapsacks = None
+    if limit < math.inf:
+        unit = max(1, math.ceil((limit - cheapest[0]) / _STEPS))
+        steps = max(0, limit - 1 - cheapest[0]) // unit + 1
+        knapsacks = _knapsacks(rows, targets, limit, unit, steps, False)
+        own = _knapsacks(rows, targets, limit, unit, steps, True)
+
+    best = None
+    assignment = [0] * n
+    subtotals = [0] * k
+    # least reduced cost first, which heads for the targets, then cheapest
+    choices = [
+        sorted(
+            (s for s in range(k) if row[s] < math.inf),
+            key=lambda s: (_reduced(row[s], lam[s]), row[s]),
+        )
+        for row in rows
+    ]
+
+    def search(i: int, spent: int):
+        nonlocal best, limit
+        budget.nodes -= 1
+        if budget.nodes < 0:
+            raise _OutOfNodes
+        reached, least, needed = 0, spent, spent
+        shorts = [0] * k
+        for s in range(k):
+            short = targets[s] - subtotals[s]
+            if short <= 0:
+                reached |= 1 << s
+                continue
+            sums = reach[i][s] >> short
+            if not sums:
+                return
+            shorts[s] = short + (sums & -sums).bit_length() - 1
+            least += lam[s] * shorts[s]
+            needed += shorts[s]
+        least = max(
+            least + suffix(reached, False)[i],
+            needed + suffix(reached, True)[i],
+            spent + cheapest[i],
+        )
+        if least > limit - 1 + _EPSILON:
+            return
+        if knapsacks is not None:
+            # each store's shortfall, up to what the others leave under limit
+            slack = (1 << limit - needed) - 1
+            allowed = (limit - 1 - spent - cheapest[i]) // unit
+            total = 0
+            for s in range(k):
+                window = slack << shorts[s]
+                if _fewest(knapsacks[i][s], window) > allowed:
+                    return
+                total += _fewest(own[i][s], window)
+            if total > allowed:
+                return
+        if i == n:
+            best = spent, assignment[:]
+            limit = spent
+            return
+        for s in choices[i]:
+            cost = rows[i][s]
+            assignment[i] = s
+            subtotals[s] += cost
+            search(i + 1, spent + cost)
+            subtotals[s] -= cost
+
+    try:
+        search(0, 0)
+    except _OutOfNodes:
+        pass
+    if best is None:
+        return None
+    unordered = [0] * n
+    for j, s in zip(order, best[1]):
+        unordered[j] = s
+    return best[0], unordered
@@ -0,0 +1,6 @@
+"""micro-benchmarks for the datatypes, item parsing, filters and sorters.
+
+python -m utils.benchmarks                  # run, compare with baseline.json
+python -m utils.benchmarks --save-baseline  # run, store as the new baseline
+python -m utils.benchmarks --sizes 100,10000 --only sort.
+"""
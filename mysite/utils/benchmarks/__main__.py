@@ -0,0 +1,57 @@
+import argparse
+import sys
+from pathlib import Path
+
+from . import suite
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m utils.benchmarks")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(map(str, suite.DEFAULT_SIZES)),
+        help="comma separated item counts",
+    )
+    parser.add_argument("--only", default="", help="run benchmarks containing this")
+    parser.add_argument("--out", help="write the results here as json")
+    parser.add_argument("--baseline", default=BASELINE, type=Path)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        default=0.25,
+        type=float,
+        help="slowdown over the baseline flagged as a regression, 0.25 is 25%%",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = tuple(int(n) for n in args.sizes.split(","))
+    results = suite.run(sizes, args.only, log=print)
+
+    if args.out:
+        suite.save(results, args.out)
+    if args.save_baseline:
+        suite.save(results, args.baseline)
+        print(f"saved baseline to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}, --save-baseline to make one")
+        return 0
+
+    rows = suite.compare(results, suite.load(args.baseline), args.threshold)
+    print()
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(
+            f"{row['name']:<36} n={row['n']:<8} "
+            f"{row['baseline_ns_per_item']:>10,.0f} -> {row['ns_per_item']:>10,.0f} ns/item "
+            f"x{row['ratio']:.2f} {flag}"
+        )
+    regressions = sum(row["regressed"] for row in rows)
+    print(f"\n{regressions} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import random
+
+# (weight, size string maker), roughly the mix seen in real searches
+_WAITROSE_SIZES = [
+    (30, lambda r: f"{r.choice([100, 150, 200, 250, 300, 400, 500, 750])}g"),
+    (12, lambda r: f"{r.choice([1, 1.5, 2, 2.5, 5])}kg"),
+    (14, lambda r: f"{r.choice([250, 330, 500, 568, 750])}ml"),
+    (8, lambda r: f"{r.choice([1, 1.5, 2, 3, 4])}litre"),
+    (5, lambda r: f"{r.choice([20, 25, 37.5, 70, 75])}cl"),
+    (10, lambda r: f"{r.choice([2, 4, 6, 8, 12, 24])}x{r.choice([25, 35, 150, 330])}g"),
+    (5, lambda r: f"{r.choice([4, 6, 12])}x{r.choice([250, 330, 440])}ml"),
+    (8, lambda r: f"{r.choice([1, 2, 4, 6, 10, 12])}s"),
+    (3, lambda r: f"{r.choice([1, 2])}pack"),
+]
+
+_ASDA_SIZES = [
+    (35, lambda r: f"{r.choice([100, 150, 200, 250, 300, 400, 500, 750])}g"),
+    (14, lambda r: f"{r.choice([1, 1.5, 2, 2.5, 5])}kg"),
+    (14, lambda r: f"{r.choice([1, 1.5, 2, 4])}l"),
+    (8, lambda r: f"{r.choice([1, 1.5, 2, 4])}L"),
+    (10, lambda r: f"{r.choice([2, 4, 6, 12])}x{r.choice([25, 35, 150, 330])}g"),
+    (9, lambda r: f"{r.choice([4, 6, 8, 12])}pk"),
+    (5, lambda r: "per kg"),
+    (5, lambda r: "each"),
+]
+
+_WORDS = (
+    "organic british free range semi skimmed whole milk cheddar mature sliced "
+    "smoked bacon chicken breast fillets sourdough bread wholemeal pasta penne "
+    "basmati rice tinned tomatoes chopped baked beans orange juice smooth apple "
+    "sparkling water still greek yoghurt natural butter salted unsalted eggs large"
+).split()
+
+
+def _pick(r: random.Random, weighted: list) -> str:
+    makers = [maker for _, maker in weighted]
+    weights = [weight for weight, _ in weighted]
+    return r.choices(makers, weights)[0](r)
+
+
+def _price(r: random.Random) -> float:
+    # grocery prices are skewed, lots around £1-3 and a long tail up to £30 or so
+    return round(min(max(r.lognormvariate(0.6, 0.8), 0.3), 45.0), 2)
+
+
+def _description(r: random.Random) -> str:
+    return " ".join(r.choices(_WORDS, k=r.randint(2, 6))).capitalize()
+
+
+def waitrose_item(r: random.Random, i: int) -> dict:
+    """one entry of waitrose's componentsAndProducts"""
+    # a few entries are page components rather than products
+    if r.random() < 0.02:
+        return {"searchComponent": {"id": str(i), "type": "banner"}}
+
+    product = {
+        "id": f"{i}-{r.randint(100000, 999999)}",
+        "name": _description(r),
+        "currentSaleUnitPrice": {"price": {"amount": _price(r), "currencyCode": "GBP"}},
+        "thumbnail": f"https://ecom-su-static-prod.wtrecom.com/images/products/9/LN_{i:06d}_BP_9.jpg",
+    }
+    # loose produce has a typical weight rather than a size
+    if r.random() < 0.05:
+        product["typicalWeight"] = {
+            "amount": round(r.uniform(0.1, 2.0), 2),
+            "uom": "KGM",
+        }
+        product["defaultQuantity"] = {"amount": 1, "uom": "C62"}
+    else:
+        product["size"] = _pick(r, _WAITROSE_SIZES)
+    return {"searchProduct": product}
+
+
+def asda_item(r: random.Random, i: int) -> dict:
+    """one entry of asda's products.items"""
+    weight = _pick(r, _ASDA_SIZES)
+    price_info = {"price": f"£{_price(r):.2f}"}
+    if weight == "per kg":
+        price_info["avg_weight"] = str(round(r.uniform(0.1, 2.0), 2))
+    return {
+        "item": {
+            "name": _description(r),
+            "extended_item_info": {"weight": weight},
+            "upc_numbers": [str(5000000000000 + i)],
+        },
+        "price": {"price_info": price_info},
+    }
+
+
+def catalog(store: str, n: int, seed: int = 0) -> list[dict]:
+    """n raw items in the payload shape of store ("waitrose" or "asda"),
+    the same seed always gives the same items"""
+    make = {"waitrose": waitrose_item, "asda": asda_item}[store]
+    r = random.Random(f"{store}-{seed}")
+    return [make(r, i) for i in range(n)]
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import datetime
+import functools
+import json
+import os
+import platform
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Callable
+
+from ..datatypes import Currency, Item, Price, Quantity, Unit, UnitPrice, UnitType
+from ..parsing import ParsePool
+from ..search import Filter, ItemListFilter, SearchResult, Sorter, SorterEnum
+from ..plugins import asda, waitrose
+from ..store import Store
+from .catalog import catalog
+
+DEFAULT_SIZES = (10**2, 10**3, 10**4, 10**5, 10**6)
+
+# name -> setup(n), which builds the inputs and returns the function to time
+BENCHMARKS: dict[str, Callable[[int], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[[int], Callable[[], object]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+@functools.lru_cache(maxsize=1)
+def _items(n: int) -> list[Item]:
+    # half of each store, as plain items so 10^6 of them fit in memory
+    parsed = [waitrose.WaitroseItem(raw) for raw in catalog("waitrose", n - n // 2)] + [
+        asda.AsdaItem(raw) for raw in catalog("asda", n // 2)
+    ]
+    items = [Item.from_record(item.to_record()) for item in parsed if not item.is_null]
+    random.Random(n).shuffle(items)
+    return items
+
+
+@benchmark("unit.conversion_factor")
+def _(n):
+    r = random.Random(n)
+    by_type = {}
+    for unit in Unit:
+        if unit.unit_type != UnitType.OTHER:
+            by_type.setdefault(unit.unit_type, []).append(unit)
+    pairs = []
+    for _ in range(n):
+        units = by_type[r.choice(list(by_type))]
+        pairs.append((r.choice(units), r.choice(units)))
+
+    def run():
+        for unit1, unit2 in pairs:
+            Unit.conversion_factor(unit1, unit2)
+
+    return run
+
+
+@benchmark("unit_price.calculate")
+def _(n):
+    pairs = [(item.price, item.quantity) for item in _items(n)]
+
+    def run():
+        for price, quantity in pairs:
+            UnitPrice.calculate(price, quantity)
+
+    return run
+
+
+@benchmark("waitrose_item.parse")
+def _(n):
+    raw_items = catalog("waitrose", n)
+    return lambda: [waitrose.WaitroseItem(raw) for raw in raw_items]
+
+
+@benchmark("asda_item.parse")
+def _(n):
+    raw_items = catalog("asda", n)
+    return lambda: [asda.AsdaItem(raw) for raw in raw_items]
+
+
+@functools.lru_cache(maxsize=1)
+def _parse_pool() -> ParsePool:
+    # started outside the timings, once
+    pool = ParsePool(os.cpu_count())
+    pool.parse(Store.WAITROSE, catalog("waitrose", 1))
+    return pool
+
+
+@benchmark("parse_pool.waitrose")
+def _(n):
+    raw_items = catalog("waitrose", n)
+    pool = _parse_pool()
+    return lambda: pool.parse(Store.WAITROSE, raw_items)
+
+
+def _filters() -> list[Filter.AttributeFilter]:
+    # bounds which let roughly half the catalog through
+    return [
+        Filter.PriceFilter(Price(1, Currency.GBP), Price(3, Currency.GBP)),
+        Filter.UnitPriceFilter(
+            UnitPrice(0, Currency.GBP, Unit.KG), UnitPrice(5, Currency.GBP, Unit.KG)
+        ),
+        Filter.QuantityFilter(Quantity(0.2, Unit.KG), Quantity(2, Unit.KG)),
+        Filter.UnitTypeFilter([UnitType.WEIGHT]),
+        Filter.DescriptionFilter("milk"),
+    ]
+
+
+for _filter in _filters():
+
+    @benchmark(f"filter.{type(_filter).__name__}")
+    def _(n, _filter=_filter):
+        items = _items(n)
+        return lambda: _filter.get_filtered_list(items)
+
+
+for _sorter_enum in SorterEnum:
+
+    @benchmark(f"sort.{_sorter_enum.value}")
+    def _(n, _sorter_enum=_sorter_enum):
+        items = _items(n)
+        sorter = Sorter(_sorter_enum)
+        return lambda: sorter.get_sorted_list(items)
+
+
+@benchmark("search_result.filter_and_sort")
+def _(n):
+    # a fresh result each time, so the first sort is included
+    items = _items(n)
+    item_filter = ItemListFilter()
+    item_filter.sorter = Sorter(SorterEnum.LOWEST_UNIT_PRICE)
+    for f in item_filter.filters._filters_as_list():
+        f.enable()
+    return lambda: SearchResult(items).filter_and_sort(item_filter)
+
+
+def _repeats(n: int) -> int:
+    # enough runs to steady the small sizes without the big ones taking all day
+    return max(1, min(20, 100_000 // n))
+
+
+def run(
+    sizes: tuple[int, ...] = DEFAULT_SIZES, only: str = "", log: Callable = None
+) -> dict:
+    """times every benchmark whose name contains only at each size, returns
+    {"meta": ..., "results": {name: {str(n): timings}}}"""
+    results = {}
+    for n in sizes:
+        for name, setup in BENCHMARKS.items():
+            if only not in name:
+                continue
+            fn = setup(n)
+            times = []
+            for _ in range(_repeats(n)):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            timings = {
+                "min_s": min(times),
+                "median_s": statistics.median(times),
+                "ns_per_item": min(times) / n * 1e9,
+                "repeats": len(times),
+            }
+            results.setdefault(name, {})[str(n)] = timings
+            if log:
+                log(f"{name:<36} n={n:<8} {timings['ns_per_item']:>10,.0f} ns/item")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "node": platform.node(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25) -> list[dict]:
+    """each benchmark and size found in both, with ratio current/baseline of the
+    best time. regressed is set where it's over 1 + threshold"""
+    rows = []
+    for name, by_size in current["results"].items():
+        for n, timings in by_size.items():
+            base = baseline["results"].get(name, {}).get(n)
+            if base is None:
+                continue
+            ratio = timings["min_s"] / base["min_s"]
+            rows.append(
+                {
+                    "name": name,
+                    "n": int(n),
+                    "baseline_ns_per_item": base["ns_per_item"],
+                    "ns_per_item": timings["ns_per_item"],
+                    "ratio": ratio,
+                    "regressed": ratio > 1 + threshold,
+                }
+            )
+    return rows
+
+
+def save(results: dict, path: str | Path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path: str | Path) -> dict:
+    with open(path) as f:
+        return json.load(f)
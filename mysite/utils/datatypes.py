@@ -5,6 +5,11 @@ from enum import Enum
 import uuid
 from abc import ABC, abstractmethod
 
+from .store import Store
+from .log import get_logger
+
+logger = get_logger("datatypes")
+
 
 class Currency(Enum):
     # store standardized currency information
@@ -70,10 +75,10 @@ class Unit(Enum):
         type2 = unit2.unit_type
 
         if not type1 == type2:
-            print(f"Units incompliant of types: {type1}, {type2}")
+            logger.debug("units incompliant of types: %s, %s", type1, type2)
             return False
         if type1 == UnitType.OTHER:
-            print(f"Unit Type is of {type1}, skipping")
+            logger.debug("unit type is of %s, skipping", type1)
             return False
         return True
 
@@ -262,6 +267,10 @@ class Quantity:
 class Item(ABC):
     # generic item class for uniform access to variables.
     store = {"No Store": "No Store Specified"}
+    # the store's own id for the product, stable between searches
+    product_id = None
+    # the product's upc/ean codes, as the store gave them
+    barcodes = ()
     description: str = "No description"
     price: Price = Price(0, Currency.GBP)
     quantity: Quantity = Quantity(0, Unit.NULL)
@@ -278,6 +287,59 @@ class Item(ABC):
     def get_quantity(self):
         return self.quantity
 
+    def to_record(self) -> tuple:
+        """compact, picklable form of the displayed fields, the raw payload is dropped"""
+        store = self.store.value if isinstance(self.store, Enum) else None
+        return (
+            store,
+            str(self.identifier),
+            self.description,
+            self.price.amount,
+            self.price.curr.value,
+            self.quantity.amount,
+            self.quantity.unit.name,
+            getattr(self.quantity, "debug", ""),
+            self.thumbnail,
+            self.is_null,
+            self.product_id,
+            tuple(self.barcodes),
+        )
+
+    @classmethod
+    def from_record(cls, record: tuple) -> Item:
+        """rebuilds an item from to_record, as a plain Item"""
+        (
+            store,
+            identifier,
+            description,
+            price_amount,
+            curr,
+            qty_amount,
+            unit,
+            debug,
+            thumbnail,
+            is_null,
+            product_id,
+            barcodes,
+        ) = record
+        quantity = Quantity(qty_amount, Unit[unit])
+        quantity.debug = debug
+
+        # not through __init__, __post_init__ would make a uuid only for it to
+        # be replaced by the recorded one
+        item = Item.__new__(Item)
+        item.description = description
+        item.price = Price(price_amount, Currency(curr))
+        item.quantity = quantity
+        item.thumbnail = thumbnail
+        item.is_null = is_null
+        item.identifier = uuid.UUID(identifier)
+        item.product_id = product_id
+        item.barcodes = barcodes
+        if store is not None:
+            item.store = Store(store)
+        return item
+
     @property
     def unit_price(self):
         try:
@@ -286,5 +348,7 @@ class Item(ABC):
                 quantity=self.quantity,
             )
         except:
-            print(f"UnitPrice.calculate({self.price}, {self.quantity}) failed")
+            logger.debug(
+                "UnitPrice.calculate(%s, %s) failed", self.price, self.quantity
+            )
             return UnitPrice(self.price.amount, self.price.curr, self.quantity.unit)
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+
+import httpx
+
+# connection pool limits for the shared async client
+ASYNC_POOL_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=40)
+ASYNC_TIMEOUT = httpx.Timeout(20.0, connect=5.0)
+
+# an AsyncClient's connections belong to the loop they were opened on, so keep one per loop
+_async_clients: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, httpx.AsyncClient
+] = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """returns the pooled async client for the running event loop, every
+    store plugin on that loop shares its connections"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=ASYNC_POOL_LIMITS, timeout=ASYNC_TIMEOUT)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    # closes the running loop's client, e.g. on server shutdown
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
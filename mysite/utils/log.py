@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# every subsystem logs under this namespace, e.g. "shopping.plugins.waitrose"
+ROOT = "shopping"
+
+# attributes every LogRecord has, anything else came in through extra=
+_RECORD_ATTRS = set(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))
+) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener = None
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """returns the logger for a subsystem, e.g. get_logger("plugins.waitrose")"""
+    return logging.getLogger(f"{ROOT}.{subsystem}")
+
+
+class StructuredFormatter(logging.Formatter):
+    """formats records as one json object per line, extra= fields included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """lets through a fraction of each subsystem's records below WARNING,
+    warnings and errors always pass. the most specific subsystem wins, so
+    {"plugins": 0.1} covers "plugins.waitrose" unless it has its own rate"""
+
+    def __init__(self, sample_rates: dict[str, float]):
+        super().__init__()
+        self.sample_rates = {
+            f"{ROOT}.{subsystem}": rate for subsystem, rate in sample_rates.items()
+        }
+        self._rate_by_name: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rate_by_name.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.sample_rates:
+                    rate = self.sample_rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._rate_by_name[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+def configure(
+    levels: dict[str, str | int] = None,
+    sample_rates: dict[str, float] = None,
+    default_level: str | int = logging.WARNING,
+    stream=None,
+):
+    """sets up the shopping loggers.
+
+    levels and sample_rates are keyed by subsystem, e.g. {"plugins": "DEBUG"}.
+    records are handed to a queue and written out by a background thread, so
+    logging never blocks a request on I/O. records below a logger's level cost
+    a level check and nothing else.
+    """
+    global _listener
+
+    root = logging.getLogger(ROOT)
+    root.setLevel(default_level)
+    root.propagate = False
+
+    for subsystem, level in (levels or {}).items():
+        get_logger(subsystem).setLevel(level)
+
+    if _listener is not None:
+        _listener.stop()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(StructuredFormatter())
+
+    # sampling happens on the calling thread, before the record is queued
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    root.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+
+
+def shutdown():
+    # flushes anything still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
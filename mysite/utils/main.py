@@ -1,12 +1,39 @@
 from __future__ import annotations
 
+import importlib
 
 from .datatypes import Currency, Price, UnitPrice, UnitType, Unit, Quantity, Item
-from .store import Store, StoreUnitMap
+from .store import Store
 from .search import ItemListFilter, SearchResult
 
-from .plugins.asda import AsdaItem, AsdaRequest
-from .plugins.waitrose import WaitroseItem, WaitroseRequest
+# the plugins import requests and httpx, so they're only imported when asked for
+_PLUGIN_NAMES = {
+    "AsdaItem": "asda",
+    "AsdaRequest": "asda",
+    "WaitroseItem": "waitrose",
+    "WaitroseRequest": "waitrose",
+}
+
+__all__ = [
+    "Currency",
+    "Price",
+    "UnitPrice",
+    "UnitType",
+    "Unit",
+    "Quantity",
+    "Item",
+    "Store",
+    "ItemListFilter",
+    "SearchResult",
+    *_PLUGIN_NAMES,
+]
+
+
+def __getattr__(name):
+    if name in _PLUGIN_NAMES:
+        module = importlib.import_module(f".plugins.{_PLUGIN_NAMES[name]}", __package__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 """
@@ -0,0 +1,227 @@
+"""fuzzy cross-store matching, for products without a shared barcode.
+
+descriptions are normalised into words, a brand and a size. each product gets
+a minhash signature of its words' character trigrams, and the signatures are
+split into bands for locality sensitive hashing: only products from different
+stores sharing a band bucket are candidates, and only candidates are scored.
+so matching n products against m is about n + m signatures and a few
+comparisons each, rather than n * m.
+
+pairs are grouped best first, a group never has two products of one store"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import random
+import re
+from dataclasses import dataclass
+from typing import Hashable, Iterable
+
+from .datatypes import Item, Quantity, Unit, UnitType
+from .store import Store
+
+N_HASHES = 32
+# 8 bands of 4 rows, pairs with a jaccard similarity over ~0.6 are likely
+# to share a bucket and ones under ~0.3 unlikely to
+BANDS = 8
+ROWS = N_HASHES // BANDS
+# bigger buckets are skipped, they're words everything has and would make the
+# candidates quadratic
+MAX_BUCKET = 64
+MIN_SCORE = 0.5
+# sizes within this ratio of each other are the same size
+SIZE_TOLERANCE = 1.05
+
+_PRIME = (1 << 61) - 1
+_rand = random.Random(0)
+_PERMUTATIONS = [
+    (_rand.randrange(1, _PRIME), _rand.randrange(0, _PRIME)) for _ in range(N_HASHES)
+]
+
+_WORDS = re.compile(r"[a-z0-9]+")
+_SIZE = re.compile(
+    r"\b(?:(\d+)\s*x\s*)?(\d+(?:\.\d+)?)\s*(kg|g|ml|cl|l|litres?|pk|pack|s)\b"
+)
+# the stores' own labels, which are their own brand
+_OWN_LABEL = re.compile(
+    r"^(?:essential waitrose|waitrose duchy organic|duchy organic|waitrose|"
+    r"asda extra special|extra special|just essentials|asda)\b"
+)
+_STOP_WORDS = frozenset("a and in of the with".split())
+OWN_LABEL = "own label"
+
+
+@functools.lru_cache(maxsize=1)
+def _unit_map() -> dict[str, Unit]:
+    # every store's unit spellings
+    from . import plugins
+
+    units = {"litres": Unit.L, "pack": Unit.PCS}
+    for store in Store:
+        units.update(plugins.get(store).unit_map)
+    return units
+
+
+def parse_size(text: str) -> Quantity | None:
+    """the first size written in text, e.g. "4 x 415g", as a Quantity"""
+    match = _SIZE.search(text.lower())
+    if match is None:
+        return None
+    count, amount, unit = match.groups()
+    unit = _unit_map().get(unit)
+    if unit is None:
+        return None
+    return Quantity(float(amount) * int(count or 1), unit)
+
+
+@dataclass
+class Features:
+    """what's compared of a product"""
+
+    key: Hashable
+    store: Store
+    words: frozenset[str]
+    brand: str | None
+    # the si amount and unit type, None if unknown
+    size: tuple[float, UnitType] | None
+
+    @classmethod
+    def of(cls, item: Item, key: Hashable = None) -> Features:
+        text = item.description.lower()
+        own_label = _OWN_LABEL.match(text)
+        if own_label:
+            text = text[own_label.end() :]
+        words = [
+            w
+            for w in _WORDS.findall(_SIZE.sub(" ", text))
+            if w not in _STOP_WORDS and not w.isdigit()
+        ]
+
+        quantity = item.quantity
+        if quantity.unit == Unit.NULL or not quantity.amount:
+            quantity = parse_size(item.description)
+        size = None
+        if quantity is not None and quantity.unit != Unit.NULL and quantity.amount:
+            si = quantity.to_si()
+            size = (si.amount, si.unit.unit_type)
+
+        return cls(
+            key=item.product_id if key is None else key,
+            store=item.store,
+            words=frozenset(words),
+            brand=OWN_LABEL if own_label else (words[0] if words else None),
+            size=size,
+        )
+
+
+def shingles(words: Iterable[str]) -> set[str]:
+    # character trigrams, so plurals and spellings still mostly overlap
+    found = set()
+    for word in words:
+        padded = f" {word} "
+        found.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return found
+
+
+@functools.lru_cache(maxsize=2**16)
+def _shingle_hash(shingle: str) -> int:
+    # there aren't many distinct trigrams, most are hashed once
+    return int.from_bytes(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little"
+    )
+
+
+def signature(words: Iterable[str]) -> tuple[int, ...]:
+    """the minhash signature of words, N_HASHES ints under 2**61"""
+    hashes = [_shingle_hash(s) for s in shingles(words)]
+    if not hashes:
+        return (_PRIME,) * N_HASHES
+    return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in _PERMUTATIONS)
+
+
+def bands(sig: tuple[int, ...]) -> list[int]:
+    """the signature's band bucket keys"""
+    return [hash((band, sig[band * ROWS : (band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def candidates(
+    features: list[Features], signatures: list[tuple[int, ...]]
+) -> set[tuple[int, int]]:
+    """(i, j) indices of products at different stores sharing a bucket, i < j"""
+    buckets: dict[int, list[int]] = {}
+    for i, sig in enumerate(signatures):
+        for key in bands(sig):
+            buckets.setdefault(key, []).append(i)
+
+    pairs = set()
+    for members in buckets.values():
+        if len(members) < 2 or len(members) > MAX_BUCKET:
+            continue
+        for x, i in enumerate(members):
+            for j in members[x + 1 :]:
+                if features[i].store != features[j].store:
+                    pairs.add((i, j))
+    return pairs
+
+
+def score(a: Features, b: Features) -> float:
+    """how alike a and b are, 0 when they can't be the same product"""
+    if a.brand and b.brand and a.brand != b.brand:
+        return 0.0
+    if a.size and b.size:
+        (amount_a, type_a), (amount_b, type_b) = a.size, b.size
+        if type_a != type_b:
+            return 0.0
+        low, high = sorted((amount_a, amount_b))
+        if low <= 0 or high / low > SIZE_TOLERANCE:
+            return 0.0
+    if not a.words or not b.words:
+        return 0.0
+    return len(a.words & b.words) / len(a.words | b.words)
+
+
+def match(
+    features: list[Features],
+    signatures: list[tuple[int, ...]],
+    min_score: float = MIN_SCORE,
+) -> list[tuple[Hashable, Hashable, float]]:
+    """(key, key, score) of the candidate pairs scoring min_score or more"""
+    matched = []
+    for i, j in candidates(features, signatures):
+        s = score(features[i], features[j])
+        if s >= min_score:
+            matched.append((features[i].key, features[j].key, s))
+    return matched
+
+
+def group(
+    pairs: Iterable[tuple[Hashable, Hashable, float]], stores: dict[Hashable, Store]
+) -> dict[Hashable, Hashable]:
+    """key -> the key of its group, for each key in a group of two or more.
+    pairs are joined best first with union find, but never into a group that
+    would have two products of one store"""
+    parent: dict[Hashable, Hashable] = {}
+    group_stores: dict[Hashable, set[Store]] = {}
+
+    def find(key):
+        root = parent.setdefault(key, key)
+        while root != parent[root]:
+            root = parent[root]
+        while key != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    for a, b, _ in sorted(pairs, key=lambda p: -p[2]):
+        root_a, root_b = find(a), find(b)
+        if root_a == root_b:
+            continue
+        stores_a = group_stores.get(root_a, {stores[a]})
+        stores_b = group_stores.get(root_b, {stores[b]})
+        if stores_a & stores_b:
+            continue
+        parent[root_b] = root_a
+        group_stores[root_a] = stores_a | stores_b
+        group_stores.pop(root_b, None)
+
+    return {key: find(key) for key in parent if find(key) in group_stores}
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from . import allocations, tracing
+
+# upper bounds in seconds, covers a dict lookup up to a slow upstream
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# every metric made, in the order they're rendered
+REGISTRY: list[_Metric] = []
+
+
+class _ShardHolder:
+    # lives in a thread local, so it's collected when its thread exits
+    __slots__ = ("shard", "__weakref__")
+
+    def __init__(self, shard: dict):
+        self.shard = shard
+
+
+class _Metric(ABC):
+    """a metric whose values are sharded by thread. a thread only ever writes to
+    its own shard, so recording takes no lock, the lock is only taken when a
+    thread records its first value and when a thread exits. collect() adds the
+    shards up, a read racing a write may be a value behind but never wrong.
+
+    shards map a tuple of label values to the thread's values for them."""
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ("store",)):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # by id, the shards themselves aren't hashable and may compare equal
+        self._shards: dict[int, dict] = {}
+        # values left by threads which have since exited
+        self._retired: dict = {}
+
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            shard = {}
+            holder = self._local.holder = _ShardHolder(shard)
+            weakref.finalize(holder, self._retire, shard).atexit = False
+            with self._lock:
+                self._shards[id(shard)] = shard
+        return holder.shard
+
+    def _retire(self, shard: dict):
+        with self._lock:
+            del self._shards[id(shard)]
+            self._merge(self._retired, shard)
+
+    @abstractmethod
+    def _merge(self, into: dict, shard: dict):
+        pass
+
+    def collect(self) -> dict:
+        """the values across all threads, by tuple of label values"""
+        total = {}
+        with self._lock:
+            shards = [self._retired, *self._shards.values()]
+        for shard in shards:
+            # copying the items is atomic, the owning thread may add keys meanwhile
+            self._merge(total, dict(list(shard.items())))
+        return total
+
+    def _label_str(self, label_values: tuple, **extra) -> str:
+        pairs = list(zip(self.labels, label_values)) + list(extra.items())
+        if not pairs:
+            return ""
+        escaped = (
+            (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in pairs
+        )
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def _merge(self, into: dict, shard: dict):
+        for key, value in shard.items():
+            into[key] = into.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{self._label_str(key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = ("store",),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        shard = self._shard()
+        values = shard.get(label_values)
+        if values is None:
+            # a count per bucket plus +Inf, then the sum
+            values = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def _merge(self, into: dict, shard: dict):
+        for key, values in shard.items():
+            total = into.get(key)
+            if total is None:
+                into[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    total[i] += value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, values in sorted(self.collect().items()):
+            # prometheus buckets are cumulative
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                labels = self._label_str(key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "shopping_stage_seconds",
+    "time spent in each stage of a search",
+    labels=("stage", "store"),
+)
+UPSTREAM_REQUESTS = Counter(
+    "shopping_upstream_requests_total", "requests sent to the store's api"
+)
+UPSTREAM_BYTES = Counter(
+    "shopping_upstream_bytes_total", "response body bytes received from the store's api"
+)
+CACHE_HITS = Counter(
+    "shopping_cache_hits_total", "prefetched pages which were ready when needed"
+)
+CACHE_MISSES = Counter(
+    "shopping_cache_misses_total", "pages which had to be waited for"
+)
+
+
+@contextmanager
+def stage(name: str, store: str = "all", **args):
+    """times the block into shopping_stage_seconds, e.g.
+
+    with stage("fetch", "waitrose"):
+        response = requests.request(...)
+
+    when a trace is being recorded the block is also a span in it, with args,
+    and when allocations are being profiled it's snapshotted either side
+    """
+    trace = tracing.current_trace()
+    allocation_profiler = allocations.current()
+    if allocation_profiler is not None:
+        before = allocation_profiler.before()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        STAGE_SECONDS.observe(end - start, name, store)
+        if trace is not None:
+            trace.add(name, start, end, store=store, **args)
+        if allocation_profiler is not None:
+            allocation_profiler.after(name, store, before)
+
+
+def count_upstream(store: str, response) -> None:
+    # works for both requests and httpx responses
+    UPSTREAM_REQUESTS.inc(store)
+    UPSTREAM_BYTES.inc(store, amount=len(response.content))
+
+
+def render() -> str:
+    """every metric in the prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
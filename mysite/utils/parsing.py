@@ -0,0 +1,72 @@
+"""parsing raw store items across processes.
+
+turning raw dicts into items is pure python, so in threads it runs on one core
+whatever the box has. a ParsePool splits the raw items into chunks for a
+persistent pool of worker processes, which parse them with the store's plugin
+and send back Item.to_record tuples rather than the items themselves, they
+pickle to a fraction of the size and leave the raw payload behind"""
+
+from __future__ import annotations
+
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from . import plugins
+from .datatypes import Item
+from .store import Store
+
+# below this many items per worker the pickling costs more than it saves
+MIN_CHUNK = 250
+
+
+def parse_records(store_value: str, raw_items: list) -> list[tuple]:
+    """raw items -> records of the ones which aren't null, runs in a worker"""
+    item_class = plugins.get(Store(store_value)).item_class
+    records = []
+    for raw_item in raw_items:
+        item = item_class(raw_item)
+        if not item.is_null:
+            records.append(item.to_record())
+    return records
+
+
+class ParsePool:
+    """a persistent process pool for parsing, started on first use"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: ProcessPoolExecutor = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn rather than fork, the web server has threads running
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _chunks(self, raw_items: list) -> list[list]:
+        size = max(math.ceil(len(raw_items) / self.workers), MIN_CHUNK)
+        return [raw_items[i : i + size] for i in range(0, len(raw_items), size)]
+
+    def parse_records(self, store: Store, raw_items: list) -> list[tuple]:
+        """records of the non null items, in the order of raw_items"""
+        chunks = self._chunks(raw_items)
+        records = []
+        for chunk in self.executor.map(parse_records, repeat(store.value), chunks):
+            records += chunk
+        return records
+
+    def parse(self, store: Store, raw_items: list) -> list[Item]:
+        """the non null items as plain Items"""
+        return [
+            Item.from_record(record) for record in self.parse_records(store, raw_items)
+        ]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
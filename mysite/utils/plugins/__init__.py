@@ -0,0 +1,74 @@
+"""store plugins, found without importing them and loaded on first use.
+
+a plugin is a module with a PLUGIN = StorePlugin(...) in it. they're listed,
+store value -> "module:attribute", in builtin.json next to this file, under the
+"shopping.stores" entry point group of any installed package, and in the json
+file named by $SHOPPING_PLUGINS, later ones winning. the Store enum is made
+from that list, so adding a store costs a line of json at startup and nothing
+more until something searches it"""
+
+from __future__ import annotations
+
+import importlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..datatypes import Item, Unit
+    from ..searchrequest import GrocerySearchRequest
+
+ENTRY_POINT_GROUP = "shopping.stores"
+BUILTIN = Path(__file__).with_name("builtin.json")
+
+_specs: dict[str, str] = None
+# store value -> loaded plugin
+_loaded: dict[str, StorePlugin] = {}
+_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class StorePlugin:
+    search_request_class: type[GrocerySearchRequest]
+    item_class: type[Item]
+    # unit as the store writes it -> Unit
+    unit_map: dict[str, Unit]
+
+
+def _read(path: str | Path) -> dict[str, str]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def discover() -> dict[str, str]:
+    """store value -> "module:attribute" of every plugin, nothing is imported"""
+    global _specs
+    if _specs is None:
+        specs = _read(BUILTIN)
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            specs[entry_point.name] = entry_point.value
+        if os.environ.get("SHOPPING_PLUGINS"):
+            specs.update(_read(os.environ["SHOPPING_PLUGINS"]))
+        _specs = specs
+    return _specs
+
+
+def get(store) -> StorePlugin:
+    """the plugin for a Store, imported the first time it's asked for"""
+    plugin = _loaded.get(store.value)
+    if plugin is None:
+        with _lock:
+            plugin = _loaded.get(store.value)
+            if plugin is None:
+                module_name, _, attribute = discover()[store.value].partition(":")
+                module = importlib.import_module(module_name)
+                plugin = _loaded[store.value] = getattr(module, attribute or "PLUGIN")
+    return plugin
+
+
+def is_loaded(store) -> bool:
+    return store.value in _loaded
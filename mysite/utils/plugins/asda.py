@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import aenum
-
 import re
 import requests
 
@@ -12,44 +10,20 @@ from ..datatypes import Unit, Quantity
 
 
 from ..searchrequest import GrocerySearchRequest
-from ..search import SearchEnum
-
-
-from ..store import Store, StoreUnitMap
-
-
-def register():
-    s = "asda"
-    if not s in [store.value for store in Store]:
-        # regster the store name in in the enum
-        aenum.extend_enum(Store, s.upper(), s.lower())
-
-        s = Store.ASDA
-        # register the store's unit map
-        aenum.extend_enum(
-            StoreUnitMap,
-            s.value.upper(),
-            (
-                s,
-                {
-                    "l": Unit.L,
-                    "kg": Unit.KG,
-                    "g": Unit.G,
-                    "pk": Unit.PCS,
-                },
-            ),
-        )
+from ..httpclient import get_async_client
+from .. import metrics
 
-        s = Store.ASDA
-        aenum.extend_enum(
-            SearchEnum,
-            s.value.upper(),
-            (
-                Store.ASDA,
-                AsdaRequest,
-                AsdaItem,
-            ),
-        )
+
+from ..store import Store
+from . import StorePlugin
+
+# unit as asda writes it -> Unit
+UNIT_MAP = {
+    "l": Unit.L,
+    "kg": Unit.KG,
+    "g": Unit.G,
+    "pk": Unit.PCS,
+}
 
 
 class AsdaItem(Item):
@@ -59,6 +33,8 @@ class AsdaItem(Item):
         self.raw_item = raw_item
 
         self.store = Store.ASDA
+        self.product_id = self._fetch_product_id()
+        self.barcodes = self._fetch_barcodes()
         self.description = self._fetch_description()
         self.thumbnail = self.fetch_thumbnail()
         self.price = self._fetch_price()
@@ -66,6 +42,13 @@ class AsdaItem(Item):
         self.is_null = False
 
     # todo add try excepts to each of these
+    def _fetch_product_id(self) -> str:
+        # the barcode, the thumbnail is looked up by it too
+        return self.raw_item["item"]["upc_numbers"][0]
+
+    def _fetch_barcodes(self) -> tuple:
+        return tuple(self.raw_item["item"].get("upc_numbers", ()))
+
     def _fetch_description(self) -> str:
         return self.raw_item["item"]["name"]
 
@@ -94,7 +77,7 @@ class AsdaItem(Item):
             amount = float(qty_info[0])
 
         try:
-            unit = Unit(StoreUnitMap(Store.ASDA).unit_dict[qty_info[-1]])
+            unit = UNIT_MAP[qty_info[-1]]
         except:
             unit = Unit.NULL
 
@@ -137,13 +120,46 @@ class AsdaRequest(GrocerySearchRequest):
     """Does a post request to the asda search api, and stores the response.
     effective for any page size"""
 
-    def __init__(self, search_term: str, max_items: int = 0):
+    # can be pointed elsewhere, e.g. at a stand-in for load testing
+    URL = "https://groceries.asda.com/api/bff/graphql"
+
+    def __init__(self, search_term: str, max_items: int = 0, lazy: bool = False):
         self.search_term = search_term
         self.max_items = max_items
-        self.query(search_term=search_term)
+
+        # lazy requests fetch nothing up front, pages are pulled through cursor()
+        if not lazy:
+            self.query(search_term=search_term)
 
     def query(self, search_term: str):
-        url = "https://groceries.asda.com/api/bff/graphql"
+        self.response = self._post(search_term, page=1, page_size=self.max_items)
+
+    def _post(self, search_term: str, page: int, page_size: int) -> "httpresponse":
+        with metrics.stage("fetch", "asda", page=page, page_size=page_size):
+            response = requests.request(
+                **self._request_kwargs(search_term, page, page_size)
+            )
+        metrics.count_upstream("asda", response)
+        return response
+
+    async def _apost(
+        self, search_term: str, page: int, page_size: int
+    ) -> "httpresponse":
+        # async _post, shares the running loop's connection pool
+        with metrics.stage("fetch", "asda", page=page, page_size=page_size):
+            response = await get_async_client().request(
+                **self._request_kwargs(search_term, page, page_size)
+            )
+        metrics.count_upstream("asda", response)
+        return response
+
+    async def aquery(self, search_term: str):
+        self.response = await self._apost(search_term, page=1, page_size=self.max_items)
+
+    @classmethod
+    def _request_kwargs(cls, search_term: str, page: int, page_size: int) -> dict:
+        # the request as keyword arguments, common to requests and httpx
+        url = cls.URL
 
         payload = {
             "requestorigin": "gi",
@@ -280,8 +296,8 @@ class AsdaRequest(GrocerySearchRequest):
                 "is_eat_and_collect": False,
                 "store_id": "4565",
                 "type": "search",
-                "page_size": self.max_items,
-                "page": 1,
+                "page_size": page_size,
+                "page": page,
                 "request_origin": "gi",
                 # "ship_date": 1669939200000,
                 "payload": {
@@ -296,14 +312,40 @@ class AsdaRequest(GrocerySearchRequest):
         }
         headers = {"content-type": "application/json", "request-origin": "gi"}
 
-        self.response = requests.request("POST", url, json=payload, headers=headers)
+        return dict(method="POST", url=url, json=payload, headers=headers)
+
+    @staticmethod
+    def _configs_from_json(data: dict) -> dict:
+        return data["data"]["tempo_cms_content"]["zones"][1]["configs"]
+
+    @staticmethod
+    def _decode(response: "httpresponse") -> dict:
+        with metrics.stage("decode", "asda"):
+            return response.json()
 
     def get_total_items(self):
-        return self.response.json()["data"]["tempo_cms_content"]["zones"][1]["configs"][
-            "total_records"
-        ]
+        return self._configs_from_json(self._decode(self.response))["total_records"]
 
     def get_items_as_list(self):
-        return self.response.json()["data"]["tempo_cms_content"]["zones"][1]["configs"][
-            "products"
-        ]["items"]
+        return self._configs_from_json(self._decode(self.response))["products"]["items"]
+
+    def fetch_page(self, start: int, size: int) -> tuple[list, int]:
+        # asda pages by number, the cursor keeps start a multiple of size
+        configs = self._configs_from_json(
+            self._decode(
+                self._post(self.search_term, page=start // size + 1, page_size=size)
+            )
+        )
+        return configs["products"]["items"], int(configs["total_records"])
+
+    async def afetch_page(self, start: int, size: int) -> tuple[list, int]:
+        response = await self._apost(
+            self.search_term, page=start // size + 1, page_size=size
+        )
+        configs = self._configs_from_json(self._decode(response))
+        return configs["products"]["items"], int(configs["total_records"])
+
+
+PLUGIN = StorePlugin(
+    search_request_class=AsdaRequest, item_class=AsdaItem, unit_map=UNIT_MAP
+)
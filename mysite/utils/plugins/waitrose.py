@@ -1,54 +1,29 @@
 from __future__ import annotations
 
 
-import aenum
 import re
 import requests
 from pathlib import Path
 
 from ..datatypes import *
-from ..store import Store, StoreUnitMap
+from ..store import Store
+from . import StorePlugin
 from ..searchrequest import GrocerySearchRequest
+from ..httpclient import get_async_client
+from ..log import get_logger
+from .. import metrics
 
-# regster the store name in in the enum
-
-
-def register():
-    s = "waitrose"
-    # if not s in set(item.value for item in Store):
-    if not s in [store.value for store in Store]:
-        aenum.extend_enum(Store, s.upper(), s.lower())
-
-        s = Store.WAITROSE
-        # if not s in set(item.value for item in Store):
-        aenum.extend_enum(
-            StoreUnitMap,
-            s.value.upper(),
-            (
-                s,
-                {
-                    "litre": Unit.L,
-                    "ml": Unit.ML,
-                    "kg": Unit.KG,
-                    "g": Unit.G,
-                    "s": Unit.PCS,
-                    "cl": Unit.CL,
-                },
-            ),
-        )
+logger = get_logger("plugins.waitrose")
 
-        from ..search import SearchEnum
-
-        s = Store.WAITROSE
-        aenum.extend_enum(
-            SearchEnum,
-            s.value.upper(),
-            (
-                Store.WAITROSE,
-                WaitroseRequest,
-                WaitroseItem,
-            ),
-        )
+# unit as waitrose writes it -> Unit
+UNIT_MAP = {
+    "litre": Unit.L,
+    "ml": Unit.ML,
+    "kg": Unit.KG,
+    "g": Unit.G,
+    "s": Unit.PCS,
+    "cl": Unit.CL,
+}
 
 
 class WaitroseItem(Item):
@@ -58,6 +33,8 @@ class WaitroseItem(Item):
         self.is_null = False
 
         self.store = Store.WAITROSE
+        self.product_id = self.fetch_product_id()
+        # no barcodes, waitrose's search results only have its own lineNumber
         self.description = self.fetch_description()
         self.price = self.fetch_price()
         self.quantity = self.fetch_quanity()
@@ -79,8 +56,7 @@ class WaitroseItem(Item):
         else:
             amount = float(qty_info[0])
         try:
-            unit = Unit(StoreUnitMap(Store.WAITROSE).unit_dict[qty_info[-1]])
-            # unit = Unit(STORE_UNIT_MAP[Store.WAITROSE][qty_info[-1]])
+            unit = UNIT_MAP[qty_info[-1]]
         except:
             unit = Unit.NULL
 
@@ -97,6 +73,12 @@ class WaitroseItem(Item):
         currency = Currency.GBP
         return Price(flt, currency)
 
+    def fetch_product_id(self) -> str:
+        try:
+            return self.raw_item["searchProduct"]["id"]
+        except:
+            return None
+
     def fetch_description(self) -> str:
         try:
             return self.raw_item["searchProduct"]["name"]
@@ -160,14 +142,18 @@ class WaitroseRequest(GrocerySearchRequest):
     Needs to be modified to handle item lists > 128 per page"""
 
     MAX_REQUEST_SIZE = 128
+    # can be pointed elsewhere, e.g. at a stand-in for load testing
+    URL = "https://www.waitrose.com/api/content-prod/v2/cms/publish/productcontent/search/-1"
 
-    def __init__(self, search_term: str, max_items: int = 5000):
+    def __init__(self, search_term: str, max_items: int = 5000, lazy: bool = False):
         super().__init__()  # basically just for debugging at the moment
 
         self.search_term = search_term
         self.max_items = max_items
 
-        self.multi_query()
+        # lazy requests fetch nothing up front, pages are pulled through cursor()
+        if not lazy:
+            self.multi_query()
 
         # self.query(search_term=search_term)
 
@@ -175,11 +161,38 @@ class WaitroseRequest(GrocerySearchRequest):
         self, search_term: str, start: int, size: int = WAITROSE_MAX_REQUEST_SIZE
     ) -> "httpresponse":
 
-        print(
-            f"Sending request to waitrose.com for '{search_term}', start={start}, size={size}"
-        )  # for debugging
+        logger.debug(
+            "sending request to waitrose.com",
+            extra={"search_term": search_term, "start": start, "size": size},
+        )
 
-        url = "https://www.waitrose.com/api/content-prod/v2/cms/publish/productcontent/search/-1"
+        with metrics.stage("fetch", "waitrose", start=start, size=size):
+            response = requests.request(
+                **self._request_kwargs(search_term, start, size)
+            )
+        metrics.count_upstream("waitrose", response)
+        return response
+
+    async def aquery(
+        self, search_term: str, start: int, size: int = WAITROSE_MAX_REQUEST_SIZE
+    ) -> "httpresponse":
+        # async query, shares the running loop's connection pool
+        with metrics.stage("fetch", "waitrose", start=start, size=size):
+            response = await get_async_client().request(
+                **self._request_kwargs(search_term, start, size)
+            )
+        metrics.count_upstream("waitrose", response)
+        return response
+
+    @staticmethod
+    def _decode(response: "httpresponse") -> dict:
+        with metrics.stage("decode", "waitrose"):
+            return response.json()
+
+    @classmethod
+    def _request_kwargs(cls, search_term: str, start: int, size: int) -> dict:
+        # the request as keyword arguments, common to requests and httpx
+        url = cls.URL
 
         querystring = {"clientType": "WEB_APP"}
 
@@ -199,17 +212,37 @@ class WaitroseRequest(GrocerySearchRequest):
         }
         headers = {"authorization": "Bearer unauthenticated"}
 
-        return requests.request(
-            "POST", url, json=payload, headers=headers, params=querystring
+        return dict(
+            method="POST", url=url, json=payload, headers=headers, params=querystring
         )
 
     def get_total_items(self) -> int:
         return int(
-            self.query(search_term=self.search_term, start=1, size=1).json()[
+            self._decode(self.query(search_term=self.search_term, start=1, size=1))[
                 "totalMatches"
             ]
         )
 
+    def fetch_page(self, start: int, size: int) -> tuple[list, int]:
+        # waitrose is 1-indexed and caps the page size
+        data = self._decode(
+            self.query(
+                search_term=self.search_term,
+                start=start + 1,
+                size=min(size, WAITROSE_MAX_REQUEST_SIZE),
+            )
+        )
+        return data["componentsAndProducts"], int(data["totalMatches"])
+
+    async def afetch_page(self, start: int, size: int) -> tuple[list, int]:
+        response = await self.aquery(
+            search_term=self.search_term,
+            start=start + 1,
+            size=min(size, WAITROSE_MAX_REQUEST_SIZE),
+        )
+        data = self._decode(response)
+        return data["componentsAndProducts"], int(data["totalMatches"])
+
     def multi_query(self):
         self.response_list = []
 
@@ -240,8 +273,14 @@ class WaitroseRequest(GrocerySearchRequest):
     def get_items_as_list(self) -> list:
         res = []
         for response in self.response_list:
-            res += response.json()["componentsAndProducts"]
-        print(
-            f"Successfully retrieved {len(res)} items. You requested a maximum of {self.max_items} (default:5000)"
+            res += self._decode(response)["componentsAndProducts"]
+        logger.debug(
+            "retrieved items",
+            extra={"n_items": len(res), "max_items": self.max_items},
         )
         return res
+
+
+PLUGIN = StorePlugin(
+    search_request_class=WaitroseRequest, item_class=WaitroseItem, unit_map=UNIT_MAP
+)
@@ -0,0 +1,452 @@
+"""every product's price over time, in an append-only columnar store.
+
+each store has a directory with two files. new observations are appended to
+"log", and compaction folds the log into "segment", which is memory mapped:
+
+    segment: MAGIC, resolution, n, then n index entries sorted by key
+             (key, offset, length), then the blocks they point at
+    block:   the product id, then a column of times and a column of prices
+
+times are kept in buckets of resolution seconds, one observation per bucket,
+and prices in integer pence. both columns are delta encoded then run length
+encoded as varints, so a product seen every day whose price changes once a
+month costs a few bytes a month. looking one up is a binary search of the
+index and decoding one block, and only the runs overlapping the range asked
+for are expanded.
+
+appends and compaction hold an flock on the log, so the web server and the
+crawl command can both write to the same directory. readers notice other
+processes' appends and compactions when they next look"""
+
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from .datatypes import Currency, Item
+
+MAGIC = b"PHS1"
+DAY = 24 * 3600
+# log observations before a store's log is folded into its segment
+COMPACT_EVERY = 100_000
+
+_HEADER = struct.Struct("<4sII")
+# key, offset and length of a product's block
+_ENTRY = struct.Struct("<QQI")
+# id length, time and pence, followed by the id
+_LOG_RECORD = struct.Struct("<Hqq")
+
+
+def _key(product_id: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(product_id, digest_size=8).digest(), "little")
+
+
+def _write_varint(out: bytearray, n: int):
+    while n > 0x7F:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _unzigzag(n: int) -> int:
+    return -(n >> 1) - 1 if n & 1 else n >> 1
+
+
+def _time_runs(buckets: list[int]) -> list[list[int]]:
+    # [delta, count], count steps of delta each
+    runs: list[list[int]] = []
+    previous = 0
+    for bucket in buckets:
+        delta, previous = bucket - previous, bucket
+        if runs and runs[-1][0] == delta:
+            runs[-1][1] += 1
+        else:
+            runs.append([delta, 1])
+    return runs
+
+
+def _price_runs(prices: list[int]) -> list[list[int]]:
+    # [zigzagged delta, count], a change of delta then count - 1 the same
+    runs: list[list[int]] = []
+    previous = 0
+    for price in prices:
+        if runs and price == previous:
+            runs[-1][1] += 1
+        else:
+            runs.append([_zigzag(price - previous), 1])
+        previous = price
+    return runs
+
+
+def encode_block(product_id: bytes, points: list[tuple[int, int]]) -> bytes:
+    """product_id and its (bucket, pence) points, sorted by bucket, as a block.
+    the buckets and the prices are columns of their own, each delta encoded
+    then run length encoded, so a gap in the days doesn't cost anything in
+    the prices and a price change doesn't cost anything in the days"""
+    out = bytearray()
+    _write_varint(out, len(product_id))
+    out += product_id
+    for runs in (
+        _time_runs([bucket for bucket, _ in points]),
+        _price_runs([pence for _, pence in points]),
+    ):
+        _write_varint(out, len(runs))
+        for delta, count in runs:
+            _write_varint(out, delta)
+            _write_varint(out, count)
+    return bytes(out)
+
+
+def block_id(block: bytes) -> bytes:
+    n, pos = _read_varint(block, 0)
+    return block[pos : pos + n]
+
+
+def decode_block(block: bytes, lo: int = 0, hi: int = None) -> list[tuple[int, int]]:
+    """the block's (bucket, pence) points with lo <= bucket <= hi. only the
+    runs overlapping the range are expanded"""
+    n, pos = _read_varint(block, 0)
+    n_runs, pos = _read_varint(block, pos + n)
+    buckets: list[int] = []
+    # the index of the first point in the range
+    first = None
+    done = False
+    t = i = 0
+    for _ in range(n_runs):
+        delta, pos = _read_varint(block, pos)
+        count, pos = _read_varint(block, pos)
+        if done:
+            # still have to get past the rest of the column
+            continue
+        last = t + count * delta
+        if hi is not None and t + delta > hi:
+            done = True
+        elif last >= lo:
+            # the run's k-th point is at t + k * delta
+            k_lo = 1 if t + delta >= lo else -(-(lo - t) // delta)
+            k_hi = count if hi is None or last <= hi else (hi - t) // delta
+            if first is None:
+                first = i + k_lo - 1
+            buckets += [t + k * delta for k in range(k_lo, k_hi + 1)]
+        t, i = last, i + count
+    if first is None:
+        return []
+
+    n_runs, pos = _read_varint(block, pos)
+    prices: list[int] = []
+    stop = first + len(buckets)
+    p = i = 0
+    for _ in range(n_runs):
+        delta, pos = _read_varint(block, pos)
+        count, pos = _read_varint(block, pos)
+        p += _unzigzag(delta)
+        # a run is one point delta from the last, then count - 1 more the same
+        overlap = min(i + count, stop) - max(i, first)
+        if overlap > 0:
+            prices += [p] * overlap
+        i += count
+        if i >= stop:
+            break
+    return list(zip(buckets, prices))
+
+
+def _merge(old: list[tuple[int, int]], new: list[tuple[int, int]]):
+    # by bucket, a later observation in the same bucket wins
+    by_bucket = dict(old)
+    by_bucket.update(new)
+    return sorted(by_bucket.items())
+
+
+class Segment:
+    """one store's price history, in directory"""
+
+    def __init__(
+        self,
+        directory: str | Path,
+        resolution: int = DAY,
+        compact_every: int = COMPACT_EVERY,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.resolution = resolution
+        self.compact_every = compact_every
+        self.log_path = self.directory / "log"
+        self.segment_path = self.directory / "segment"
+
+        self._lock = threading.RLock()
+        # appends only, O_APPEND so other processes' records aren't overwritten
+        self._log = open(self.log_path, "ab")
+        self._log_reader = open(self.log_path, "rb")
+        self._map: mmap.mmap | bytes = b""
+        self._n = 0
+        self._segment_ino = None
+        self._load()
+
+    def _load(self):
+        # (re)reads the segment and the whole log
+        self._pending: dict[bytes, list[tuple[int, int]]] = {}
+        self._n_pending = 0
+        self._log_offset = 0
+        self._map_segment()
+        self._read_log()
+
+    def _map_segment(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map, self._n, self._segment_ino = b"", 0, None
+        try:
+            with open(self.segment_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_size:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._segment_ino = stat.st_ino
+        except FileNotFoundError:
+            return
+        if self._map:
+            magic, resolution, self._n = _HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ValueError(f"{self.segment_path} isn't a price history segment")
+            if resolution != self.resolution:
+                raise ValueError(
+                    f"{self.segment_path} has a resolution of {resolution}s, "
+                    f"not {self.resolution}s"
+                )
+
+    def _read_log(self):
+        # the records appended since we last looked, an incomplete one at the
+        # end is being written and is left for next time
+        self._log_reader.seek(self._log_offset)
+        data = self._log_reader.read()
+        pos = 0
+        while pos + _LOG_RECORD.size <= len(data):
+            n, when, pence = _LOG_RECORD.unpack_from(data, pos)
+            end = pos + _LOG_RECORD.size + n
+            if end > len(data):
+                break
+            product_id = data[pos + _LOG_RECORD.size : end]
+            self._pending.setdefault(product_id, []).append(
+                (when // self.resolution, pence)
+            )
+            self._n_pending += 1
+            pos = end
+        self._log_offset += pos
+
+    def _refresh(self):
+        # catches up with other processes' appends and compactions
+        try:
+            ino = os.stat(self.segment_path).st_ino
+        except FileNotFoundError:
+            ino = None
+        size = os.fstat(self._log_reader.fileno()).st_size
+        if ino != self._segment_ino or size < self._log_offset:
+            self._load()
+        elif size > self._log_offset:
+            self._read_log()
+
+    def append(self, observations: Iterable[tuple[str, float, int]]):
+        """appends (product_id, unix time, pence) observations, and compacts
+        once compact_every of them are waiting in the log"""
+        out = bytearray()
+        for product_id, when, pence in observations:
+            product_id = product_id.encode()
+            out += _LOG_RECORD.pack(len(product_id), int(when), pence)
+            out += product_id
+        if not out:
+            return
+        with self._lock:
+            fcntl.flock(self._log, fcntl.LOCK_EX)
+            try:
+                self._log.write(out)
+                self._log.flush()
+            finally:
+                fcntl.flock(self._log, fcntl.LOCK_UN)
+            self._refresh()
+            if self.compact_every and self._n_pending >= self.compact_every:
+                self.compact()
+
+    def _entry(self, i: int) -> tuple[int, int, int]:
+        return _ENTRY.unpack_from(self._map, _HEADER.size + i * _ENTRY.size)
+
+    def _block(self, product_id: bytes) -> bytes | None:
+        key = _key(product_id)
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        # almost always one, but two ids can share a key
+        for i in range(lo, self._n):
+            entry_key, offset, length = self._entry(i)
+            if entry_key != key:
+                break
+            block = self._map[offset : offset + length]
+            if block_id(block) == product_id:
+                return block
+        return None
+
+    def history(
+        self, product_id: str, start: float = None, end: float = None
+    ) -> list[tuple[int, int]]:
+        """(unix time, pence) of product_id's observations from start to end,
+        oldest first. times are the start of their bucket"""
+        lo = 0 if start is None else -(-int(start) // self.resolution)
+        hi = None if end is None else int(end) // self.resolution
+        product_id = product_id.encode()
+        with self._lock:
+            self._refresh()
+            block = self._block(product_id)
+            pending = self._pending.get(product_id)
+        points = decode_block(block, lo, hi) if block else []
+        if pending:
+            pending = [
+                (t, p) for t, p in pending if t >= lo and (hi is None or t <= hi)
+            ]
+            points = _merge(points, pending)
+        return [(t * self.resolution, p) for t, p in points]
+
+    def product_ids(self) -> list[str]:
+        with self._lock:
+            self._refresh()
+            ids = {
+                block_id(self._map[offset : offset + length])
+                for _, offset, length in map(self._entry, range(self._n))
+            }
+            ids.update(self._pending)
+        return sorted(product_id.decode() for product_id in ids)
+
+    def compact(self):
+        """folds the log into a new segment, which replaces the old one"""
+        with self._lock:
+            fcntl.flock(self._log, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if not self._pending:
+                    return
+                self._write_segment()
+                # O_APPEND writers carry on from the new end
+                os.ftruncate(self._log.fileno(), 0)
+            finally:
+                fcntl.flock(self._log, fcntl.LOCK_UN)
+            self._load()
+
+    def _write_segment(self):
+        # unchanged blocks are copied as they are, the rest are re-encoded
+        blocks: list[tuple[int, bytes, bytes]] = []
+        pending = dict(self._pending)
+        for i in range(self._n):
+            key, offset, length = self._entry(i)
+            block = self._map[offset : offset + length]
+            product_id = block_id(block)
+            if product_id in pending:
+                points = _merge(decode_block(block), pending.pop(product_id))
+                block = encode_block(product_id, points)
+            blocks.append((key, product_id, block))
+        for product_id, points in pending.items():
+            block = encode_block(product_id, _merge([], points))
+            blocks.append((_key(product_id), product_id, block))
+        blocks.sort(key=lambda b: b[:2])
+
+        tmp = self.segment_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, self.resolution, len(blocks)))
+            offset = _HEADER.size + len(blocks) * _ENTRY.size
+            for key, _, block in blocks:
+                f.write(_ENTRY.pack(key, offset, len(block)))
+                offset += len(block)
+            for _, _, block in blocks:
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.segment_path)
+
+    def size(self) -> int:
+        """bytes on disk"""
+        return sum(
+            path.stat().st_size
+            for path in (self.log_path, self.segment_path)
+            if path.exists()
+        )
+
+    def close(self):
+        with self._lock:
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+            self._map = b""
+            self._log.close()
+            self._log_reader.close()
+
+
+def pence(item: Item) -> int:
+    """item's price in integer pence of gbp"""
+    price = item.price
+    return round(price.amount * Currency.exchange_rate(price.curr, Currency.GBP) * 100)
+
+
+class PriceHistory:
+    """a Segment per store, in directories of root named by store value"""
+
+    def __init__(self, root: str | Path, **segment_kwargs):
+        self.root = Path(root)
+        self.segment_kwargs = segment_kwargs
+        self._segments: dict[str, Segment] = {}
+        self._lock = threading.Lock()
+
+    def segment(self, store_value: str) -> Segment:
+        with self._lock:
+            if store_value not in self._segments:
+                self._segments[store_value] = Segment(
+                    self.root / store_value, **self.segment_kwargs
+                )
+            return self._segments[store_value]
+
+    def record(self, items: Iterable[Item], when: float):
+        """appends the items' prices as observed at unix time when, items
+        without a product id are skipped"""
+        by_store: dict[str, list] = {}
+        for item in items:
+            if item.product_id and not item.is_null:
+                by_store.setdefault(item.store.value, []).append(
+                    (item.product_id, when, pence(item))
+                )
+        for store_value, observations in by_store.items():
+            self.segment(store_value).append(observations)
+
+    def history(
+        self, store_value: str, product_id: str, start: float = None, end: float = None
+    ) -> list[tuple[int, int]]:
+        return self.segment(store_value).history(product_id, start, end)
+
+    def compact(self):
+        if not self.root.exists():
+            return
+        for store_value in [p.name for p in self.root.iterdir() if p.is_dir()]:
+            self.segment(store_value).compact()
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+# what each kind of profile is saved as
+SUFFIXES = {"cprofile": ".prof", "flame": ".collapsed"}
+
+
+class _Profiles:
+    # the stats of a cprofile block and of the work it handed to other threads
+    def __init__(self):
+        self.stats: pstats.Stats | None = None
+        self._lock = threading.Lock()
+
+    def add(self, profiler: cProfile.Profile):
+        with self._lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+
+# the cprofile block running in the current context, if any
+_profiles: contextvars.ContextVar[_Profiles | None] = contextvars.ContextVar(
+    "profiles", default=None
+)
+
+
+def _path(directory: str | Path, name: str, kind: str) -> Path:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / (
+        f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+        + SUFFIXES[kind]
+    )
+
+
+@contextmanager
+def cprofile(directory: str | Path, name: str):
+    """runs the block under cProfile and dumps the stats into directory, open
+    them with pstats or snakeviz. the calling thread is profiled, and whatever
+    it hands to other threads through propagate() if that's done by the end"""
+    profiles = _Profiles()
+    token = _profiles.set(profiles)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profiles.reset(token)
+        profiles.add(profiler)
+        profiles.stats.dump_stats(_path(directory, name, "cprofile"))
+
+
+def propagate(fn: Callable) -> Callable:
+    """fn profiled into the current cprofile block, for handing to an executor.
+    fn itself when nothing is profiled"""
+    profiles = _profiles.get()
+    if profiles is None:
+        return fn
+
+    def run(*args, **kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiles.add(profiler)
+
+    return run
+
+
+class StackSampler:
+    """samples the stacks of every other thread every interval seconds, so work
+    handed to executors shows up too. stacks are kept collapsed, one
+    "thread;outer;...;inner" string per distinct stack, with how often it was seen"""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """the samples in the collapsed stack format flamegraph.pl and speedscope read"""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+@contextmanager
+def sampled(directory: str | Path, name: str, interval: float = 0.001):
+    """samples every thread's stack while the block runs and saves them as
+    collapsed stacks into directory"""
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        _path(directory, name, "flame").write_text(sampler.collapsed())
+
+
+def list_profiles(directory: str | Path) -> list[Path]:
+    """saved profiles, newest first"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    profiles = [p for p in directory.iterdir() if p.suffix in SUFFIXES.values()]
+    return sorted(profiles, key=lambda p: p.stat().st_mtime, reverse=True)
@@ -4,25 +4,18 @@ from dataclasses import dataclass, field
 from abc import ABC
 from functools import partial
 from enum import Enum
+import heapq
+from array import array
+from typing import Callable, Hashable, Iterable, Iterator
 
+from .barcodes import gtins
 from .datatypes import Item, Price, UnitPrice, Currency, Quantity, Unit, UnitType
 
 from .searchrequest import GrocerySearchRequest
+from .log import get_logger
+from . import metrics
 
-
-class SearchEnum(Enum):
-    def __new__(
-        cls, value, search_request_class: GrocerySearchRequest, item_class: Item
-    ):
-        obj = object.__new__(cls)
-        obj._value_ = value
-        return obj
-
-    def __init__(
-        self, value, search_request_class: GrocerySearchRequest, item_class: Item
-    ):
-        self.search_request_class = search_request_class
-        self.item_class = item_class
+logger = get_logger("search")
 
 
 class SorterEnum(Enum):
@@ -74,6 +67,31 @@ class Sorter:
     def _item_unit_type(item: Item):
         return item.quantity.unit.unit_type.value
 
+    def sort_key(self, item: Item):
+        """ascending key giving the same order as get_sorted_list, so that
+        already sorted lists can be merged rather than re-sorted"""
+        sorter_enum = self.sorter_type
+
+        if sorter_enum == SorterEnum.HIGHEST_PRICE:
+            return -self._item_price_amount(item)
+        elif sorter_enum == SorterEnum.LOWEST_PRICE:
+            return self._item_price_amount(item)
+        elif sorter_enum == SorterEnum.HIGHEST_UNIT_PRICE:
+            return -self._item_unit_price_amount(item)
+        elif sorter_enum == SorterEnum.LOWEST_UNIT_PRICE:
+            return self._item_unit_price_amount(item)
+        # the quantity sorts are stable sorts by unit type then quantity
+        elif sorter_enum == SorterEnum.HIGHEST_QUANTITY:
+            return (-self._item_quantity_amount_in_si(item), self._item_unit_type(item))
+        elif sorter_enum == SorterEnum.LOWEST_QUANTITY:
+            return (self._item_quantity_amount_in_si(item), self._item_unit_type(item))
+        return 0
+
+    def merge_sorted(self, sorted_list: list[Item], new_items: list[Item]):
+        """merges unsorted new_items into a list already sorted by this sorter"""
+        key = self.sort_key
+        return list(heapq.merge(sorted_list, sorted(new_items, key=key), key=key))
+
     def get_sorted_list(self, item_list: list[Item]) -> list[Item]:
         """sorter function, returns a sorted list of items per the requested filter(sorter) type"""
         sorter_enum = self.sorter_type
@@ -110,8 +128,9 @@ class Sorter:
             return new_item_list
 
         else:
-            print(
-                f"no compatible type of type:{sorter_enum} found, returning original list"
+            logger.warning(
+                "no compatible type of type:%s found, returning original list",
+                sorter_enum,
             )
             return item_list
 
@@ -177,10 +196,11 @@ class Filter:
         def __post_init__(self):
             try:
                 if self.price_low.per_unit != self.price_high.per_unit:
-                    print("Warning, not matching units")
+                    logger.warning("unit price filter units don't match")
             except:
-                print(
-                    f"Warning, prices not UnitPrices, price_low.type={type(self.price_low)}, price_low.type={type(self.price_low)}"
+                logger.warning(
+                    "unit price filter prices aren't UnitPrices",
+                    extra={"price_type": type(self.price_low).__name__},
                 )
             return super().__post_init__()
 
@@ -348,14 +368,100 @@ class SearchResult:
         # map the sorted lists to the intiial on pre-processing
         self.sorted_list = self.initial_list
         self._sorted_and_filtered_list = self.initial_list
+        # the sorter type sorted_list is currently ordered by
+        self._sorted_by: SorterEnum = None
+        self._by_id: dict[str, Item] = {
+            str(item.identifier): item for item in self.initial_list
+        }
+
+    def get_by_id(self, item_identifier: str) -> Item | None:
+        return self._by_id.get(item_identifier)
 
-    def filter_and_sort(self, item_list_filter: ItemListFilter):
+    def filter_and_sort(self, item_list_filter: ItemListFilter, store: str = "all"):
         # returns a filter and sorted list, stores them in the object too.
         # put here so we can store the sorted lists as well as the original
-        self.sorted_list = item_list_filter._sort(self.sorted_list)
-        self._sorted_and_filtered_list = item_list_filter._filter(self.sorted_list)
+        # store only labels the timings
+        sorter = item_list_filter.sorter
+        sorter_type = sorter.sorter_type if sorter else None
+
+        # only sort when the sorter has changed, extend() keeps the order after that
+        if sorter_type != self._sorted_by:
+            with metrics.stage("sort", store):
+                self.sorted_list = item_list_filter._sort(self.sorted_list)
+            self._sorted_by = sorter_type
+
+        with metrics.stage("filter", store):
+            self._sorted_and_filtered_list = item_list_filter._filter(self.sorted_list)
         return self._sorted_and_filtered_list
 
+    def extend(self, new_items: list[Item]):
+        """merges a further page of items into the result, the existing
+        items are never re-sorted"""
+        self.initial_list = self.initial_list + new_items
+        self._by_id.update((str(item.identifier), item) for item in new_items)
+
+        if self._sorted_by is None:
+            self.sorted_list = self.initial_list
+        else:
+            self.sorted_list = Sorter(self._sorted_by).merge_sorted(
+                self.sorted_list, new_items
+            )
+
+    def to_state(self) -> tuple:
+        """compact, picklable state, item records plus the sorted order as indices"""
+        index = {id(item): i for i, item in enumerate(self.initial_list)}
+        order = array("I", (index[id(item)] for item in self.sorted_list))
+        return (
+            [item.to_record() for item in self.initial_list],
+            self._sorted_by.value if self._sorted_by else None,
+            order.tobytes(),
+        )
+
+    @classmethod
+    def from_state(cls, state: tuple) -> SearchResult:
+        records, sorted_by, order = state
+        search_result = cls([Item.from_record(record) for record in records])
+
+        if sorted_by is not None:
+            items = search_result.initial_list
+            search_result.sorted_list = [items[i] for i in array("I", order)]
+            search_result._sorted_by = SorterEnum(sorted_by)
+        return search_result
+
+    def truncate(self, n_items: int):
+        """keeps the first n_items of initial_list, the sorted order is kept"""
+        self.initial_list = self.initial_list[:n_items]
+        kept = set(map(id, self.initial_list))
+        self._by_id = {str(item.identifier): item for item in self.initial_list}
+
+        if self._sorted_by is None:
+            self.sorted_list = self.initial_list
+        else:
+            self.sorted_list = [i for i in self.sorted_list if id(i) in kept]
+        self._sorted_and_filtered_list = [
+            i for i in self._sorted_and_filtered_list if id(i) in kept
+        ]
+
+
+def merge_results(
+    sorted_lists: Iterable[list[Item]],
+    sorter: Sorter,
+    keys: Callable[[Item], Iterable[Hashable]] = gtins,
+) -> Iterator[Item]:
+    """lazily merges lists each already sorted by sorter, e.g. every store's
+    results, into one sorted stream. it's a heap with one item per list, so the
+    first n items cost O(n log k) for k lists and nothing is re-sorted.
+
+    an item sharing any of keys(item) with an earlier one is the same product
+    at another store, and is skipped. keys are the barcodes by default"""
+    seen: set[Hashable] = set()
+    for item in heapq.merge(*sorted_lists, key=sorter.sort_key):
+        item_keys = set(keys(item))
+        if item_keys.isdisjoint(seen):
+            yield item
+        # kept for skipped items too, their other keys are the same product
+        seen |= item_keys
+
 
 class ItemListFilter:
     class AllFilters:
@@ -416,3 +522,64 @@ class ItemListFilter:
 
     def clear_filters(self):
         self.filters = ItemListFilter.AllFilters()
+
+    def to_state(self) -> tuple:
+        """compact, picklable state of the sorter and filters"""
+        f = self.filters
+        return (
+            self.sorter.sorter_type.value if self.sorter else None,
+            tuple(x.is_enabled for x in f._filters_as_list()),
+            (
+                f.price_filter.price_low.amount,
+                f.price_filter.price_high.amount,
+                f.price_filter.base_currency.value,
+            ),
+            (
+                f.unit_price_filter.price_low.amount,
+                f.unit_price_filter.price_high.amount,
+                f.unit_price_filter.base_currency.value,
+                f.unit_price_filter.price_low.per_unit.name,
+            ),
+            (
+                f.quantity_filter.qty_low.amount,
+                f.quantity_filter.qty_high.amount,
+                f.quantity_filter.base_unit.name,
+            ),
+            tuple(t.value for t in f.unit_type_filter.unit_type_accept_list),
+            f.description_filter.description,
+        )
+
+    @classmethod
+    def from_state(cls, state: tuple) -> ItemListFilter:
+        (
+            sorter_type,
+            enabled,
+            (price_low, price_high, price_curr),
+            (unit_price_low, unit_price_high, unit_price_curr, per_unit),
+            (qty_low, qty_high, qty_unit),
+            unit_types,
+            description,
+        ) = state
+
+        item_list_filter = cls()
+        if sorter_type is not None:
+            item_list_filter.sorter = Sorter(SorterEnum(sorter_type))
+
+        f = item_list_filter.filters
+        f.price_filter = Filter.PriceFilter(
+            Price(price_low, Currency(price_curr)),
+            Price(price_high, Currency(price_curr)),
+        )
+        f.unit_price_filter = Filter.UnitPriceFilter(
+            UnitPrice(unit_price_low, Currency(unit_price_curr), Unit[per_unit]),
+            UnitPrice(unit_price_high, Currency(unit_price_curr), Unit[per_unit]),
+        )
+        f.quantity_filter = Filter.QuantityFilter(
+            Quantity(qty_low, Unit[qty_unit]), Quantity(qty_high, Unit[qty_unit])
+        )
+        f.unit_type_filter = Filter.UnitTypeFilter([UnitType(t) for t in unit_types])
+        f.description_filter = Filter.DescriptionFilter(description)
+
+        for attribute_filter, is_enabled in zip(f._filters_as_list(), enabled):
+            attribute_filter.is_enabled = is_enabled
+        return item_list_filter
@@ -1,11 +1,15 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+import asyncio
+
+from .log import get_logger
+
+logger = get_logger("searchrequest")
 
 
 class GrocerySearchRequest(ABC):
     def __init__(self, search_term: str = "", max_items: int = 0):
-        print(f"Initializing GrocerySearchRequest...")
-        pass
+        logger.debug("initializing %s", self.__class__.__name__)
 
     @abstractmethod
     def query(self):
@@ -22,6 +26,88 @@ class GrocerySearchRequest(ABC):
         # gets the total number of items per the request
         pass
 
+    def fetch_page(self, start: int, size: int) -> tuple[list, int]:
+        """fetches a single page of raw items from the 0-based offset start.
+        returns (raw_items, total_matches)"""
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support paged fetching"
+        )
+
+    async def afetch_page(self, start: int, size: int) -> tuple[list, int]:
+        """async fetch_page, plugins without an async client fall back to a thread"""
+        return await asyncio.to_thread(self.fetch_page, start, size)
+
+    def cursor(self, page_size: int, max_items: int = None) -> SearchCursor:
+        """returns a cursor which walks the search results one page at a time"""
+        if max_items is None:
+            max_items = self.max_items
+        return SearchCursor(self, page_size=page_size, max_items=max_items)
+
+
+class SearchCursor:
+    """walks a search request page by page, so the first page can be shown
+    before the rest of the requested depth has arrived"""
+
+    def __init__(
+        self, search_request: GrocerySearchRequest, page_size: int, max_items: int
+    ):
+        self.search_request = search_request
+        self.page_size = page_size
+        self.max_items = max_items
+
+        self.offset: int = 0
+        # unknown until the first page has been fetched
+        self.total_items: int | None = None
+
+    @property
+    def has_more(self) -> bool:
+        if self.offset >= self.max_items:
+            return False
+        if self.total_items is None:
+            return True
+        return self.offset < self.total_items
+
+    @property
+    def depth(self) -> int:
+        # the most items this cursor will ever return
+        if self.total_items is None:
+            return self.max_items
+        return min(self.total_items, self.max_items)
+
+    def fetch_next(self) -> list:
+        """fetches the next page of raw items, returns [] once exhausted"""
+        if not self.has_more:
+            return []
+
+        # always ask for full pages so page based apis stay aligned, trim after
+        raw_items, total_items = self.search_request.fetch_page(
+            start=self.offset, size=self.page_size
+        )
+        return self._advance(raw_items, total_items)
+
+    async def afetch_next(self) -> list:
+        """async fetch_next"""
+        if not self.has_more:
+            return []
+
+        raw_items, total_items = await self.search_request.afetch_page(
+            start=self.offset, size=self.page_size
+        )
+        return self._advance(raw_items, total_items)
+
+    def _advance(self, raw_items: list, total_items: int) -> list:
+        # moves the cursor on past a fetched page
+        raw_items = raw_items[: self.max_items - self.offset]
+
+        self.total_items = total_items
+        self.offset += len(raw_items)
+
+        # an empty page means the store has nothing more to give
+        if len(raw_items) == 0:
+            self.total_items = self.offset
+
+        return raw_items
+
 
 import pickle
 from pathlib import Path
@@ -0,0 +1,22 @@
+from utils import allocations, metrics
+
+
+def test_retained_bytes_by_stage_and_site():
+    allocations.start()
+    try:
+        with metrics.stage("parse", "waitrose"):
+            kept = [str(i) * 10 for i in range(10000)]
+        with metrics.stage("filter", "waitrose"):
+            [str(i) * 10 for i in range(10000)]
+    finally:
+        profiler = allocations.stop()
+
+    rows = {(row["stage"], row["store"]): row for row in profiler.report()}
+
+    parse = rows["parse", "waitrose"]
+    assert parse["retained_bytes"] > 10000 * 50
+    site, size = parse["top_sites"][0]
+    assert site.startswith("utils/tests/test_allocations.py:")
+    # nothing allocated by the filter stage was kept
+    assert rows["filter", "waitrose"]["retained_bytes"] < 10000
+    assert allocations.current() is None
@@ -0,0 +1,40 @@
+from utils.barcodes import BarcodeIndex, gtins, normalize
+from utils.benchmarks.catalog import catalog
+from utils.main import *
+
+
+def _item(store, description, price, barcodes):
+    item = Item(description, Price(price, Currency.GBP), Quantity(1, Unit.KG))
+    item.store = store
+    item.barcodes = barcodes
+    return item
+
+
+def test_normalize():
+    assert normalize("5000168001142") == "05000168001142"
+    assert normalize("05000168001142") == normalize(5000168001142)
+    assert normalize("0 12345 67890 5") == "00012345678905"
+    assert normalize("1234") is None
+    assert normalize("00000000") is None
+
+
+def test_asda_barcodes_parsed():
+    item = AsdaItem(catalog("asda", 1)[0])
+    assert gtins(item) == [normalize(item.product_id)]
+    assert Item.from_record(item.to_record()).barcodes == item.barcodes
+
+
+def test_lookup_and_join():
+    oats = _item(Store.ASDA, "Oats", 1.0, ["5000168001142"])
+    oats_w = _item(Store.WAITROSE, "Porridge oats", 1.2, ["05000168001142"])
+    beans = _item(Store.ASDA, "Beans", 0.5, ["5000157024671"])
+    index = BarcodeIndex([oats, oats_w, beans])
+
+    assert index.get("5000168001142") == {Store.ASDA: oats, Store.WAITROSE: oats_w}
+    assert index.at_every_store(beans) == {Store.ASDA: beans}
+
+    comparisons = index.join([oats_w, beans, oats])
+    # oats once, beans are only at one store
+    assert [c.gtin for c in comparisons] == ["05000168001142"]
+    assert comparisons[0].cheapest is oats
+    assert len(index.join([beans], min_stores=1)) == 1
@@ -0,0 +1,173 @@
+from utils.basket import Line, StoreTerms, optimize
+from utils.main import *
+
+import enum
+import itertools
+import random
+import time
+
+# more stores than there are plugins
+Shop = enum.Enum("Shop", "A B C D")
+
+
+def _line(name, pcs=1, **prices):
+    items = {
+        Shop[store]: Item(name, Price(price, Currency.GBP), Quantity(1, Unit.KG))
+        for store, price in prices.items()
+    }
+    return Line(name, pcs, items)
+
+
+def _random_lines(r, n, stores):
+    lines = []
+    for i in range(n):
+        base = r.uniform(0.5, 6)
+        prices = {
+            s.name: round(base * r.uniform(0.8, 1.25), 2)
+            for s in stores
+            if r.random() < 0.9
+        }
+        lines.append(_line(str(i), r.randint(1, 3), **(prices or {"A": base})))
+    return lines
+
+
+def _brute_force(lines, terms):
+    best = None
+    for stores in itertools.product(*(list(line.items) for line in lines)):
+        subtotals = {}
+        for line, store in zip(lines, stores):
+            subtotals[store] = subtotals.get(store, 0) + line.cost(store).amount
+        if any(subtotals[s] < terms[s].minimum for s in subtotals):
+            continue
+        total = sum(
+            subtotal + terms[s].delivery_for(Price(subtotal, Currency.GBP)).amount
+            for s, subtotal in subtotals.items()
+        )
+        best = total if best is None else min(best, total)
+    return best
+
+
+def test_matches_brute_force():
+    r = random.Random(0)
+    for _ in range(30):
+        stores = list(Shop)[:3]
+        lines = _random_lines(r, 7, stores)
+        terms = {
+            s: StoreTerms(
+                delivery=r.choice([0.0, 1.5, 3.0]),
+                minimum=r.choice([0.0, 5.0, 10.0]),
+                free_over=r.choice([None, 8.0, 15.0]),
+            )
+            for s in stores
+        }
+        basket = optimize(lines, terms)
+        expected = _brute_force(lines, terms)
+
+        if expected is None:
+            assert basket is None
+        else:
+            assert basket.optimal
+            assert round(basket.total.amount, 2) == round(expected, 2)
+            assert sorted(l.name for ls in basket.lines.values() for l in ls) == sorted(
+                l.name for l in lines
+            )
+
+
+def test_delivery_and_minimums():
+    lines = [_line("oats", A=1.0, B=1.5), _line("beans", 2, A=0.8, B=0.7)]
+
+    # b is cheaper for beans, but not by enough to pay for a second delivery
+    terms = {Shop.A: StoreTerms(delivery=3.0), Shop.B: StoreTerms(delivery=3.0)}
+    basket = optimize(lines, terms)
+    assert list(basket.lines) == [Shop.A]
+    assert round(basket.total.amount, 2) == 5.6
+
+    # free delivery splits it
+    terms = {Shop.A: StoreTerms(delivery=3.0, free_over=1.0), Shop.B: StoreTerms()}
+    basket = optimize(lines, terms)
+    assert {s: [l.name for l in ls] for s, ls in basket.lines.items()} == {
+        Shop.A: ["oats"],
+        Shop.B: ["beans"],
+    }
+    assert round(basket.total.amount, 2) == 2.4
+
+    # nobody delivers an order this small
+    terms = {Shop.A: StoreTerms(minimum=5.0), Shop.B: StoreTerms(minimum=5.0)}
+    assert optimize(lines, terms) is None
+
+
+def test_unavailable_lines():
+    lines = [_line("oats", A=1.0), _line("saffron", C=9.0)]
+    basket = optimize(lines, {Shop.A: StoreTerms(), Shop.B: StoreTerms()})
+    assert [line.name for line in basket.unavailable] == ["saffron"]
+    assert basket.total.amount == 1.0
+
+
+def test_fifty_lines_quickly():
+    r = random.Random(1)
+    stores = list(Shop)
+    lines = _random_lines(r, 50, stores)
+    terms = {
+        s: StoreTerms(delivery=4.5, minimum=40.0, free_over=r.choice([None, 80.0]))
+        for s in stores
+    }
+
+    start = time.perf_counter()
+    basket = optimize(lines, terms)
+    assert time.perf_counter() - start < 1.0
+    assert sum(len(ls) for ls in basket.lines.values()) == 50
+
+
+def test_free_over_nothing():
+    # delivery that's free over nothing is always free
+    lines = [_line("oats", A=1.0, B=1.5)]
+    terms = {Shop.A: StoreTerms(delivery=3.0, free_over=0.0), Shop.B: StoreTerms()}
+    basket = optimize(lines, terms)
+    assert list(basket.lines) == [Shop.A]
+    assert basket.total.amount == 1.0
+
+
+def test_free_delivery_thresholds():
+    # each store's free delivery threshold is about its share of the list,
+    # so the cheapest split is only pence over them
+    r = random.Random(2)
+    for _ in range(30):
+        stores = list(Shop)[:3]
+        lines = _random_lines(r, 8, stores)
+        share = sum(min(l.cost(s).amount for s in l.items) for l in lines) / 3
+        terms = {
+            s: StoreTerms(
+                delivery=r.choice([1.5, 3.0]),
+                minimum=round(share * r.uniform(0.3, 0.6), 2),
+                free_over=round(share * r.uniform(0.8, 1.1), 2),
+            )
+            for s in stores
+        }
+        basket = optimize(lines, terms)
+        expected = _brute_force(lines, terms)
+
+        if expected is None:
+            assert basket is None
+        else:
+            assert basket.optimal
+            assert round(basket.total.amount, 2) == round(expected, 2)
+
+
+def test_fifty_lines_at_free_delivery_thresholds():
+    # too many for the brute force, but proven optimal, not given up on
+    r = random.Random(14)
+    stores = list(Shop)
+    lines = _random_lines(r, 50, stores)
+    terms = {
+        s: StoreTerms(
+            delivery=r.choice([3.0, 4.5, 5.0]),
+            minimum=r.choice([25.0, 40.0, 50.0]),
+            free_over=r.choice([60.0, 80.0, 100.0]),
+        )
+        for s in stores
+    }
+
+    start = time.perf_counter()
+    basket = optimize(lines, terms)
+    assert time.perf_counter() - start < 1.0
+    assert basket.optimal
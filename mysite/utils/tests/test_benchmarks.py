@@ -0,0 +1,31 @@
+from utils.benchmarks import suite
+from utils.benchmarks.catalog import catalog
+from utils.main import *
+from utils.search import SorterEnum
+
+import copy
+
+
+def test_catalog_parses():
+    assert catalog("asda", 50, seed=1) == catalog("asda", 50, seed=1)
+
+    items = [WaitroseItem(raw) for raw in catalog("waitrose", 500)]
+    items += [AsdaItem(raw) for raw in catalog("asda", 500)]
+    parsed = [item for item in items if not item.is_null]
+
+    assert len(parsed) > 950
+    assert {item.quantity.unit.unit_type for item in parsed} == set(UnitType)
+    assert all(item.price.amount > 0 for item in parsed)
+
+
+def test_run_and_compare():
+    results = suite.run(sizes=(100,), only="sort.")
+    assert set(results["results"]) == {f"sort.{e.value}" for e in SorterEnum}
+
+    baseline = copy.deepcopy(results)
+    slow = baseline["results"]["sort.lowest_price"]["100"]
+    slow["min_s"] /= 2
+
+    rows = suite.compare(results, baseline, threshold=0.25)
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    assert regressed == ["sort.lowest_price"]
@@ -0,0 +1,129 @@
+from utils.main import *
+from utils.search import Sorter, SorterEnum, merge_results
+from utils.searchrequest import GrocerySearchRequest
+
+import asyncio
+import random
+
+
+class FakeRequest(GrocerySearchRequest):
+    # serves pages out of a list rather than hitting a store
+    def __init__(self, raw_items: list, max_items: int = 5000):
+        self.raw_items = raw_items
+        self.max_items = max_items
+        self.pages_fetched = 0
+
+    def query(self):
+        pass
+
+    def get_items_as_list(self) -> list:
+        return self.raw_items[: self.max_items]
+
+    def get_total_items(self) -> int:
+        return len(self.raw_items)
+
+    def fetch_page(self, start: int, size: int):
+        self.pages_fetched += 1
+        return self.raw_items[start : start + size], len(self.raw_items)
+
+
+def random_items(n):
+    units = [Unit.KG, Unit.G, Unit.ML, Unit.L, Unit.NULL]
+    return [
+        Item(
+            description=str(i),
+            price=Price(float(random.randint(1, 100)), Currency.GBP),
+            quantity=Quantity(random.randint(1, 500), random.choice(units)),
+        )
+        for i in range(n)
+    ]
+
+
+def test_cursor_pages_until_exhausted():
+    request = FakeRequest(list(range(23)))
+    cursor = request.cursor(page_size=10)
+
+    pages = []
+    while cursor.has_more:
+        pages.append(cursor.fetch_next())
+
+    assert [len(page) for page in pages] == [10, 10, 3]
+    assert sum(pages, []) == list(range(23))
+    assert cursor.fetch_next() == []
+
+
+def test_cursor_stops_at_max_items():
+    request = FakeRequest(list(range(100)))
+    cursor = request.cursor(page_size=10, max_items=25)
+
+    res = []
+    while cursor.has_more:
+        res += cursor.fetch_next()
+
+    assert res == list(range(25))
+    assert request.pages_fetched == 3
+    assert cursor.depth == 25
+
+
+def test_async_cursor():
+    # plugins without afetch_page fall back to fetch_page in a thread
+    request = FakeRequest(list(range(23)))
+    cursor = request.cursor(page_size=10)
+
+    async def fetch_all():
+        res = []
+        while cursor.has_more:
+            res += await cursor.afetch_next()
+        return res
+
+    assert asyncio.run(fetch_all()) == list(range(23))
+
+
+def test_extend_matches_full_sort():
+    for sorter_enum in SorterEnum:
+        item_filter = ItemListFilter()
+        item_filter.sorter = Sorter(sorter_enum)
+
+        pages = [random_items(20) for _ in range(4)]
+
+        search_result = SearchResult(pages[0])
+        search_result.filter_and_sort(item_filter)
+        for page in pages[1:]:
+            search_result.extend(page)
+
+        expected = Sorter(sorter_enum).get_sorted_list(sum(pages, []))
+
+        assert search_result.filter_and_sort(item_filter) == expected
+        assert len(search_result.initial_list) == 80
+
+
+def test_merge_results_matches_full_sort():
+    for sorter_enum in SorterEnum:
+        sorter = Sorter(sorter_enum)
+        stores = [sorter.get_sorted_list(random_items(30)) for _ in range(3)]
+
+        merged = list(merge_results(stores, sorter, keys=lambda item: ()))
+
+        assert [sorter.sort_key(i) for i in merged] == sorted(
+            sorter.sort_key(i) for store in stores for i in store
+        )
+
+
+def test_merge_results_skips_the_same_product():
+    sorter = Sorter(SorterEnum.LOWEST_PRICE)
+    a = [
+        Item(d, Price(p, Currency.GBP), Quantity(1, Unit.KG))
+        for d, p in [("oats", 1.0), ("beans", 2.0)]
+    ]
+    b = [
+        Item(d, Price(p, Currency.GBP), Quantity(1, Unit.KG))
+        for d, p in [("oats", 1.5), ("rice", 3.0)]
+    ]
+
+    merged = merge_results([a, b], sorter, keys=lambda item: [item.description])
+
+    assert [(i.description, i.price.amount) for i in merged] == [
+        ("oats", 1.0),
+        ("beans", 2.0),
+        ("rice", 3.0),
+    ]
@@ -0,0 +1,31 @@
+from utils.log import SamplingFilter, StructuredFormatter, get_logger
+
+import json
+import logging
+
+
+def make_record(name, level=logging.DEBUG, **extra):
+    record = logging.LogRecord(name, level, __file__, 0, "n=%s", (3,), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_most_specific_subsystem_wins():
+    sampler = SamplingFilter({"plugins": 0, "plugins.asda": 1})
+
+    assert not sampler.filter(make_record("shopping.plugins.waitrose"))
+    assert sampler.filter(make_record("shopping.plugins.asda"))
+    # unlisted subsystems aren't sampled
+    assert sampler.filter(make_record("shopping.views"))
+    # and warnings always get through
+    assert sampler.filter(make_record("shopping.plugins.waitrose", logging.WARNING))
+
+
+def test_structured_formatter():
+    record = make_record(get_logger("search").name, store="waitrose")
+    entry = json.loads(StructuredFormatter().format(record))
+
+    assert entry["logger"] == "shopping.search"
+    assert entry["level"] == "DEBUG"
+    assert entry["msg"] == "n=3"
+    assert entry["store"] == "waitrose"
@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+from utils.benchmarks.catalog import catalog
+from utils.main import *
+from utils.matching import (
+    OWN_LABEL,
+    Features,
+    candidates,
+    group,
+    match,
+    parse_size,
+    signature,
+)
+
+
+def _item(store, product_id, description, quantity=Quantity(1, Unit.NULL)):
+    item = Item(description, Price(1, Currency.GBP), quantity)
+    item.store = store
+    item.product_id = product_id
+    return item
+
+
+def test_features():
+    f = Features.of(_item(Store.ASDA, "1", "ASDA Porridge Oats 1kg"))
+    assert f.brand == OWN_LABEL
+    assert f.words == {"porridge", "oats"}
+    assert f.size == (1.0, UnitType.WEIGHT)
+
+    f = Features.of(_item(Store.WAITROSE, "2", "Heinz Baked Beans 4 x 415g"))
+    assert f.brand == "heinz"
+    assert f.size == (pytest.approx(1.66), UnitType.WEIGHT)
+    assert parse_size("no size here") is None
+
+
+def _pairs(n):
+    # the same products described a little differently by the other store
+    r = random.Random(0)
+    waitrose = [WaitroseItem(raw) for raw in catalog("waitrose", n)]
+    waitrose = [item for item in waitrose if not item.is_null]
+    asda = []
+    for i, item in enumerate(waitrose):
+        words = item.description.split()
+        if r.random() < 0.5:
+            words.append(r.choice(["pack", "fresh", "british"]))
+        asda.append(_item(Store.ASDA, f"a{i}", " ".join(words), item.quantity))
+    return waitrose, asda
+
+
+def test_lsh_finds_the_same_products_without_comparing_everything():
+    waitrose, asda = _pairs(600)
+    features = [Features.of(item) for item in waitrose + asda]
+    signatures = [signature(f.words) for f in features]
+
+    pairs = candidates(features, signatures)
+    assert len(pairs) < len(waitrose) * len(asda) / 20
+
+    matched = {(a, b) for a, b, _ in match(features, signatures)}
+    truth = {(w.product_id, a.product_id) for w, a in zip(waitrose, asda)}
+    found = len(truth & matched)
+    assert found > 0.8 * len(truth)
+
+
+def test_groups_have_one_product_per_store():
+    stores = {"w1": Store.WAITROSE, "a1": Store.ASDA, "a2": Store.ASDA}
+    groups = group([("w1", "a1", 0.9), ("w1", "a2", 0.8)], stores)
+    assert groups["w1"] == groups["a1"]
+    assert "a2" not in groups
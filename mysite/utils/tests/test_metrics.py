@@ -0,0 +1,39 @@
+from utils.metrics import Counter, Histogram, REGISTRY
+
+import threading
+
+
+def test_counter_adds_up_threads():
+    counter = Counter("test_counter_total", "test")
+    REGISTRY.remove(counter)
+
+    def work():
+        for _ in range(1000):
+            counter.inc("waitrose")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counter.inc("asda", amount=5)
+
+    # the exited threads' counts are kept
+    assert counter.collect() == {("waitrose",): 8000, ("asda",): 5}
+
+
+def test_histogram_render():
+    histogram = Histogram(
+        "test_seconds", "test", labels=("stage", "store"), buckets=(0.1, 1.0)
+    )
+    REGISTRY.remove(histogram)
+
+    for value in [0.05, 0.5, 0.5, 5.0]:
+        histogram.observe(value, "fetch", "asda")
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="fetch",store="asda",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="fetch",store="asda",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="fetch",store="asda",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="fetch",store="asda"} 4' in lines
+    assert 'test_seconds_sum{stage="fetch",store="asda"} 6.05' in lines
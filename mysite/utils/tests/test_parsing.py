@@ -0,0 +1,36 @@
+from utils.benchmarks.catalog import catalog
+from utils.main import *
+from utils.parsing import ParsePool, parse_records
+
+
+def test_pool_parses_like_the_plugin():
+    raw_items = catalog("waitrose", 600)
+    expected = [WaitroseItem(raw) for raw in raw_items]
+    expected = [item for item in expected if not item.is_null]
+
+    pool = ParsePool(2)
+    try:
+        # two chunks, one per worker
+        assert len(pool._chunks(raw_items)) == 2
+        items = pool.parse(Store.WAITROSE, raw_items)
+    finally:
+        pool.shutdown()
+
+    # all but the identifier, which is random
+    def fields(item):
+        record = item.to_record()
+        return record[:1] + record[2:]
+
+    assert [fields(item) for item in items] == [fields(item) for item in expected]
+
+
+def test_parse_records_drops_null_items():
+    raw_items = [{"searchComponent": {"id": "1", "type": "banner"}}]
+    raw_items += catalog("waitrose", 3)
+    records = parse_records("waitrose", raw_items)
+    assert Store(records[0][0]) is Store.WAITROSE
+    assert all(not record[9] for record in records)
+    assert all(record[10] for record in records)
+    assert len(records) == len(raw_items) - 1 - sum(
+        "searchComponent" in raw for raw in raw_items[1:]
+    )
@@ -0,0 +1,46 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from utils import plugins
+from utils.main import Store, Unit
+
+MYSITE = Path(__file__).resolve().parent.parent.parent
+
+
+def test_importing_doesnt_load_plugins():
+    # a fresh interpreter, this one has probably imported them already
+    code = (
+        "import sys, utils.main, utils.search\n"
+        "from utils.main import Store\n"
+        "assert Store('waitrose') is Store.WAITROSE\n"
+        "loaded = [m for m in ('utils.plugins.waitrose', 'utils.plugins.asda', "
+        "'requests', 'httpx') if m in sys.modules]\n"
+        "assert not loaded, loaded\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=MYSITE, check=True)
+
+
+def test_get_loads_the_plugin_once():
+    plugin = plugins.get(Store.ASDA)
+    assert plugins.is_loaded(Store.ASDA)
+    assert plugins.get(Store.ASDA) is plugin
+    assert plugin.item_class.__name__ == "AsdaItem"
+    assert plugin.unit_map["kg"] is Unit.KG
+
+
+def test_config_file_adds_a_store(tmp_path):
+    config = tmp_path / "plugins.json"
+    config.write_text(json.dumps({"lidl": "utils.plugins.asda:PLUGIN"}))
+    code = (
+        "from utils import plugins\n"
+        "from utils.main import Store\n"
+        "assert plugins.get(Store.LIDL).item_class.__name__ == 'AsdaItem'\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=MYSITE,
+        check=True,
+        env={"SHOPPING_PLUGINS": str(config), "PATH": ""},
+    )
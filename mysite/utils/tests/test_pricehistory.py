@@ -0,0 +1,80 @@
+import random
+
+from utils.benchmarks.catalog import catalog
+from utils.main import *
+from utils.pricehistory import DAY, PriceHistory, Segment, decode_block, encode_block
+
+# midnight, 2020-09-14
+T0 = 1_600_041_600
+
+
+def test_block_round_trip_and_ranges():
+    r = random.Random(0)
+    points, price = [], 250
+    for day in range(400):
+        if r.random() < 0.8:
+            price += r.choice([0, 0, 0, -10, 15])
+            points.append((T0 // DAY + day, price))
+    block = encode_block(b"123", points)
+
+    assert decode_block(block) == points
+    for lo, hi in [(0, None), (points[10][0], points[50][0]), (points[3][0] + 1, None)]:
+        expected = [p for p in points if p[0] >= lo and (hi is None or p[0] <= hi)]
+        assert decode_block(block, lo, hi) == expected
+    assert decode_block(block, points[-1][0] + 1) == []
+
+
+def test_append_compact_and_read(tmp_path):
+    segment = Segment(tmp_path, compact_every=0)
+    segment.append([("a", T0 + 3600, 100), ("b", T0, 50)])
+    # a second one in the same day replaces the first
+    segment.append([("a", T0 + 7200, 110), ("a", T0 + DAY, 120)])
+    assert segment.history("a") == [(T0, 110), (T0 + DAY, 120)]
+
+    segment.compact()
+    assert segment.history("a") == [(T0, 110), (T0 + DAY, 120)]
+    assert segment.history("a", start=T0 + 1) == [(T0 + DAY, 120)]
+    assert segment.history("missing") == []
+
+    # after compaction the log carries on, and reopening reads both back
+    segment.append([("a", T0 + 2 * DAY, 90)])
+    reopened = Segment(tmp_path, compact_every=0)
+    assert reopened.history("a") == [(T0, 110), (T0 + DAY, 120), (T0 + 2 * DAY, 90)]
+    assert reopened.product_ids() == ["a", "b"]
+
+    # and each sees the other's compactions
+    reopened.compact()
+    segment.append([("b", T0 + DAY, 55)])
+    assert reopened.history("b") == [(T0, 50), (T0 + DAY, 55)]
+    assert segment.history("a")[-1] == (T0 + 2 * DAY, 90)
+
+
+def test_daily_prices_are_small(tmp_path):
+    segment = Segment(tmp_path)
+    r = random.Random(1)
+    prices = {str(i): r.randint(50, 1000) for i in range(200)}
+    for day in range(365):
+        for product_id in prices:
+            if r.random() < 1 / 30:
+                prices[product_id] += r.randint(-50, 50)
+        segment.append(
+            (product_id, T0 + day * DAY + r.randint(0, 3600), price)
+            for product_id, price in prices.items()
+        )
+    segment.compact()
+
+    # a year of a price changing about monthly in well under a byte a day
+    assert segment.size() / len(prices) < 120
+    assert [p for _, p in segment.history("0")][-1] == prices["0"]
+
+
+def test_record_items(tmp_path):
+    history = PriceHistory(tmp_path)
+    items = [WaitroseItem(raw) for raw in catalog("waitrose", 20)]
+    items = [item for item in items if not item.is_null]
+    history.record(items, T0)
+    item = items[0]
+    assert history.history("waitrose", item.product_id) == [
+        (T0, round(item.price.amount * 100))
+    ]
+    history.close()
@@ -0,0 +1,48 @@
+from utils import profiling
+
+import pstats
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_profiles_are_saved_and_listed(tmp_path):
+    with profiling.cprofile(tmp_path, "get"):
+        busy(0.01)
+
+    with profiling.sampled(tmp_path, "get", interval=0.0005):
+        # work in another thread is sampled too
+        worker = threading.Thread(target=busy, args=(0.1,), name="worker")
+        worker.start()
+        worker.join()
+
+    saved = {path.suffix: path for path in profiling.list_profiles(tmp_path)}
+    prof, collapsed = saved[".prof"], saved[".collapsed"]
+
+    assert any("busy" in str(func) for func in pstats.Stats(str(prof)).stats)
+
+    stacks = collapsed.read_text().splitlines()
+    assert any(
+        line.startswith("worker;") and "busy (test_profiling.py" in line
+        for line in stacks
+    )
+
+
+def test_cprofile_includes_propagated_work(tmp_path):
+    def handed_off(seconds):
+        busy(seconds)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with profiling.cprofile(tmp_path, "get"):
+            executor.submit(profiling.propagate(handed_off), 0.01).result()
+        # outside a profile it runs as it is
+        assert profiling.propagate(handed_off) is handed_off
+
+    (prof,) = profiling.list_profiles(tmp_path)
+    assert any(func[2] == "handed_off" for func in pstats.Stats(str(prof)).stats)
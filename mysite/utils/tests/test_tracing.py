@@ -0,0 +1,42 @@
+from utils import metrics, tracing
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_spans_from_threads_and_tasks(tmp_path):
+    def fetch(page):
+        with metrics.stage("fetch", "waitrose", page=page):
+            pass
+
+    async def afetch(page):
+        with tracing.span("afetch", page=page):
+            await asyncio.sleep(0.01)
+
+    async def afetch_all():
+        await asyncio.gather(afetch(1), afetch(2))
+
+    with tracing.trace("get", tmp_path):
+        with tracing.span("search"):
+            with ThreadPoolExecutor(2) as executor:
+                list(executor.map(tracing.propagate(fetch), [1, 2]))
+            asyncio.run(afetch_all())
+
+    # nothing is recorded outside of a trace
+    fetch(3)
+
+    [path] = tmp_path.iterdir()
+    events = json.load(open(path))["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+
+    assert sorted(e["name"] for e in spans) == [
+        "afetch",
+        "afetch",
+        "fetch",
+        "fetch",
+        "search",
+    ]
+    assert {e["args"]["page"] for e in spans if e["name"] == "fetch"} == {1, 2}
+    # the concurrent async fetches are on tracks of their own
+    assert len({e["tid"] for e in spans if e["name"] == "afetch"}) == 2
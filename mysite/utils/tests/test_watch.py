@@ -0,0 +1,95 @@
+import random
+
+from utils.benchmarks.catalog import catalog
+from utils.main import *
+from utils.search import Filter
+from utils.watch import IntervalTree, WatchIndex, WatchRule, _Facts
+
+
+def test_interval_tree_stabs_like_a_scan():
+    r = random.Random(0)
+    intervals = []
+    for i in range(500):
+        low = r.uniform(0, 100)
+        intervals.append((low, low + r.uniform(0, 20), i))
+    tree = IntervalTree(intervals)
+    for x in [r.uniform(-5, 125) for _ in range(200)] + [intervals[0][0]]:
+        expected = {i for low, high, i in intervals if low <= x <= high}
+        assert set(tree.stab(x)) == expected
+
+
+def _random_rule(r: random.Random, rule_id: int) -> WatchRule:
+    f = ItemListFilter().filters
+    kind = r.choice(["description", "price", "unit_price", "quantity", "unit_type"])
+    if kind == "description":
+        f.description_filter = Filter.DescriptionFilter(
+            r.choice(["milk", "Smoked bacon", "cheese", "free range eggs", "oats"])
+        )
+        f.description_filter.enable()
+    if kind == "price" or r.random() < 0.3:
+        low = r.uniform(0, 5)
+        f.price_filter = Filter.PriceFilter(
+            Price(low, Currency.GBP), Price(low + r.uniform(0, 3), Currency.GBP)
+        )
+        f.price_filter.enable()
+    if kind == "unit_price":
+        f.unit_price_filter = Filter.UnitPriceFilter(
+            UnitPrice(0, Currency.GBP, Unit.KG),
+            UnitPrice(r.uniform(0, 10), Currency.GBP, Unit.KG),
+        )
+        f.unit_price_filter.enable()
+    if kind == "quantity":
+        low = r.uniform(0, 2)
+        f.quantity_filter = Filter.QuantityFilter(
+            Quantity(low, Unit.L), Quantity(low + 1, Unit.L)
+        )
+        f.quantity_filter.enable()
+    if kind == "unit_type":
+        f.unit_type_filter.unit_type_accept_list = [UnitType.OTHER]
+        f.unit_type_filter.enable()
+    stores = r.choice([None, [Store.WAITROSE], [Store.ASDA]])
+    return WatchRule(rule_id, f, stores)
+
+
+def test_index_matches_like_testing_every_rule():
+    r = random.Random(1)
+    rules = [_random_rule(r, i) for i in range(400)]
+    items = [WaitroseItem(raw) for raw in catalog("waitrose", 300)]
+    items += [AsdaItem(raw) for raw in catalog("asda", 300)]
+    items = [item for item in items if not item.is_null]
+
+    index = WatchIndex(rules)
+    matched = {(rule.rule_id, id(item)) for rule, item in index.match(items)}
+    facts = [_Facts.of(item) for item in items]
+    expected = {
+        (rule.rule_id, id(f.item)) for f in facts for rule in rules if rule.matches(f)
+    }
+    assert matched == expected
+    assert matched
+
+    # and most rules aren't even looked at for an item
+    candidates = sum(len(index._candidates(f)) for f in facts)
+    assert candidates < len(items) * len(rules) / 3
+
+
+def test_rule_bounds():
+    f = ItemListFilter().filters
+    # under 1.50/kg, given per g
+    f.unit_price_filter = Filter.UnitPriceFilter(
+        UnitPrice(0, Currency.GBP, Unit.G), UnitPrice(0.0015, Currency.GBP, Unit.G)
+    )
+    f.unit_price_filter.enable()
+    f.description_filter = Filter.DescriptionFilter("Oats")
+    f.description_filter.enable()
+    index = WatchIndex([WatchRule("oats", f)])
+
+    def item(description, price, quantity):
+        i = Item(description, Price(price, Currency.GBP), quantity)
+        i.store = Store.ASDA
+        return i
+
+    cheap = item("Porridge oats", 1.2, Quantity(1, Unit.KG))
+    dear = item("Porridge oats", 1.2, Quantity(500, Unit.G))
+    goats = item("Goats cheese", 1.0, Quantity(1, Unit.KG))
+    litres = item("Oat drink with oats", 1.0, Quantity(1, Unit.L))
+    assert [i for _, i in index.match([cheap, dear, goats, litres])] == [cheap]
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+# the trace being recorded by the current request, if any
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+
+def _track() -> tuple[int, str]:
+    # concurrent tasks on one event loop each get a track of their own, like threads
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return id(task), task.get_name()
+    thread = threading.current_thread()
+    return thread.ident, thread.name
+
+
+class Trace:
+    """spans recorded during one request, as chrome trace events.
+
+    spans are complete ("X") events, chrome works out the nesting from their
+    times, so a span only costs an append when it ends."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.events: list[dict] = []
+        self._tracks: dict[int, str] = {}
+
+    def add(self, name: str, start: float, end: float, **args):
+        """adds a span, start and end are time.perf_counter() values"""
+        tid, track = _track()
+        self._tracks.setdefault(tid, track)
+        # list.append is atomic, spans come in from several threads
+        self.events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.start) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            }
+        )
+
+    def to_chrome(self) -> dict:
+        """the trace in the chrome trace event format, open it in chrome://tracing
+        or ui.perfetto.dev"""
+        names = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": track},
+            }
+            for tid, track in list(self._tracks.items())
+        ]
+        return {
+            "traceEvents": names + list(self.events),
+            "displayTimeUnit": "ms",
+            "otherData": {"name": self.name},
+        }
+
+    def write(self, directory: str | Path) -> Path:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{uuid.uuid4().hex[:8]}.json"
+        )
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+        return path
+
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+
+@contextmanager
+def trace(name: str, directory: str | Path):
+    """records every span in the block, and any work it hands to threads through
+    propagate(), then writes the trace into directory. spans which end after the
+    block has exited, e.g. a background prefetch, are left out"""
+    t = Trace(name)
+    # set back rather than reset, a streamed response can end the block in
+    # another context than it began in
+    previous = _trace.get()
+    _trace.set(t)
+    try:
+        yield t
+    finally:
+        _trace.set(previous)
+        t.write(directory)
+
+
+@contextmanager
+def span(name: str, **args):
+    """records the block as a span when a trace is being recorded"""
+    t = _trace.get()
+    if t is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        t.add(name, start, time.perf_counter(), **args)
+
+
+def propagate(fn: Callable) -> Callable:
+    """fn bound to the current context, for handing to an executor so the spans
+    it records land in the current trace. fn itself when nothing is traced"""
+    if _trace.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+
+    return run
@@ -0,0 +1,265 @@
+"""price watches, e.g. "oats under £1.50/kg at any store".
+
+a WatchRule is the enabled filters of an ItemListFilter, the same vocabulary
+as the search page. a WatchIndex holds the rules so that a changed item is
+only tested against the rules that could match it: rules with a description
+are in postings by one of its words, the rest are in interval trees on their
+quantity, unit price or price range, and only rules with none of those are
+tested against everything. so matching a batch of changes costs about the
+number of changes, not the number of rules times the number of products.
+
+the tests are the catalog's, see catalog.products, except that descriptions
+match on whole words rather than substrings ("oats" isn't in "goats cheese")
+and a unit price rule only matches items priced in its per_unit's unit type"""
+
+from __future__ import annotations
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Generic, Hashable, Iterable, TypeVar
+
+from .datatypes import Currency, Item, Price, Quantity, UnitType
+from .search import ItemListFilter, Sorter
+from .store import Store
+
+_WORDS = re.compile(r"\w+")
+
+T = TypeVar("T")
+
+
+def tokens(text: str) -> list[str]:
+    return _WORDS.findall(text.lower())
+
+
+class IntervalTree(Generic[T]):
+    """a centred interval tree of closed [low, high] intervals, built once.
+    stab(x) finds the values of those containing x in O(log n + matches)"""
+
+    def __init__(self, intervals: Iterable[tuple[float, float, T]]):
+        self._root = self._build(sorted(intervals, key=lambda i: i[0]))
+
+    def _build(self, intervals: list[tuple[float, float, T]]):
+        # (centre, by low ascending, by high descending, left, right)
+        if not intervals:
+            return None
+        centre = intervals[len(intervals) // 2][0]
+        left, here, right = [], [], []
+        for interval in intervals:
+            if interval[1] < centre:
+                left.append(interval)
+            elif interval[0] > centre:
+                right.append(interval)
+            else:
+                here.append(interval)
+        return (
+            centre,
+            here,
+            sorted(here, key=lambda i: -i[1]),
+            self._build(left),
+            self._build(right),
+        )
+
+    def stab(self, x: float) -> list[T]:
+        found = []
+        node = self._root
+        while node is not None:
+            centre, by_low, by_high, left, right = node
+            if x < centre:
+                # everything here ends at or after the centre, so only the lows matter
+                for low, _, value in by_low:
+                    if low > x:
+                        break
+                    found.append(value)
+                node = left
+            else:
+                for _, high, value in by_high:
+                    if high < x:
+                        break
+                    found.append(value)
+                node = right
+        return found
+
+    def __bool__(self):
+        return self._root is not None
+
+
+def _gbp(price: Price) -> float:
+    return price.amount * Currency.exchange_rate(price.curr, Currency.GBP)
+
+
+@dataclass(eq=False)
+class WatchRule:
+    """fires for items passing every enabled filter in filters, at any of
+    stores, or any store at all without them"""
+
+    rule_id: Hashable
+    filters: ItemListFilter.AllFilters
+    stores: frozenset[Store] = None
+
+    # the filters as plain bounds, None for a disabled one
+    price: tuple[float, float] = field(init=False, default=None)
+    unit_price: tuple[float, float, UnitType] = field(init=False, default=None)
+    quantity: tuple[float, float, UnitType] = field(init=False, default=None)
+    unit_types: frozenset[UnitType] = field(init=False, default=None)
+    words: frozenset[str] = field(init=False, default=None)
+
+    def __post_init__(self):
+        f = self.filters
+        if f.price_filter.is_enabled:
+            self.price = (
+                _gbp(f.price_filter.price_low),
+                _gbp(f.price_filter.price_high),
+            )
+        if f.unit_price_filter.is_enabled:
+            low, high = f.unit_price_filter.price_low, f.unit_price_filter.price_high
+            # per kg, l or whatever the si unit is, like Item.unit_price
+            per_si = Quantity(1, low.per_unit).to_si().amount
+            self.unit_price = (
+                _gbp(low) / per_si,
+                _gbp(high) / per_si,
+                low.per_unit.unit_type,
+            )
+        if f.quantity_filter.is_enabled:
+            q = f.quantity_filter
+            self.quantity = (
+                q.qty_low.to_si().amount,
+                q.qty_high.to_si().amount,
+                q.base_unit.unit_type,
+            )
+        if f.unit_type_filter.is_enabled:
+            self.unit_types = frozenset(f.unit_type_filter.unit_type_accept_list)
+        if f.description_filter.is_enabled:
+            self.words = frozenset(tokens(f.description_filter.description)) or None
+        if self.stores is not None:
+            self.stores = frozenset(self.stores)
+
+    @classmethod
+    def from_item_list_filter(
+        cls, rule_id: Hashable, item_list_filter: ItemListFilter, stores=None
+    ) -> WatchRule:
+        return cls(rule_id, item_list_filter.filters, stores)
+
+    def matches(self, item: _Facts) -> bool:
+        if self.stores is not None and item.store not in self.stores:
+            return False
+        if self.price and not self.price[0] < item.price < self.price[1]:
+            return False
+        if self.unit_price:
+            low, high, unit_type = self.unit_price
+            if item.unit_type != unit_type or not low < item.unit_price < high:
+                return False
+        if self.quantity:
+            low, high, unit_type = self.quantity
+            if item.unit_type != unit_type or not low <= item.si_quantity <= high:
+                return False
+        if self.unit_types is not None and item.unit_type not in self.unit_types:
+            return False
+        if self.words and not self.words <= item.words:
+            return False
+        return True
+
+
+@dataclass
+class _Facts:
+    # what the rules test about an item, worked out once per item
+    item: Item
+    store: Store
+    price: float
+    unit_price: float
+    si_quantity: float
+    unit_type: UnitType
+    words: frozenset[str]
+
+    @classmethod
+    def of(cls, item: Item) -> _Facts:
+        quantity = item.quantity
+        rate = Currency.exchange_rate(item.price.curr, Currency.GBP)
+        return cls(
+            item=item,
+            store=item.store,
+            price=item.price.amount * rate,
+            unit_price=Sorter._item_unit_price_amount(item) * rate,
+            si_quantity=quantity.to_si().amount,
+            unit_type=quantity.unit.unit_type,
+            words=frozenset(tokens(item.description)),
+        )
+
+
+class WatchIndex:
+    """the rules, indexed for matching. changing the rules marks the index
+    stale and it's rebuilt on the next match"""
+
+    def __init__(self, rules: Iterable[WatchRule] = ()):
+        self._rules: dict[Hashable, WatchRule] = {r.rule_id: r for r in rules}
+        self._lock = threading.Lock()
+        self._stale = True
+
+    def __len__(self):
+        return len(self._rules)
+
+    def add(self, rule: WatchRule):
+        with self._lock:
+            self._rules[rule.rule_id] = rule
+            self._stale = True
+
+    def remove(self, rule_id: Hashable):
+        with self._lock:
+            self._rules.pop(rule_id, None)
+            self._stale = True
+
+    def _build(self):
+        postings: dict[str, list[WatchRule]] = {}
+        # (dimension, unit type) -> intervals
+        intervals: dict[tuple[str, UnitType], list] = {}
+        scan = []
+        for rule in self._rules.values():
+            if rule.words:
+                # the longest word is likely the rarest
+                word = max(rule.words, key=lambda w: (len(w), w))
+                postings.setdefault(word, []).append(rule)
+            elif rule.quantity:
+                low, high, unit_type = rule.quantity
+                intervals.setdefault(("quantity", unit_type), []).append(
+                    (low, high, rule)
+                )
+            elif rule.unit_price:
+                low, high, unit_type = rule.unit_price
+                intervals.setdefault(("unit_price", unit_type), []).append(
+                    (low, high, rule)
+                )
+            elif rule.price:
+                intervals.setdefault(("price", None), []).append((*rule.price, rule))
+            else:
+                scan.append(rule)
+        self._postings = postings
+        self._trees = {key: IntervalTree(i) for key, i in intervals.items()}
+        self._scan = scan
+        self._stale = False
+
+    def _candidates(self, facts: _Facts) -> list[WatchRule]:
+        candidates = list(self._scan)
+        for word in facts.words:
+            candidates += self._postings.get(word, ())
+        for key, value in (
+            (("quantity", facts.unit_type), facts.si_quantity),
+            (("unit_price", facts.unit_type), facts.unit_price),
+            (("price", None), facts.price),
+        ):
+            tree = self._trees.get(key)
+            if tree:
+                candidates += tree.stab(value)
+        return candidates
+
+    def match(self, items: Iterable[Item]) -> list[tuple[WatchRule, Item]]:
+        """(rule, item) for each rule each of items passes"""
+        with self._lock:
+            if self._stale:
+                self._build()
+            matched = []
+            for item in items:
+                facts = _Facts.of(item)
+                for rule in self._candidates(facts):
+                    if rule.matches(facts):
+                        matched.append((rule, item))
+            return matched